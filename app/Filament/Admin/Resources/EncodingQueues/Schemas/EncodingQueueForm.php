@@ -21,6 +21,7 @@ public static function configure(Schema $schema): Schema
                 TextInput::make('input_file_path')
                     ->required(),
                 TextInput::make('output_file_path'),
+                TextInput::make('manifest_path'),
                 TextInput::make('thumbnail_paths'),
                 TextInput::make('encoding_options'),
                 Textarea::make('error_message')
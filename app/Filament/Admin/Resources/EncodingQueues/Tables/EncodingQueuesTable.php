@@ -22,6 +22,9 @@ public static function configure(Table $table): Table
                     ->searchable(),
                 TextColumn::make('output_file_path')
                     ->searchable(),
+                TextColumn::make('manifest_path')
+                    ->searchable()
+                    ->toggleable(isToggledHiddenByDefault: true),
                 TextColumn::make('retry_count')
                     ->numeric()
                     ->sortable(),
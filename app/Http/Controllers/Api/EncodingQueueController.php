@@ -7,9 +7,23 @@
 use App\Services\VideoEncodingService;
 use Illuminate\Http\JsonResponse;
 use Illuminate\Http\Request;
+use Illuminate\Support\Facades\Cache;
 
 class EncodingQueueController extends Controller
 {
+    // Long-poll claims: hard cap on how long a request may block (kept well below
+    // PHP-FPM's request_terminate_timeout and any proxy read timeout), and how
+    // often it re-checks the queue
+    private const MAX_CLAIM_WAIT_SECONDS = 15;
+    private const CLAIM_RECHECK_MS = 1000;
+
+    // Idle workers poll constantly; sweep for expired leases at most this often
+    private const STUCK_SWEEP_SECONDS = 60;
+
+    // Live encode progress lives in the cache only; a silent worker's entry simply expires
+    private const PROGRESS_TTL_SECONDS = 600;
+    private const ACTIVE_JOBS_LIMIT = 50;
+
     public function __construct(
         private VideoEncodingService $videoEncodingService
     ) {}
@@ -29,13 +43,69 @@ public function getNextPending(): JsonResponse
         }
 
         // Also check for stuck processing jobs and reset them
-        $this->resetStuckJobs();
+        $this->sweepStuckJobs();
 
         if (!$queue) {
             return response()->json(['message' => 'No pending jobs'], 404);
         }
 
-        return response()->json([
+        return response()->json($this->jobPayload($queue));
+    }
+
+    /**
+     * POST claim?limit=N[&wait=S] — atomically hand up to N jobs to the calling
+     * worker, each already marked processing with its own lease.
+     *
+     * Long-poll is opt-in (services.encoding_queue.long_poll): when enabled, an
+     * empty queue holds the request open until a job shows up or S seconds
+     * pass (capped by services.encoding_queue.max_wait), and the response
+     * echoes the wait honoured so workers know they may skip their own sleep.
+     * Every waiting worker pins one PHP-FPM child for that long, so size the
+     * pool (pm.max_children) for the worker count on top of normal traffic.
+     */
+    public function claim(Request $request): JsonResponse
+    {
+        $request->validate([
+            'limit' => 'nullable|integer|min:1|max:' . EncodingQueue::MAX_CLAIM_BATCH,
+            'lease_seconds' => 'nullable|integer|min:' . EncodingQueue::MIN_LEASE_SECONDS . '|max:' . EncodingQueue::MAX_LEASE_SECONDS,
+            'wait' => 'nullable|integer|min:0',
+        ]);
+
+        // Expired leases go back to the queue before we pick
+        $this->sweepStuckJobs();
+
+        $limit = (int) ($request->limit ?? 1);
+        $leaseSeconds = (int) ($request->lease_seconds ?? EncodingQueue::DEFAULT_LEASE_SECONDS);
+        $longPoll = (bool) config('services.encoding_queue.long_poll', false);
+        $maxWait = min((int) config('services.encoding_queue.max_wait', 10), self::MAX_CLAIM_WAIT_SECONDS);
+        $wait = $longPoll ? max(0, min((int) ($request->wait ?? 0), $maxWait)) : 0;
+        $deadline = microtime(true) + $wait;
+
+        $jobs = EncodingQueue::claimBatch($limit, $leaseSeconds);
+        while ($jobs->isEmpty() && microtime(true) < $deadline) {
+            usleep(self::CLAIM_RECHECK_MS * 1000);
+            $jobs = EncodingQueue::claimBatch($limit, $leaseSeconds);
+        }
+
+        $response = [
+            'jobs' => $jobs->map(fn (EncodingQueue $queue) => $this->jobPayload($queue) + [
+                'lease_token' => $queue->lease_token,
+                'lease_expires_at' => $queue->lease_expires_at,
+                'lease_seconds' => $leaseSeconds,
+            ])->values(),
+        ];
+
+        // Workers key off the presence of 'wait': only advertise long-poll when we do it
+        if ($longPoll) {
+            $response['wait'] = $wait;
+        }
+
+        return response()->json($response);
+    }
+
+    private function jobPayload(EncodingQueue $queue): array
+    {
+        return [
             'video_code' => $queue->video_code,
             'input_file_url' => $this->videoEncodingService->getFileUrl($queue->input_file_path),
             'uploaded_thumbnail_url' => $queue->encoding_options['uploaded_thumbnail'] ?? null ?
@@ -43,28 +113,108 @@ public function getNextPending(): JsonResponse
             'encoding_options' => $queue->encoding_options,
             'retry_count' => $queue->retry_count,
             'max_retries' => $queue->max_retries,
+        ];
+    }
+
+    public function markAsProcessing(Request $request, string $videoCode): JsonResponse
+    {
+        $request->validate([
+            'lease_seconds' => 'nullable|integer|min:' . EncodingQueue::MIN_LEASE_SECONDS . '|max:' . EncodingQueue::MAX_LEASE_SECONDS,
+        ]);
+
+        $queue = EncodingQueue::where('video_code', $videoCode)->first();
+
+        if (!$queue) {
+            return response()->json(['error' => 'Job not found'], 404);
+        }
+
+        // Workers that don't ask for a lease keep the old started_at-based behaviour
+        if (!$request->filled('lease_seconds')) {
+            $queue->markAsProcessing();
+
+            return response()->json(['message' => 'Job marked as processing']);
+        }
+
+        $token = $queue->claim((int) $request->lease_seconds);
+
+        if (!$token) {
+            return response()->json(['error' => 'Job is leased by another worker'], 409);
+        }
+
+        return response()->json([
+            'message' => 'Job marked as processing',
+            'lease_token' => $token,
+            'lease_expires_at' => $queue->lease_expires_at,
+            'lease_seconds' => (int) $request->lease_seconds,
         ]);
     }
 
-    public function markAsProcessing(string $videoCode): JsonResponse
+    public function heartbeat(Request $request, string $videoCode): JsonResponse
     {
+        $request->validate([
+            'lease_token' => 'required|string',
+            'lease_seconds' => 'nullable|integer|min:' . EncodingQueue::MIN_LEASE_SECONDS . '|max:' . EncodingQueue::MAX_LEASE_SECONDS,
+        ]);
+
+        $queue = EncodingQueue::where('video_code', $videoCode)->first();
+
+        if (!$queue) {
+            return response()->json(['error' => 'Job not found'], 404);
+        }
+
+        $leaseSeconds = (int) ($request->lease_seconds ?? EncodingQueue::DEFAULT_LEASE_SECONDS);
+
+        if (!$queue->renewLease($request->lease_token, $leaseSeconds)) {
+            return response()->json(['error' => 'Lease lost'], 409);
+        }
+
+        return response()->json([
+            'message' => 'Lease renewed',
+            'lease_expires_at' => $queue->lease_expires_at,
+            'lease_seconds' => $leaseSeconds,
+        ]);
+    }
+
+    /**
+     * POST {videoCode}/progress — latest ffmpeg progress snapshot from the worker
+     * (percent, fps, speed, eta_seconds, ...), shown by getStatus and getStats.
+     */
+    public function progress(Request $request, string $videoCode): JsonResponse
+    {
+        $request->validate([
+            'progress' => 'required|array',
+            'lease_token' => 'nullable|string',
+        ]);
+
         $queue = EncodingQueue::where('video_code', $videoCode)->first();
 
         if (!$queue) {
             return response()->json(['error' => 'Job not found'], 404);
         }
 
-        $queue->markAsProcessing();
+        if ($queue->status !== EncodingQueue::STATUS_PROCESSING || !$queue->holdsLease($request->lease_token)) {
+            return response()->json(['error' => 'Lease lost'], 409);
+        }
+
+        Cache::put($this->progressKey($videoCode), $request->progress, self::PROGRESS_TTL_SECONDS);
 
-        return response()->json(['message' => 'Job marked as processing']);
+        return response()->json(['message' => 'Progress recorded']);
+    }
+
+    private function progressKey(string $videoCode): string
+    {
+        return "encoding-queue:progress:{$videoCode}";
     }
 
     public function markAsCompleted(Request $request, string $videoCode): JsonResponse
     {
         $request->validate([
             'output_file_path' => 'required|string',
+            'manifest_path' => 'nullable|string',
             'thumbnail_paths' => 'nullable|array',
             'thumbnail_paths.*' => 'string',
+            'encoding_result' => 'nullable|array',
+            'lease_token' => 'nullable|string',
         ]);
 
         $queue = EncodingQueue::where('video_code', $videoCode)->first();
@@ -73,9 +223,15 @@ public function markAsCompleted(Request $request, string $videoCode): JsonRespon
             return response()->json(['error' => 'Job not found'], 404);
         }
 
+        if (!$queue->holdsLease($request->lease_token)) {
+            return response()->json(['error' => 'Lease lost'], 409);
+        }
+
         $queue->markAsCompleted(
             $request->output_file_path,
-            $request->thumbnail_paths ?? []
+            $request->thumbnail_paths ?? [],
+            $request->encoding_result,
+            $request->manifest_path
         );
 
         return response()->json(['message' => 'Job marked as completed']);
@@ -85,6 +241,7 @@ public function markAsFailed(Request $request, string $videoCode): JsonResponse
     {
         $request->validate([
             'error_message' => 'required|string',
+            'lease_token' => 'nullable|string',
         ]);
 
         $queue = EncodingQueue::where('video_code', $videoCode)->first();
@@ -93,6 +250,10 @@ public function markAsFailed(Request $request, string $videoCode): JsonResponse
             return response()->json(['error' => 'Job not found'], 404);
         }
 
+        if (!$queue->holdsLease($request->lease_token)) {
+            return response()->json(['error' => 'Lease lost'], 409);
+        }
+
         $queue->markAsFailed($request->error_message);
 
         return response()->json(['message' => 'Job marked as failed']);
@@ -111,17 +272,75 @@ public function getStatus(string $videoCode): JsonResponse
             'status' => $queue->status,
             'input_file_path' => $queue->input_file_path,
             'output_file_path' => $queue->output_file_path,
+            'manifest_path' => $queue->manifest_path,
             'thumbnail_paths' => $queue->thumbnail_paths,
             'encoding_options' => $queue->encoding_options,
+            'encoding_result' => $queue->encoding_result,
             'error_message' => $queue->error_message,
             'retry_count' => $queue->retry_count,
             'max_retries' => $queue->max_retries,
             'last_retry_at' => $queue->last_retry_at,
+            'lease_expires_at' => $queue->lease_expires_at,
+            'progress' => $queue->status === EncodingQueue::STATUS_PROCESSING
+                ? Cache::get($this->progressKey($videoCode))
+                : null,
             'started_at' => $queue->started_at,
             'completed_at' => $queue->completed_at,
         ]);
     }
 
+    public function getStats(): JsonResponse
+    {
+        $completed = EncodingQueue::where('status', EncodingQueue::STATUS_COMPLETED);
+
+        $avgSeconds = (clone $completed)
+            ->whereNotNull('started_at')
+            ->whereNotNull('completed_at')
+            ->orderByDesc('completed_at')
+            ->limit(500)
+            ->get(['started_at', 'completed_at'])
+            ->avg(fn ($job) => $job->completed_at->diffInSeconds($job->started_at, true));
+
+        $lastCompleted = (clone $completed)->orderByDesc('completed_at')->first();
+
+        // How often the encoder could remux instead of re-encoding
+        $encodePaths = [];
+        foreach (['encode', 'copy_video', 'copy'] as $path) {
+            $encodePaths[$path] = (clone $completed)->where('encoding_result->encode_path', $path)->count();
+        }
+
+        $activeJobs = EncodingQueue::processing()
+            ->orderBy('started_at')
+            ->limit(self::ACTIVE_JOBS_LIMIT)
+            ->get(['video_code', 'started_at'])
+            ->map(fn ($job) => [
+                'video_code' => $job->video_code,
+                'started_at' => $job->started_at,
+                'progress' => Cache::get($this->progressKey($job->video_code)),
+            ]);
+
+        return response()->json([
+            'pending' => EncodingQueue::pending()->count(),
+            'processing' => EncodingQueue::processing()->count(),
+            'completed' => (clone $completed)->count(),
+            'failed' => EncodingQueue::where('status', EncodingQueue::STATUS_FAILED)->count(),
+            'retryable' => EncodingQueue::retryable()->count(),
+            'total' => EncodingQueue::count(),
+            'stuck_jobs' => EncodingQueue::stuck(30)->count(),
+            'avg_processing_time_seconds' => $avgSeconds ? (int) round($avgSeconds) : 0,
+            'avg_processing_time_formatted' => $avgSeconds ? gmdate('H:i:s', (int) round($avgSeconds)) : null,
+            'encode_paths' => $encodePaths,
+            'active_jobs' => $activeJobs,
+            'last_completed' => $lastCompleted ? [
+                'video_code' => $lastCompleted->video_code,
+                'completed_at' => $lastCompleted->completed_at,
+                'processing_time_seconds' => $lastCompleted->started_at
+                    ? $lastCompleted->completed_at->diffInSeconds($lastCompleted->started_at, true)
+                    : null,
+            ] : null,
+        ]);
+    }
+
     public function retryJob(string $videoCode): JsonResponse
     {
         $queue = EncodingQueue::where('video_code', $videoCode)->first();
@@ -139,6 +358,13 @@ public function retryJob(string $videoCode): JsonResponse
         return response()->json(['message' => 'Job queued for retry']);
     }
 
+    private function sweepStuckJobs(): void
+    {
+        if (Cache::add('encoding-queue:stuck-sweep', true, self::STUCK_SWEEP_SECONDS)) {
+            $this->resetStuckJobs();
+        }
+    }
+
     public function resetStuckJobs(): JsonResponse
     {
         $stuckJobs = EncodingQueue::stuck(30)->get();
@@ -2,8 +2,11 @@
 
 namespace App\Models;
 
+use Illuminate\Database\Eloquent\Collection;
 use Illuminate\Database\Eloquent\Factories\HasFactory;
 use Illuminate\Database\Eloquent\Model;
+use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Str;
 use Carbon\Carbon;
 
 class EncodingQueue extends Model
@@ -15,10 +18,14 @@ class EncodingQueue extends Model
     protected $fillable = [
         'video_code',
         'status',
+        'lease_token',
+        'lease_expires_at',
         'input_file_path',
         'output_file_path',
+        'manifest_path',
         'thumbnail_paths',
         'encoding_options',
+        'encoding_result',
         'error_message',
         'retry_count',
         'max_retries',
@@ -29,9 +36,11 @@ class EncodingQueue extends Model
 
     protected $casts = [
         'encoding_options' => 'array',
+        'encoding_result' => 'array',
         'thumbnail_paths' => 'array',
         'started_at' => 'datetime',
         'completed_at' => 'datetime',
+        'lease_expires_at' => 'datetime',
         'last_retry_at' => 'datetime',
     ];
 
@@ -41,6 +50,14 @@ class EncodingQueue extends Model
     const STATUS_COMPLETED = 'completed';
     const STATUS_FAILED = 'failed';
 
+    // Lease bounds (seconds) a worker may ask for
+    const DEFAULT_LEASE_SECONDS = 300;
+    const MIN_LEASE_SECONDS = 30;
+    const MAX_LEASE_SECONDS = 3600;
+
+    // Most jobs a single claim request may take
+    const MAX_CLAIM_BATCH = 10;
+
     public function markAsProcessing(): void
     {
         $this->update([
@@ -49,13 +66,122 @@ public function markAsProcessing(): void
         ]);
     }
 
-    public function markAsCompleted(string $outputPath, array $thumbnailPaths = []): void
+    /**
+     * Atomically claim the job for one worker and return its lease token,
+     * or null when another worker holds a live lease.
+     */
+    public function claim(int $leaseSeconds): ?string
+    {
+        $token = Str::random(40);
+        $now = Carbon::now();
+
+        $claimed = static::whereKey($this->getKey())
+            ->where(function ($query) use ($now) {
+                $query->where('status', '!=', self::STATUS_PROCESSING)
+                    ->orWhereNull('lease_expires_at')
+                    ->orWhere('lease_expires_at', '<', $now);
+            })
+            ->update([
+                'status' => self::STATUS_PROCESSING,
+                'started_at' => $now,
+                'lease_token' => $token,
+                'lease_expires_at' => $now->copy()->addSeconds($leaseSeconds),
+                'updated_at' => $now,
+            ]);
+
+        if (!$claimed) {
+            return null;
+        }
+
+        $this->refresh();
+
+        return $token;
+    }
+
+    /**
+     * Atomically claim up to $limit jobs for one worker: retryable failures
+     * first, then the oldest pending. Rows locked by a concurrent claim are
+     * skipped (FOR UPDATE SKIP LOCKED; SQLite serialises writers instead).
+     */
+    public static function claimBatch(int $limit, int $leaseSeconds): Collection
+    {
+        return DB::transaction(function () use ($limit, $leaseSeconds) {
+            $jobs = static::retryable()
+                ->orderBy('last_retry_at', 'asc')
+                ->limit($limit)
+                ->lock('for update skip locked')
+                ->get();
+
+            if ($jobs->count() < $limit) {
+                $jobs = $jobs->concat(
+                    static::pending()
+                        ->orderBy('created_at')
+                        ->limit($limit - $jobs->count())
+                        ->lock('for update skip locked')
+                        ->get()
+                );
+            }
+
+            $now = Carbon::now();
+
+            foreach ($jobs as $job) {
+                $job->update([
+                    'status' => self::STATUS_PROCESSING,
+                    'started_at' => $now,
+                    'lease_token' => Str::random(40),
+                    'lease_expires_at' => $now->copy()->addSeconds($leaseSeconds),
+                ]);
+            }
+
+            return $jobs;
+        });
+    }
+
+    /**
+     * Extend the lease held by $token. False when the lease was lost
+     * (job reset, finished, or claimed by another worker).
+     */
+    public function renewLease(string $token, int $leaseSeconds): bool
+    {
+        $now = Carbon::now();
+
+        $renewed = static::whereKey($this->getKey())
+            ->where('status', self::STATUS_PROCESSING)
+            ->where('lease_token', $token)
+            ->update([
+                'lease_expires_at' => $now->copy()->addSeconds($leaseSeconds),
+                'updated_at' => $now,
+            ]);
+
+        if ($renewed) {
+            $this->refresh();
+        }
+
+        return (bool) $renewed;
+    }
+
+    public function holdsLease(?string $token): bool
+    {
+        // Jobs claimed without a lease (older workers) accept any caller
+        if ($this->lease_token === null) {
+            return true;
+        }
+
+        return $token !== null && hash_equals($this->lease_token, $token);
+    }
+
+    public function markAsCompleted(string $outputPath, array $thumbnailPaths = [], ?array $encodingResult = null,
+                                    ?string $manifestPath = null): void
     {
         $this->update([
             'status' => self::STATUS_COMPLETED,
             'output_file_path' => $outputPath,
+            'manifest_path' => $manifestPath,
             'thumbnail_paths' => $thumbnailPaths,
+            'encoding_result' => $encodingResult,
             'completed_at' => Carbon::now(),
+            'lease_token' => null,
+            'lease_expires_at' => null,
         ]);
     }
 
@@ -65,6 +191,8 @@ public function markAsFailed(string $errorMessage): void
             'status' => self::STATUS_FAILED,
             'error_message' => $errorMessage,
             'completed_at' => Carbon::now(),
+            'lease_token' => null,
+            'lease_expires_at' => null,
         ]);
     }
 
@@ -75,6 +203,8 @@ public function incrementRetry(string $errorMessage = null): void
             'status' => self::STATUS_PENDING,
             'error_message' => $errorMessage,
             'last_retry_at' => Carbon::now(),
+            'lease_token' => null,
+            'lease_expires_at' => null,
         ]);
     }
 
@@ -104,9 +234,21 @@ public function scopeRetryable($query)
             ->whereColumn('retry_count', '<', 'max_retries');
     }
 
+    /**
+     * Processing jobs whose lease has expired; jobs claimed without a lease
+     * fall back to the started_at age check.
+     */
     public function scopeStuck($query, $minutes = 30)
     {
+        $now = Carbon::now();
+
         return $query->where('status', self::STATUS_PROCESSING)
-            ->where('started_at', '<', Carbon::now()->subMinutes($minutes));
+            ->where(function ($query) use ($now, $minutes) {
+                $query->where('lease_expires_at', '<', $now)
+                    ->orWhere(function ($query) use ($now, $minutes) {
+                        $query->whereNull('lease_expires_at')
+                            ->where('started_at', '<', $now->copy()->subMinutes($minutes));
+                    });
+            });
     }
 }
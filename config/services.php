@@ -28,6 +28,12 @@
         'region' => env('AWS_DEFAULT_REGION', 'us-east-1'),
     ],
 
+    'encoding_queue' => [
+        // Long-poll claims hold a PHP-FPM child per idle worker; see EncodingQueueController::claim
+        'long_poll' => env('ENCODING_QUEUE_LONG_POLL', false),
+        'max_wait' => (int) env('ENCODING_QUEUE_MAX_WAIT', 10),
+    ],
+
     'slack' => [
         'notifications' => [
             'bot_user_oauth_token' => env('SLACK_BOT_USER_OAUTH_TOKEN'),
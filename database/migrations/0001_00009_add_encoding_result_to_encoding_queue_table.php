@@ -0,0 +1,22 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    public function up(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->json('encoding_result')->nullable()->after('encoding_options'); // encode path, geometry, etc. reported by the encoder
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->dropColumn('encoding_result');
+        });
+    }
+};
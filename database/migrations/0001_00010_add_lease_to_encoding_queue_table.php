@@ -0,0 +1,25 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    public function up(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->string('lease_token', 64)->nullable()->after('status'); // issued to the worker that claimed the job
+            $table->timestamp('lease_expires_at')->nullable()->after('lease_token'); // renewed by the worker's heartbeat
+            $table->index(['status', 'lease_expires_at']);
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->dropIndex(['status', 'lease_expires_at']);
+            $table->dropColumn(['lease_token', 'lease_expires_at']);
+        });
+    }
+};
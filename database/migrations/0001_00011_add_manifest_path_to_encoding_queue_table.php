@@ -0,0 +1,22 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    public function up(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->string('manifest_path')->nullable()->after('output_file_path'); // HLS master playlist when an ABR ladder was encoded
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('encoding_queue', function (Blueprint $table) {
+            $table->dropColumn('manifest_path');
+        });
+    }
+};
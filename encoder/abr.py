@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Adaptive-bitrate (HLS) ladder.
+
+One ffmpeg run decodes the source once; a split filter feeds a scaler and an
+x264 encoder per rendition, so the renditions encode side by side instead of
+each re-reading and re-decoding the source. The HLS muxer writes fMP4 (CMAF)
+segments, a media playlist per rendition and a master playlist. Keyframes are
+forced on segment boundaries in every rendition so players can switch at any
+segment.
+
+All files are flat, named after the job and rendition (<base>.m3u8,
+<base>_720p.m3u8, <base>_720p_init.mp4, <base>_720p_00000.m4s, ...) and
+reference each other by relative name, so they can live next to the
+progressive MP4 in the bucket.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_LADDER = '1080:5000k,720:2800k,480:1400k,360:800k'
+
+
+def _even(value: float) -> int:
+    return max(2, int(value) - int(value) % 2)
+
+
+def _kbps(rate: str) -> int:
+    """'2800k' -> 2800, '5M' -> 5000, '800000' -> 800"""
+    s = str(rate).strip().lower()
+    if s.endswith('k'):
+        return int(float(s[:-1]))
+    if s.endswith('m'):
+        return int(float(s[:-1]) * 1000)
+    return int(float(s) / 1000)
+
+
+def parse_ladder(spec: str) -> List[Tuple[int, str]]:
+    """'1080:5000k,720:2800k' -> [(1080, '5000k'), (720, '2800k')], tallest first."""
+    rungs = []
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        lines, _, rate = item.strip().partition(':')
+        try:
+            rungs.append((int(lines.strip().rstrip('p')), f"{_kbps(rate)}k"))
+        except ValueError:
+            raise ValueError(f"Bad ABR ladder entry {item!r} (expected <lines>:<bitrate>, e.g. 720:2800k)")
+    if not rungs:
+        raise ValueError("ABR ladder is empty")
+    return sorted(rungs, reverse=True)
+
+
+def select_renditions(ladder: List[Tuple[int, str]], width: Optional[int],
+                      height: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Renditions for a source of width x height. Rung lines are the short side
+    (so 720 is 1280x720 landscape or 720x1280 portrait); rungs above the
+    source are dropped, and a source smaller than every rung gets a single
+    rendition at its own size with the lowest rung's bitrate.
+    """
+    width, height = width or 1920, height or 1080
+    short = min(width, height)
+    vertical = height > width
+    rungs = [(lines, rate) for lines, rate in ladder if lines <= short] or [(short, ladder[-1][1])]
+    renditions = []
+    for lines, rate in rungs:
+        scale = lines / short
+        w, h = (_even(lines), _even(height * scale)) if vertical else (_even(width * scale), _even(lines))
+        renditions.append({'name': f"{lines}p", 'width': w, 'height': h, 'bitrate': rate})
+    return renditions
+
+
+def hls_args(renditions: List[Dict[str, Any]], has_audio: bool, directory: Path, base_name: str,
+             segment_seconds: float, crf: str, audio_bitrate: str = '128k',
+             threads: int = 0, preset: str = 'medium') -> Tuple[List[str], Path]:
+    """ffmpeg arguments after `-i <input>` for the whole ladder; returns (args, master playlist path)."""
+    count = len(renditions)
+    graph = f"[0:v]split={count}" + ''.join(f"[s{i}]" for i in range(count)) + ';' + ';'.join(
+        f"[s{i}]scale={r['width']}:{r['height']}[v{i}]" for i, r in enumerate(renditions))
+    args = ['-filter_complex', graph]
+    for i in range(count):
+        args += ['-map', f"[v{i}]"]
+    if has_audio:
+        args += ['-map', '0:a:0'] * count
+    args += ['-c:v', 'libx264', '-preset', preset, '-crf', crf, '-pix_fmt', 'yuv420p',
+             '-force_key_frames', f"expr:gte(t,n_forced*{segment_seconds:g})", '-sc_threshold', '0']
+    for i, r in enumerate(renditions):
+        kbps = _kbps(r['bitrate'])
+        args += [f"-maxrate:v:{i}", f"{kbps}k", f"-bufsize:v:{i}", f"{kbps * 2}k"]
+    if threads:
+        args += ['-threads', str(threads)]
+    if has_audio:
+        args += ['-c:a', 'aac', '-b:a', audio_bitrate, '-ac', '2']
+    stream_map = ' '.join((f"v:{i},a:{i}" if has_audio else f"v:{i}") + f",name:{r['name']}"
+                          for i, r in enumerate(renditions))
+    master = directory / f"{base_name}.m3u8"
+    args += [
+        '-f', 'hls',
+        '-hls_time', f"{segment_seconds:g}",
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_flags', 'independent_segments',
+        '-hls_fmp4_init_filename', f"{base_name}_%v_init.mp4",
+        '-hls_segment_filename', str(directory / f"{base_name}_%v_%05d.m4s"),
+        '-master_pl_name', master.name,
+        '-var_stream_map', stream_map,
+        str(directory / f"{base_name}_%v.m3u8"),
+    ]
+    return args, master
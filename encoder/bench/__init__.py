@@ -0,0 +1 @@
+"""End-to-end encoder benchmarks against local stand-ins (see bench/run.py)."""
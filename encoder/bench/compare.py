@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark reports (e.g. from two commits):
+
+    python -m bench.compare before.json after.json [--fail-above 10]
+
+--fail-above exits non-zero when any metric is worse by more than the given
+percentage, so the comparison can gate a rollout.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# (path in the report, True if higher is better)
+TOTALS = [
+    ('totals.jobs_per_hour', True),
+    ('totals.realtime_factor', True),
+    ('totals.cpu_seconds_per_output_minute', False),
+    ('totals.wall_seconds', False),
+    ('totals.failed', False),
+]
+# Settings that make two runs incomparable when they differ
+COMPARABLE_META = ('profile', 'mode', 'repeat', 'resolution', 'overrides', 'cpu_count', 'ffmpeg')
+# Timings that moved less than this are noise, whatever the percentage
+MIN_SECONDS_DELTA = 0.05
+
+
+def _lookup(report: Dict[str, Any], path: str) -> Optional[float]:
+    node: Any = report
+    for part in path.split('.'):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node if isinstance(node, (int, float)) and not isinstance(node, bool) else None
+
+
+def compare_reports(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = list(TOTALS)
+    stages = sorted(set(base.get('stages', {})) | set(new.get('stages', {})))
+    metrics += [(f"stages.{name}.mean_seconds", False) for name in stages]
+    metrics.append(('source_downloads.mean_seconds', False))
+
+    rows = []
+    for path, higher_is_better in metrics:
+        before, after = _lookup(base, path), _lookup(new, path)
+        change = None
+        if before is not None and after is not None and before != 0:
+            change = (after - before) / abs(before) * 100
+        worse = None
+        noise = path.endswith('seconds') and change is not None and abs(after - before) < MIN_SECONDS_DELTA
+        if change is not None and not noise:
+            worse = -change if higher_is_better else change  # > 0 means a regression
+        rows.append({'metric': path, 'before': before, 'after': after,
+                     'change_pct': round(change, 2) if change is not None else None,
+                     'regression_pct': round(worse, 2) if worse is not None else None})
+
+    mismatched = {key: (base.get('meta', {}).get(key), new.get('meta', {}).get(key))
+                  for key in COMPARABLE_META
+                  if base.get('meta', {}).get(key) != new.get('meta', {}).get(key)}
+    return {
+        'before': {k: base.get('meta', {}).get(k) for k in ('commit', 'dirty', 'timestamp')},
+        'after': {k: new.get('meta', {}).get(k) for k in ('commit', 'dirty', 'timestamp')},
+        'mismatched_meta': mismatched,
+        'rows': rows,
+    }
+
+
+def _fmt(value: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def format_comparison(comparison: Dict[str, Any]) -> str:
+    before, after = comparison['before'], comparison['after']
+    lines = [f"before: {before.get('commit')}{'+dirty' if before.get('dirty') else ''} ({before.get('timestamp')})",
+             f"after:  {after.get('commit')}{'+dirty' if after.get('dirty') else ''} ({after.get('timestamp')})"]
+    for key, (b, a) in comparison['mismatched_meta'].items():
+        lines.append(f"WARNING: {key} differs ({b!r} vs {a!r}); numbers are not directly comparable")
+    lines.append(f"{'metric':<40} {'before':>12} {'after':>12} {'change':>9}")
+    for row in comparison['rows']:
+        change = '-' if row['change_pct'] is None else f"{row['change_pct']:+.1f}%"
+        flag = '  worse' if (row['regression_pct'] or 0) > 0 else ''
+        lines.append(f"{row['metric']:<40} {_fmt(row['before']):>12} {_fmt(row['after']):>12} {change:>9}{flag}")
+    return '\n'.join(lines)
+
+
+def regressions(comparison: Dict[str, Any], threshold_pct: float) -> List[Dict[str, Any]]:
+    return [r for r in comparison['rows'] if r['regression_pct'] is not None and r['regression_pct'] > threshold_pct]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare two encoder benchmark reports')
+    parser.add_argument('before', help='Baseline report (JSON)')
+    parser.add_argument('after', help='New report (JSON)')
+    parser.add_argument('--fail-above', type=float, metavar='PCT',
+                        help='Exit 1 if any metric regresses by more than PCT percent')
+    parser.add_argument('--json', action='store_true', help='Print the comparison as JSON')
+    args = parser.parse_args()
+
+    comparison = compare_reports(json.loads(Path(args.before).read_text()),
+                                 json.loads(Path(args.after).read_text()))
+    print(json.dumps(comparison, indent=2) if args.json else format_comparison(comparison))
+    if args.fail_above is not None:
+        worse = regressions(comparison, args.fail_above)
+        if worse:
+            print(f"{len(worse)} metric(s) regressed by more than {args.fail_above}%", file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
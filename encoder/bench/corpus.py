@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Synthetic benchmark corpus generated with ffmpeg lavfi sources.
+
+Every clip is described by a Clip spec. Its file name carries a hash of the
+spec, so a cached corpus is reused only while the specs are unchanged and two
+machines that build the same profile encode the same content.
+"""
+import hashlib
+import json
+import logging
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class Clip:
+    def __init__(self, name: str, duration: float, width: int, height: int, fps: int = 30,
+                 audio: bool = True, codec: str = 'libx264', bitrate: str = '4000k'):
+        self.name = name
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.audio = audio
+        self.codec = codec
+        self.bitrate = bitrate
+
+    def spec(self) -> Dict[str, object]:
+        return {
+            'name': self.name, 'duration': self.duration, 'width': self.width, 'height': self.height,
+            'fps': self.fps, 'audio': self.audio, 'codec': self.codec, 'bitrate': self.bitrate,
+        }
+
+    @property
+    def file_name(self) -> str:
+        digest = hashlib.sha1(json.dumps(self.spec(), sort_keys=True).encode()).hexdigest()[:8]
+        return f"{self.name}-{digest}.mp4"
+
+    def command(self, out_path: Path) -> List[str]:
+        cmd = [
+            'ffmpeg', '-v', 'error', '-y',
+            '-f', 'lavfi', '-i', f"testsrc2=size={self.width}x{self.height}:rate={self.fps}:duration={self.duration}",
+        ]
+        if self.audio:
+            cmd += ['-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={self.duration}"]
+        cmd += ['-map', '0:v:0', '-c:v', self.codec, '-b:v', self.bitrate, '-g', str(self.fps * 2),
+                '-pix_fmt', 'yuv420p']
+        if self.codec == 'libx264':
+            cmd += ['-preset', 'veryfast']
+        if self.audio:
+            cmd += ['-map', '1:a:0', '-c:a', 'aac', '-b:a', '128k']
+        cmd += ['-movflags', '+faststart', str(out_path)]
+        return cmd
+
+
+# quick: a few minutes on a laptop; full: adds 4K, long and no-audio sources
+PROFILES: Dict[str, List[Clip]] = {
+    'quick': [
+        Clip('land-480p-copy', 15, 854, 480, bitrate='1200k'),  # already fits the profile: remux path
+        Clip('land-720p', 20, 1280, 720),
+        Clip('vert-1080p', 15, 1080, 1920),
+        Clip('land-720p-mpeg4-noaudio', 15, 1280, 720, audio=False, codec='mpeg4'),
+    ],
+}
+PROFILES['full'] = PROFILES['quick'] + [
+    Clip('land-1080p', 60, 1920, 1080, bitrate='8000k'),
+    Clip('land-1440p-60fps', 20, 2560, 1440, fps=60, bitrate='12000k'),
+    Clip('land-2160p', 15, 3840, 2160, bitrate='20000k'),
+    Clip('vert-720p-noaudio', 30, 720, 1280, audio=False),
+    Clip('land-720p-long', 600, 1280, 720, bitrate='2500k'),
+]
+
+
+def build_corpus(profile: str, corpus_dir: Path) -> List[Dict[str, object]]:
+    """Generate (or reuse) the profile's clips; returns their specs with file names and sizes."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r} (choose from {', '.join(PROFILES)})")
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for clip in PROFILES[profile]:
+        path = corpus_dir / clip.file_name
+        if not path.exists() or path.stat().st_size == 0:
+            logger.info(f"Generating {clip.file_name} ({clip.width}x{clip.height}, {clip.duration}s)")
+            tmp = path.with_name(path.stem + '.partial.mp4')
+            res = subprocess.run(clip.command(tmp), capture_output=True, text=True)
+            if res.returncode != 0:
+                tmp.unlink(missing_ok=True)
+                raise RuntimeError(f"Generating {clip.name} failed: {res.stderr.strip()[-500:]}")
+            tmp.rename(path)
+        entry = clip.spec()
+        entry.update(file=clip.file_name, bytes=path.stat().st_size)
+        entries.append(entry)
+    return entries
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+End-to-end encoder benchmark.
+
+Builds the synthetic corpus, serves it over HTTP, starts the local queue API
+and an S3 stand-in, then lets a real VideoEncoder worker loop run every clip
+through the full job (download, thumbnails, analyze, encode, metadata, upload,
+complete). Run from the encoder directory:
+
+    python -m bench.run --profile quick --out before.json
+    python -m bench.run --profile quick --out after.json --compare before.json
+    python -m bench.run --pipeline --set SEGMENT_ENCODE_ENABLED=false
+
+Settings from a .env in the working directory still apply; only the ones the
+harness sets (API, S3, TEMP_DIR) and --set overrides are recorded in the report.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bench.corpus import PROFILES, build_corpus
+from bench.servers import MediaServer, S3StandIn
+from local_queue import LocalQueueServer
+
+logger = logging.getLogger(__name__)
+
+ENCODER_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CORPUS_DIR = Path(tempfile.gettempdir()) / 'encoder-bench' / 'corpus'
+BENCH_BUCKET = 'encoder-bench'
+
+
+def _cpu_seconds() -> float:
+    """User + system CPU of this process and its reaped children (the ffmpeg runs)."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _git_revision() -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ENCODER_DIR,
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=ENCODER_DIR,
+                               capture_output=True, text=True, timeout=30)
+        return {'commit': rev.stdout.strip() or None, 'dirty': bool(dirty.stdout.strip())}
+    except (OSError, subprocess.SubprocessError):
+        return {'commit': None, 'dirty': None}
+
+
+def _ffmpeg_version() -> Optional[str]:
+    try:
+        res = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, timeout=10)
+        return res.stdout.splitlines()[0] if res.returncode == 0 and res.stdout else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _parse_overrides(pairs: List[str]) -> Dict[str, str]:
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep or not key:
+            raise SystemExit(f"--set expects KEY=VALUE, got {pair!r}")
+        overrides[key.strip()] = value
+    return overrides
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = build_corpus(args.profile, Path(args.corpus_dir))
+    work_dir = Path(tempfile.mkdtemp(prefix='encoder-bench-'))
+    media = MediaServer(Path(args.corpus_dir)).start()
+    queue_server = LocalQueueServer().start()
+    s3 = None if args.no_s3 else S3StandIn(BENCH_BUCKET, args.s3_endpoint).start()
+
+    env = {
+        'LARAVEL_API_URL': queue_server.base_url,
+        'TEMP_DIR': str(work_dir),
+        'POLL_INTERVAL': '1',
+    }
+    if s3:
+        env.update(AWS_BUCKET=BENCH_BUCKET, AWS_ENDPOINT=s3.endpoint_url, AWS_DEFAULT_REGION='us-east-1',
+                   AWS_USE_PATH_STYLE_ENDPOINT='true',
+                   AWS_ACCESS_KEY_ID=os.environ.get('AWS_ACCESS_KEY_ID', 'bench'),
+                   AWS_SECRET_ACCESS_KEY=os.environ.get('AWS_SECRET_ACCESS_KEY', 'bench'))
+    else:
+        env.update(AWS_BUCKET='', S3_BUCKET='')
+    overrides = _parse_overrides(args.set or [])
+    os.environ.update(env)
+    os.environ.update(overrides)
+    os.environ.setdefault('LOG_LEVEL', 'INFO' if args.verbose else 'WARNING')
+
+    # Imported late: the encoder reads its configuration at import/construction time
+    from video_encoder import VideoEncoder
+    encoder = VideoEncoder()
+
+    by_code: Dict[str, Dict[str, Any]] = {}
+    for round_no in range(args.repeat):
+        for clip in corpus:
+            code = f"{clip['name']}-r{round_no}"
+            by_code[code] = clip
+            queue_server.queue.add_job(code, f"{media.base_url}/{clip['file']}",
+                                       {'resolution': args.resolution}, max_retries=0)
+
+    loop = encoder.run_pipeline if args.pipeline else encoder.run_continuously
+    cpu_start, started = _cpu_seconds(), time.monotonic()
+    threading.Thread(target=loop, name="bench-worker", daemon=True).start()
+    finished = queue_server.queue.wait_until_idle(timeout=args.timeout)
+    wall = time.monotonic() - started
+    cpu = _cpu_seconds() - cpu_start
+    # The queue sees a job finish before the worker leaves its last stage
+    settle = time.monotonic() + 30
+    while encoder.jobs_in_flight() and time.monotonic() < settle:
+        time.sleep(0.1)
+
+    jobs = []
+    for code, clip in by_code.items():
+        job = queue_server.queue.status(code) or {}
+        result = job.get('encoding_result') or {}
+        jobs.append({
+            'video_code': code,
+            'clip': clip['name'],
+            'status': job.get('status'),
+            # from claim (prefetched jobs wait in the worker) to completion
+            'claimed_to_completed_seconds': round(job['completed_at'] - job['started_at'], 3)
+            if job.get('completed_at') and job.get('started_at') else None,
+            'encode_path': result.get('encode_path'),
+            'encode_cache': result.get('encode_cache'),
+            'streamed_upload': result.get('streamed_upload'),
+            'manifest_path': job.get('manifest_path'),
+            'complexity': result.get('complexity'),
+            'preset': (result.get('preset_policy') or {}).get('preset'),
+            'encode_seconds': result.get('encode_seconds'),
+            'realtime_factor': result.get('realtime_factor'),
+            'error': job.get('error_message'),
+        })
+
+    stage_totals = {labels[0]: stats for labels, stats in encoder.metrics.stage_seconds.snapshot().items()}
+    busy = sum(total for _, total in stage_totals.values()) or 1.0
+    stages = {
+        name: {
+            'count': count,
+            'total_seconds': round(total, 3),
+            'mean_seconds': round(total / count, 3) if count else None,
+            'share': round(total / busy, 4),
+        }
+        for name, (count, total) in sorted(stage_totals.items())
+    }
+
+    # Prefetched sources download outside the download stage, overlapping other jobs' encodes
+    download_count = sum(c for c, _ in encoder.metrics.download_seconds.snapshot().values())
+    download_total = sum(t for _, t in encoder.metrics.download_seconds.snapshot().values())
+    source_downloads = {
+        'count': download_count,
+        'total_seconds': round(download_total, 3),
+        'mean_seconds': round(download_total / download_count, 3) if download_count else None,
+    }
+
+    completed = [j for j in jobs if j['status'] == 'completed']
+    media_seconds = sum(by_code[j['video_code']]['duration'] for j in completed)
+    report = {
+        'meta': {
+            **_git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'profile': args.profile,
+            'mode': 'pipeline' if args.pipeline else 'serial',
+            'repeat': args.repeat,
+            'resolution': args.resolution,
+            'overrides': overrides,
+            's3': 'none' if not s3 else ('moto' if not args.s3_endpoint else args.s3_endpoint),
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'ffmpeg': _ffmpeg_version(),
+        },
+        'corpus': corpus,
+        'totals': {
+            'jobs': len(jobs),
+            'completed': len(completed),
+            'failed': len(jobs) - len(completed),
+            'timed_out': not finished,
+            'wall_seconds': round(wall, 3),
+            'jobs_per_hour': round(len(completed) / wall * 3600, 2) if wall > 0 else None,
+            'media_seconds': media_seconds,
+            'realtime_factor': round(media_seconds / wall, 3) if wall > 0 else None,
+            'cpu_seconds': round(cpu, 3),
+            'cpu_seconds_per_output_minute': round(cpu / (media_seconds / 60), 3) if media_seconds else None,
+            'bytes_downloaded': int(encoder.metrics.transfer_bytes.value(direction='download')),
+            'bytes_uploaded': int(encoder.metrics.transfer_bytes.value(direction='upload')),
+        },
+        'stages': stages,
+        'source_downloads': source_downloads,
+        'jobs': jobs,
+    }
+
+    queue_server.stop()
+    media.stop()
+    if s3:
+        s3.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='End-to-end encoder benchmark against local stand-ins')
+    parser.add_argument('--profile', default='quick', choices=sorted(PROFILES), help='Corpus profile (default: quick)')
+    parser.add_argument('--repeat', type=int, default=1, help='Queue the corpus this many times')
+    parser.add_argument('--resolution', default='720p', choices=['480p', '720p', '1080p'], help='Target resolution')
+    parser.add_argument('--pipeline', action='store_true', help='Run the pipelined worker loop')
+    parser.add_argument('--corpus-dir', default=str(DEFAULT_CORPUS_DIR), help='Where generated clips are cached')
+    parser.add_argument('--s3-endpoint', help='Use this MinIO-compatible endpoint instead of a moto server')
+    parser.add_argument('--no-s3', action='store_true', help='Skip uploads entirely')
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help='Encoder setting override (repeatable)')
+    parser.add_argument('--timeout', type=float, default=3600, help='Give up after this many seconds')
+    parser.add_argument('--out', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', metavar='BASELINE', help='Print a comparison against an earlier report')
+    parser.add_argument('--verbose', action='store_true', help='Show encoder INFO logs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        Path(args.out).write_text(text + '\n')
+        print(f"Report written to {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        from bench.compare import compare_reports, format_comparison
+        baseline = json.loads(Path(args.compare).read_text())
+        print(format_comparison(compare_reports(baseline, report)), file=sys.stderr)
+    if report['totals']['failed'] or report['totals']['timed_out']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins the benchmark runs against: a range-capable HTTP server for
+the corpus and an S3 endpoint (moto server, or any MinIO-compatible URL).
+"""
+import logging
+import os
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from moto.server import ThreadedMotoServer
+    MOTO_AVAILABLE = True
+except ImportError:
+    ThreadedMotoServer = None
+    MOTO_AVAILABLE = False
+
+
+class _RangeHandler(SimpleHTTPRequestHandler):
+    """Static files with single-range support, like a CDN origin."""
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.debug(fmt % args)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start > end:
+                self.send_error(416)
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{size:x}-{int(os.path.getmtime(path)):x}"')
+        self.end_headers()
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile) -> None:
+        remaining = self._remaining
+        while remaining > 0:
+            chunk = source.read(min(1024 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class MediaServer:
+    def __init__(self, root: Path, host: str = '127.0.0.1', port: int = 0):
+        self._server = ThreadingHTTPServer((host, port), partial(_RangeHandler, directory=str(root)))
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MediaServer':
+        threading.Thread(target=self._server.serve_forever, name="bench-media", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class S3StandIn:
+    """
+    A bucket to upload into: a moto server started here, or an existing
+    MinIO-compatible endpoint when endpoint_url is given.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, host: str = '127.0.0.1', port: int = 0):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self._moto = None
+        if endpoint_url is None:
+            if not MOTO_AVAILABLE:
+                raise RuntimeError("moto is not installed (pip install -r bench/requirements.txt) "
+                                   "and no --s3-endpoint was given")
+            self._moto = ThreadedMotoServer(ip_address=host, port=port, verbose=False)
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)  # one line per request otherwise
+
+    def start(self) -> 'S3StandIn':
+        if self._moto is not None:
+            self._moto.start()
+            host, port = self._moto.get_host_and_port()
+            self.endpoint_url = f"http://{host}:{port}"
+        import boto3
+        client = boto3.client('s3', endpoint_url=self.endpoint_url, region_name='us-east-1',
+                              aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID', 'bench'),
+                              aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY', 'bench'))
+        try:
+            client.head_bucket(Bucket=self.bucket)
+        except Exception:
+            client.create_bucket(Bucket=self.bucket)
+        return self
+
+    def stop(self) -> None:
+        if self._moto is not None:
+            self._moto.stop()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Per-title encoding parameters from a quick complexity probe.
+
+A few short windows spread over the source are scaled down (short side
+SAMPLE_LINES by default) and encoded once with a fast x264 preset at a fixed
+reference CRF. The bits per pixel of that sample measure how hard the title is
+to compress: static, flat content lands around 0.001, busy detailed footage
+well above 0.1. The score picks the CRF within a quality band around the job's
+own CRF (easy titles get a higher CRF, hard ones a lower one) and a maxrate
+sized to the predicted full-resolution bitrate, within a factor of the job's
+cap.
+
+The bitrate prediction scales the sample's rate by pixel count and by the
+usual ~6 CRF steps per halving of bitrate; it is an estimate for picking a
+cap and reporting savings, not a promise.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+REFERENCE_CRF = 23
+REFERENCE_PRESET = 'veryfast'
+SAMPLE_LINES = 360
+CRF_STEPS_PER_HALVING = 6.0
+# Sample bits per pixel at the easy and hard ends of the scale
+LOW_BPP = 0.01
+HIGH_BPP = 0.15
+# CRF offset from the job's CRF at the easy and hard ends
+EASY_CRF_OFFSET = 3
+HARD_CRF_OFFSET = -2
+MAXRATE_HEADROOM = 2.0  # maxrate over the predicted average rate (peaks)
+
+
+def sample_windows(duration: Optional[float], count: int, length: float) -> List[Tuple[float, float]]:
+    """(start, length) of `count` windows spread evenly; the whole source when it is short."""
+    if not duration or duration <= count * length * 1.5:
+        return [(0.0, duration or length * count)]
+    return [(round(max(0.0, (i + 0.5) * duration / count - length / 2), 3), length) for i in range(count)]
+
+
+def sample_size(width: Optional[int], height: Optional[int], lines: int = SAMPLE_LINES) -> Tuple[int, int]:
+    """Sample geometry: short side `lines` (never upscaled), even dimensions."""
+    width, height = width or 1920, height or 1080
+    scale = min(1.0, lines / max(1, min(width, height)))
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def sample_args(input_path: str, windows: List[Tuple[float, float]], width: int, height: int,
+                output_path: str, threads: int = 0) -> List[str]:
+    """ffmpeg command encoding the windows back to back as a raw H.264 stream."""
+    cmd = ['ffmpeg', '-y']
+    for start, length in windows:
+        cmd += ['-ss', f"{start:g}", '-t', f"{length:g}", '-i', input_path]
+    scaled = ';'.join(f"[{i}:v]scale={width}:{height},setsar=1[s{i}]" for i in range(len(windows)))
+    joined = ''.join(f"[s{i}]" for i in range(len(windows)))
+    cmd += ['-filter_complex', f"{scaled};{joined}concat=n={len(windows)}:v=1:a=0[out]", '-map', '[out]', '-an',
+            '-c:v', 'libx264', '-preset', REFERENCE_PRESET, '-crf', str(REFERENCE_CRF), '-pix_fmt', 'yuv420p']
+    if threads:
+        cmd += ['-threads', str(threads)]
+    return cmd + ['-f', 'h264', output_path]
+
+
+def _predicted_kbps(bpp: float, pixels: int, fps: float, crf: float) -> float:
+    return bpp * pixels * fps * 2 ** ((REFERENCE_CRF - crf) / CRF_STEPS_PER_HALVING) / 1000
+
+
+def choose_parameters(bpp: float, width: int, height: int, fps: Optional[float], base_crf: int,
+                      base_maxrate_kbps: int, crf_min: int, crf_max: int,
+                      maxrate_min_factor: float, maxrate_max_factor: float) -> Dict[str, Any]:
+    """
+    CRF and maxrate for an output of width x height whose sample encoded at
+    `bpp`, with the predicted bitrate against the job's fixed settings.
+    """
+    fps = fps or 30.0
+    position = (math.log(max(bpp, 1e-6) / LOW_BPP) / math.log(HIGH_BPP / LOW_BPP))
+    position = min(1.0, max(0.0, position))
+    offset = round(EASY_CRF_OFFSET + (HARD_CRF_OFFSET - EASY_CRF_OFFSET) * position)
+    crf = min(crf_max, max(crf_min, base_crf + offset))
+
+    pixels = width * height
+    predicted = _predicted_kbps(bpp, pixels, fps, crf)
+    maxrate = int(min(base_maxrate_kbps * maxrate_max_factor,
+                      max(base_maxrate_kbps * maxrate_min_factor, predicted * MAXRATE_HEADROOM)))
+    estimated = min(predicted, maxrate)
+    baseline = min(_predicted_kbps(bpp, pixels, fps, base_crf), base_maxrate_kbps)
+    return {
+        'score': round(position, 3),
+        'class': 'low' if position < 1 / 3 else 'medium' if position < 2 / 3 else 'high',
+        'sample_bpp': round(bpp, 5),
+        'crf': crf,
+        'maxrate': f"{maxrate}k",
+        'baseline': {'crf': base_crf, 'maxrate': f"{base_maxrate_kbps}k"},
+        'estimated_kbps': int(estimated),
+        'baseline_kbps': int(baseline),
+        'estimated_savings_pct': round(100 * (1 - estimated / baseline), 1) if baseline > 0 else None,
+    }
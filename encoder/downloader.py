@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Parallel ranged HTTP downloader.
+
+  * probes Content-Length / Accept-Ranges (HEAD, falling back to a 1-byte range GET)
+  * preallocates the target file and fetches N byte ranges concurrently,
+    writing each with os.pwrite from a reusable per-connection buffer
+  * retries a dropped part from the last byte written
+  * records finished parts in a sidecar file so a retry only fetches what's missing
+  * verifies the final size
+  * optionally hashes the content (SHA-256) while it downloads, see ContentHasher
+  * open() hands out a plain streaming GET for callers that consume the
+    source sequentially (e.g. piping it straight into ffmpeg)
+Servers without range support get a single large-buffer stream.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from errors import NonRetryableError, RetryableError
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class ContentHasher:
+    """
+    SHA-256 of a file whose bytes arrive out of order (parallel ranges).
+
+    Writers report each chunk right after writing it. The chunk at the hash
+    frontier is hashed from memory; chunks ahead of it are remembered and read
+    back (from the page cache, while later ranges are still downloading) once
+    the frontier reaches them. finish() hashes whatever is still behind, so
+    there is no separate read pass over the finished file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._sha = hashlib.sha256()
+        self._cursor = 0
+        self._ahead: Dict[int, int] = {}  # start -> end of written, not yet hashed extents
+        self._ends: Dict[int, int] = {}  # end -> start, for merging
+        self._busy = False
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def update(self, offset: int, data: Any) -> None:
+        """Report len(data) bytes written at offset."""
+        end = offset + len(data)
+        with self._lock:
+            if self._busy or offset != self._cursor:
+                self._remember(offset, end)
+                return
+            self._busy = True
+        self._sha.update(data)
+        self._advance(end)
+
+    def mark_written(self, start: int, end: int) -> None:
+        """Bytes [start, end) are already on disk (e.g. parts kept from an earlier attempt)."""
+        with self._lock:
+            self._remember(start, end)
+
+    def finish(self, size: int) -> str:
+        """Hash any remaining bytes up to size and return the hex digest."""
+        try:
+            with self._lock:
+                start, self._cursor = self._cursor, size
+            if start < size:
+                self._hash_from_disk(start, size)
+            return self._sha.hexdigest()
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _remember(self, start: int, end: int) -> None:
+        start = max(start, self._cursor)
+        if end <= start:
+            return
+        if start in self._ends:
+            start = self._ends.pop(start)
+        if end in self._ahead:
+            merged_end = self._ahead.pop(end)
+            self._ends.pop(merged_end, None)
+            end = merged_end
+        self._ahead[start] = end
+        self._ends[end] = start
+
+    def _advance(self, pos: int) -> None:
+        """Owner of the frontier: follow extents that are already on disk."""
+        while True:
+            with self._lock:
+                end = self._ahead.pop(pos, None)
+                if end is None:
+                    self._cursor = pos
+                    self._busy = False
+                    return
+                self._ends.pop(end, None)
+            self._hash_from_disk(pos, end)
+            pos = end
+
+    def _hash_from_disk(self, start: int, end: int) -> None:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY)
+        pos = start
+        while pos < end:
+            chunk = os.pread(self._fd, min(4 * MB, end - pos), pos)
+            if not chunk:
+                raise RetryableError(f"{self.path.name} is shorter than expected while hashing ({pos}/{end})")
+            self._sha.update(chunk)
+            pos += len(chunk)
+
+
+class HashingWriter:
+    """
+    Seekable write target (e.g. for s3transfer's download_fileobj) that reports
+    every write to a ContentHasher. Wrap an unbuffered file so read-back sees
+    the bytes.
+    """
+
+    def __init__(self, raw: Any, hasher: ContentHasher):
+        self._raw = raw
+        self._hasher = hasher
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+    def write(self, data: Any) -> int:
+        offset = self._raw.tell()
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += self._raw.write(view[written:])
+        self._hasher.update(offset, view)
+        return written
+
+
+class RangedDownloader:
+    def __init__(self, session: requests.Session, connections: int = 4, part_size: int = 32 * MB,
+                 buffer_size: int = 1 * MB, min_ranged_size: int = 64 * MB, timeout: int = 300,
+                 min_free_bytes: int = 0, part_retries: int = 3):
+        self.session = session
+        self.connections = max(1, connections)
+        self.part_size = max(1 * MB, part_size)
+        self.buffer_size = max(64 * 1024, buffer_size)
+        self.min_ranged_size = min_ranged_size
+        self.timeout = timeout
+        self.min_free_bytes = min_free_bytes
+        self.part_retries = max(0, part_retries)
+
+    # -------------------- public --------------------
+    def download(self, url: str, local_path: Path, headers: Optional[Dict[str, str]] = None,
+                 hasher: Optional[ContentHasher] = None) -> int:
+        """
+        Download url to local_path; returns the number of bytes on disk.
+        With a hasher, every byte is reported to it as it lands (call
+        hasher.finish(size) afterwards for the digest).
+        """
+        headers = dict(headers or {})
+        headers['Accept-Encoding'] = 'identity'  # byte offsets must match the file
+
+        size, ranges_ok, etag = self.probe(url, headers)
+        if size is not None:
+            self._ensure_space(local_path.parent, size)
+
+        if size and ranges_ok and size >= self.min_ranged_size and self.connections > 1:
+            return self._download_ranged(url, local_path, headers, size, etag, hasher)
+
+        self._state_path(local_path).unlink(missing_ok=True)
+        return self._download_stream(url, local_path, headers, size, hasher)
+
+    def open(self, url: str, headers: Optional[Dict[str, str]] = None,
+             length: Optional[int] = None) -> requests.Response:
+        """
+        GET url as a stream, only its first `length` bytes when given (a server
+        that ignores Range sends everything; read what you need and close).
+        The caller reads r.raw and closes the response.
+        """
+        headers = {**(headers or {}), 'Accept-Encoding': 'identity'}
+        if length:
+            headers['Range'] = f"bytes=0-{length - 1}"
+        r = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        try:
+            self._raise_for_fatal(r, url)
+            r.raise_for_status()
+        except Exception:
+            r.close()
+            raise
+        return r
+
+    def probe(self, url: str, headers: Dict[str, str]) -> Tuple[Optional[int], bool, Optional[str]]:
+        """Return (content_length, accepts_ranges, etag)."""
+        size: Optional[int] = None
+        ranges_ok = False
+        etag: Optional[str] = None
+        try:
+            r = self.session.head(url, headers=headers, timeout=30, allow_redirects=True)
+            self._raise_for_fatal(r, url)
+            if r.ok:
+                size = self._int(r.headers.get('Content-Length'))
+                ranges_ok = r.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                etag = r.headers.get('ETag')
+        except NonRetryableError:
+            raise
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"HEAD failed for {url}: {e}")
+
+        if size is None or not ranges_ok:
+            # Some servers/CDNs don't answer HEAD properly; a 1-byte range tells us both things
+            r = self.session.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True, timeout=30)
+            try:
+                self._raise_for_fatal(r, url)
+                if r.status_code == 206:
+                    total = r.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                    size = self._int(total) or size
+                    ranges_ok = size is not None
+                    etag = etag or r.headers.get('ETag')
+                elif r.ok:
+                    size = size or self._int(r.headers.get('Content-Length'))
+            finally:
+                r.close()
+        return size, ranges_ok, etag
+
+    # -------------------- ranged --------------------
+    def _download_ranged(self, url: str, local_path: Path, headers: Dict[str, str],
+                         size: int, etag: Optional[str], hasher: Optional[ContentHasher] = None) -> int:
+        parts = self._plan_parts(size)
+        state_path = self._state_path(local_path)
+        done = self._load_state(state_path, local_path, size, etag)
+
+        flags = os.O_RDWR | os.O_CREAT
+        fd = os.open(local_path, flags, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                self._preallocate(fd, size)
+
+            pending: "queue.Queue[int]" = queue.Queue()
+            for idx in range(len(parts)):
+                if idx not in done:
+                    pending.put(idx)
+                elif hasher:
+                    hasher.mark_written(parts[idx][0], parts[idx][1] + 1)
+            if pending.empty():
+                logger.info(f"All {len(parts)} parts already present for {local_path.name}")
+            else:
+                resumed = f", resuming {len(done)} done" if done else ""
+                logger.info(f"Ranged download: {size / MB:.1f} MB in {len(parts)} parts over "
+                            f"{min(self.connections, pending.qsize())} connections{resumed}")
+
+            lock = threading.Lock()
+            errors: List[BaseException] = []
+
+            def worker() -> None:
+                buf = bytearray(self.buffer_size)
+                view = memoryview(buf)
+                while not errors:
+                    try:
+                        idx = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    start, end = parts[idx]
+                    try:
+                        self._fetch_part(url, headers, fd, start, end, view, hasher)
+                    except BaseException as e:
+                        with lock:
+                            errors.append(e)
+                        return
+                    with lock:
+                        done.add(idx)
+                        self._save_state(state_path, size, etag, done)
+
+            threads = [threading.Thread(target=worker, name=f"dl-{n + 1}", daemon=True)
+                       for n in range(min(self.connections, max(1, pending.qsize())))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            if errors:
+                err = errors[0]
+                if isinstance(err, NonRetryableError):
+                    raise err
+                raise RetryableError(
+                    f"Ranged download incomplete ({len(done)}/{len(parts)} parts): {err}"
+                ) from err
+
+            os.fsync(fd)
+            on_disk = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+        if on_disk != size:
+            raise RetryableError(f"Downloaded size mismatch: expected {size}, got {on_disk}")
+        state_path.unlink(missing_ok=True)
+        return on_disk
+
+    def _fetch_part(self, url: str, headers: Dict[str, str], fd: int,
+                    start: int, end: int, view: memoryview, hasher: Optional[ContentHasher] = None) -> None:
+        """Fetch one part; a dropped connection continues from the last byte written."""
+        offset = start
+        for attempt in range(self.part_retries + 1):
+            try:
+                self._fetch_range(url, headers, fd, offset, end, view, hasher)
+                return
+            except NonRetryableError:
+                raise
+            except (RetryableError, requests.exceptions.RequestException) as e:
+                if attempt >= self.part_retries:
+                    raise
+                offset = getattr(e, 'offset', offset)
+                logger.debug(f"Range {start}-{end} interrupted at {offset}, retrying: {e}")
+
+    def _fetch_range(self, url: str, headers: Dict[str, str], fd: int,
+                     start: int, end: int, view: memoryview, hasher: Optional[ContentHasher] = None) -> None:
+        r = self.session.get(url, headers={**headers, 'Range': f"bytes={start}-{end}"},
+                             stream=True, timeout=self.timeout)
+        try:
+            self._raise_for_fatal(r, url)
+            if r.status_code != 206:
+                raise RetryableError(f"Expected 206 for range {start}-{end}, got HTTP {r.status_code}")
+            offset = start
+            expected_end = end + 1
+            try:
+                while offset < expected_end:
+                    want = min(len(view), expected_end - offset)
+                    n = r.raw.readinto(view[:want])
+                    if not n:
+                        break
+                    written = 0
+                    while written < n:
+                        written += os.pwrite(fd, view[written:n], offset + written)
+                    if hasher:
+                        hasher.update(offset, view[:n])
+                    offset += n
+            except Exception as e:
+                err = RetryableError(f"Range {start}-{end} broke at {offset}: {e}")
+                err.offset = offset
+                raise err from e
+            if offset != expected_end:
+                err = RetryableError(f"Range {start}-{end} ended early at {offset}")
+                err.offset = offset
+                raise err
+        finally:
+            r.close()
+
+    def _plan_parts(self, size: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.part_size, size) - 1) for start in range(0, size, self.part_size)]
+
+    # -------------------- single stream --------------------
+    def _download_stream(self, url: str, local_path: Path, headers: Dict[str, str],
+                         size: Optional[int], hasher: Optional[ContentHasher] = None) -> int:
+        r = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+        try:
+            self._raise_for_fatal(r, url)
+            r.raise_for_status()
+            buf = bytearray(self.buffer_size)
+            view = memoryview(buf)
+            total = 0
+            with open(local_path, 'wb') as f:
+                while True:
+                    n = r.raw.readinto(view)
+                    if not n:
+                        break
+                    f.write(view[:n])
+                    if hasher:
+                        hasher.update(total, view[:n])
+                    total += n
+        finally:
+            r.close()
+        if size is not None and total != size:
+            raise RetryableError(f"Downloaded size mismatch: expected {size}, got {total}")
+        return total
+
+    # -------------------- helpers --------------------
+    @staticmethod
+    def _raise_for_fatal(r: requests.Response, url: str) -> None:
+        if r.status_code in (401, 403, 404):
+            raise NonRetryableError(f"HTTP {r.status_code} for {url}")
+        if r.status_code >= 500:
+            raise RetryableError(f"HTTP {r.status_code} for {url}")
+
+    @staticmethod
+    def _int(value: Any) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _ensure_space(self, directory: Path, size: int) -> None:
+        try:
+            st = os.statvfs(directory)
+        except OSError:
+            return  # Best effort
+        free = st.f_bavail * st.f_frsize
+        if free - size < self.min_free_bytes:
+            raise RetryableError(
+                f"Insufficient disk space: need {size / MB:.0f} MB + reserve, have {free / MB:.0f} MB."
+            )
+
+    @staticmethod
+    def _preallocate(fd: int, size: int) -> None:
+        os.ftruncate(fd, size)
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                pass  # sparse file is fine (e.g. filesystems without fallocate)
+
+    @staticmethod
+    def _state_path(local_path: Path) -> Path:
+        return local_path.with_name(local_path.name + '.parts')
+
+    def _load_state(self, state_path: Path, local_path: Path, size: int, etag: Optional[str]) -> set:
+        try:
+            state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            return set()
+        if (state.get('size') != size or state.get('etag') != etag
+                or state.get('part_size') != self.part_size
+                or not local_path.exists() or local_path.stat().st_size != size):
+            state_path.unlink(missing_ok=True)
+            return set()
+        return set(state.get('done', []))
+
+    def _save_state(self, state_path: Path, size: int, etag: Optional[str], done: set) -> None:
+        tmp = state_path.with_name(state_path.name + '.tmp')
+        tmp.write_text(json.dumps({'size': size, 'etag': etag, 'part_size': self.part_size,
+                                   'done': sorted(done)}))
+        os.replace(tmp, state_path)
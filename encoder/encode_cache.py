@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Content-addressed encode cache.
+
+A job's cache key is the SHA-256 of its source bytes (computed while the
+source downloads) combined with a hash of everything that shapes the encoded
+output. The index maps a key to an encoded object already in the bucket, so a
+re-upload of the same source is served with a server-side copy instead of a
+new encode. Lookups are single GETs on the index (an object per key in S3, or
+a local SQLite table), never bucket listings.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when encode commands change in a way that should invalidate earlier outputs
+ENCODE_CACHE_VERSION = 1
+
+
+def cache_key(content_sha256: str, fingerprint: Dict[str, Any]) -> str:
+    """sha256(source digest + canonical JSON of the output-shaping settings)."""
+    options = json.dumps(fingerprint, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{content_sha256}:{options}".encode()).hexdigest()
+
+
+class S3CacheIndex:
+    """One small JSON object per key under prefix/ in the uploader's bucket."""
+
+    def __init__(self, s3_client: Any, bucket: str, prefix: str = 'encode-cache'):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in ('NoSuchKey', '404'):
+                return None
+            raise
+        return json.loads(obj['Body'].read())
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(entry).encode(),
+                                  ContentType='application/json')
+
+    def delete(self, key: str) -> None:
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+class SqliteCacheIndex:
+    """Index kept in a local SQLite file (single host; the outputs still live in the bucket)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS encode_cache "
+                       "(key TEXT PRIMARY KEY, entry TEXT NOT NULL, created_at REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with db:  # commits, or rolls back on error
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT entry FROM encode_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO encode_cache (key, entry, created_at) VALUES (?, ?, ?)",
+                       (key, json.dumps(entry), time.time()))
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM encode_cache WHERE key = ?", (key,))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Error classes shared by the encoder modules."""
+
+
+class RetryableError(Exception):
+    """Exception that indicates an operation should be retried."""
+    pass
+
+
+class NonRetryableError(Exception):
+    """Exception that indicates an operation should not be retried."""
+    pass
+
+
+class LeaseLostError(Exception):
+    """The job's lease expired or was taken over; another worker owns it now."""
+    pass
+
+
+class FfmpegAbortedError(RetryableError):
+    """ffmpeg was killed by the runner's watchdog; the stage can be retried."""
+    pass
+
+
+class FfmpegStallError(FfmpegAbortedError):
+    """ffmpeg stopped advancing out_time for longer than the stall window."""
+    pass
+
+
+class FfmpegTimeoutError(FfmpegAbortedError):
+    """ffmpeg ran past the time allowed for the source's duration."""
+    pass
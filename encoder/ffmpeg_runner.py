@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Streaming ffmpeg runner.
+
+Runs ffmpeg with `-progress pipe:1` and parses the key=value blocks as they
+arrive instead of buffering the whole process output:
+  * stdout carries progress (out_time, fps, speed, ...), turned into
+    FfmpegProgress snapshots and handed to an optional callback
+  * stderr is drained into a bounded ring buffer that is only used to
+    classify failures
+  * a watchdog kills the process when its output position stops advancing
+    for stall_timeout seconds (FfmpegStallError) or the whole run exceeds
+    timeout (FfmpegTimeoutError); both are retryable
+
+Mp4FileOutput / Mp4PipeOutput supply the output arguments of an MP4 encode:
+a regular +faststart file, or fragmented MP4 written to a pipe that is copied
+to the local file and handed to a sink (e.g. a streaming S3 upload) while
+ffmpeg is still running. FileInput / PipeInput do the same for the input: a
+local file, or bytes fed to ffmpeg through a pipe while they download.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from errors import FfmpegStallError, FfmpegTimeoutError, NonRetryableError, RetryableError
+
+logger = logging.getLogger(__name__)
+
+STDERR_TAIL_LINES = 200
+ERROR_TAIL_LINES = 20  # stderr lines carried in watchdog exceptions
+
+
+def _seconds(value: Optional[str]) -> Optional[float]:
+    """'00:01:02.500000' -> 62.5; out_time_us/ms are microseconds in every ffmpeg release."""
+    if not value or value == 'N/A':
+        return None
+    try:
+        h, m, s = value.split(':')
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except ValueError:
+        return None
+
+
+class FfmpegProgress:
+    """One progress snapshot; duration (seconds) comes from the probe, not from ffmpeg."""
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration
+        self.out_time: float = 0.0
+        self.frame: int = 0
+        self.fps: float = 0.0
+        self.speed: float = 0.0
+        self.total_size: int = 0
+        self.finished = False
+        self.started_at = time.monotonic()
+        self.updated_at = self.started_at
+        self.advanced_at = self.started_at  # last time out_time/frame/size moved
+
+    def update(self, fields: Dict[str, str]) -> None:
+        position = (self.out_time, self.frame, self.total_size)
+        out_us = fields.get('out_time_us') or fields.get('out_time_ms')
+        out_time = None
+        if out_us and out_us != 'N/A':
+            try:
+                out_time = int(out_us) / 1_000_000
+            except ValueError:
+                out_time = None
+        if out_time is None:
+            out_time = _seconds(fields.get('out_time'))
+        if out_time is not None and out_time >= 0:
+            self.out_time = out_time
+        try:
+            self.frame = int(fields.get('frame', self.frame))
+        except ValueError:
+            pass
+        try:
+            self.fps = float(fields.get('fps', self.fps))
+        except ValueError:
+            pass
+        speed = (fields.get('speed') or '').rstrip('x').strip()
+        try:
+            self.speed = float(speed) if speed and speed != 'N/A' else self.speed
+        except ValueError:
+            pass
+        try:
+            self.total_size = int(fields.get('total_size', self.total_size))
+        except ValueError:
+            pass
+        self.finished = fields.get('progress') == 'end'
+        self.updated_at = time.monotonic()
+        if (self.out_time, self.frame, self.total_size) != position:
+            self.advanced_at = self.updated_at
+
+    @property
+    def stalled_for(self) -> float:
+        return time.monotonic() - self.advanced_at
+
+    @property
+    def elapsed(self) -> float:
+        return self.updated_at - self.started_at
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.duration:
+            return None
+        return min(100.0, 100.0 * self.out_time / self.duration)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current speed."""
+        if not self.duration:
+            return None
+        if self.finished:
+            return 0.0
+        if self.speed > 0:
+            return max(0.0, (self.duration - self.out_time) / self.speed)
+        if self.out_time > 0 and self.elapsed > 0:
+            return max(0.0, (self.duration - self.out_time) * self.elapsed / self.out_time)
+        return None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'out_time': round(self.out_time, 2),
+            'duration': round(self.duration, 2) if self.duration else None,
+            'percent': round(self.percent, 1) if self.percent is not None else None,
+            'fps': round(self.fps, 1),
+            'speed': round(self.speed, 3),
+            'eta_seconds': int(self.eta) if self.eta is not None else None,
+            'frame': self.frame,
+            'total_size': self.total_size,
+            'elapsed_seconds': round(self.elapsed, 1),
+        }
+
+
+class FfmpegResult:
+    def __init__(self, returncode: int, stderr_tail: List[str], progress: FfmpegProgress):
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        self.progress = progress
+
+    @property
+    def stderr(self) -> str:
+        return '\n'.join(self.stderr_tail)
+
+
+def with_progress(cmd: List[str]) -> List[str]:
+    """Insert -progress pipe:1 -nostats right after the ffmpeg binary."""
+    if '-progress' in cmd:
+        return list(cmd)
+    return [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+
+
+def run_ffmpeg(cmd: List[str], duration: Optional[float] = None,
+               on_progress: Optional[Callable[[FfmpegProgress], None]] = None,
+               timeout: Optional[float] = None,
+               stall_timeout: Optional[float] = None,
+               stderr_lines: int = STDERR_TAIL_LINES,
+               pass_fds: Sequence[int] = ()) -> FfmpegResult:
+    """
+    Run ffmpeg, streaming progress to on_progress (called from a reader thread
+    after every progress block). The process is killed and FfmpegTimeoutError
+    raised once `timeout` elapses, or FfmpegStallError once the output
+    position has not advanced for `stall_timeout` seconds.
+    pass_fds are inherited by ffmpeg (e.g. the write end of an output pipe).
+    """
+    progress = FfmpegProgress(duration)
+    tail: Deque[str] = deque(maxlen=stderr_lines)
+    proc = subprocess.Popen(with_progress(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            stdin=subprocess.DEVNULL, text=True, errors='replace', bufsize=1,
+                            pass_fds=tuple(pass_fds))
+
+    def read_progress() -> None:
+        fields: Dict[str, str] = {}
+        for line in proc.stdout:
+            key, sep, value = line.strip().partition('=')
+            if not sep:
+                continue
+            fields[key] = value
+            if key == 'progress':
+                progress.update(fields)
+                fields = {}
+                if on_progress:
+                    try:
+                        on_progress(progress)
+                    except Exception as e:
+                        logger.debug(f"Progress callback failed: {e}")
+
+    def read_stderr() -> None:
+        for line in proc.stderr:
+            line = line.rstrip()
+            if line:
+                tail.append(line)
+
+    readers = [threading.Thread(target=read_progress, name="ffmpeg-progress", daemon=True),
+               threading.Thread(target=read_stderr, name="ffmpeg-stderr", daemon=True)]
+    for t in readers:
+        t.start()
+
+    def abort(error_class, reason: str) -> None:
+        proc.kill()
+        proc.wait()
+        last = '\n'.join(list(tail)[-ERROR_TAIL_LINES:])
+        raise error_class(f"ffmpeg {reason} at out_time {progress.out_time:.1f}s"
+                          f"{f' of {duration:.1f}s' if duration else ''}\n{last}")
+
+    deadline = None if not timeout else time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                proc.wait(timeout=1.0)
+                break
+            except subprocess.TimeoutExpired:
+                if deadline is not None and time.monotonic() > deadline:
+                    abort(FfmpegTimeoutError, f"timeout: killed after {timeout:.0f}s")
+                if stall_timeout and progress.stalled_for > stall_timeout:
+                    abort(FfmpegStallError, f"stalled: no progress for {progress.stalled_for:.0f}s")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        for t in readers:
+            t.join(timeout=5)
+
+    return FfmpegResult(proc.returncode, list(tail), progress)
+
+
+class ProgressAggregator:
+    """
+    Folds progress from several concurrent ffmpeg processes that each cover a
+    slice of the same source (segment-parallel encodes) into one snapshot.
+    """
+
+    def __init__(self, duration: Optional[float], emit: Optional[Callable[[FfmpegProgress], None]]):
+        self.total = FfmpegProgress(duration)
+        self.emit = emit
+        self._parts: Dict[str, FfmpegProgress] = {}
+        self._lock = threading.Lock()
+
+    def part(self, name: str) -> Callable[[FfmpegProgress], None]:
+        def update(p: FfmpegProgress) -> None:
+            with self._lock:
+                self._parts[name] = p
+                parts = list(self._parts.values())
+                self.total.out_time = sum(x.out_time for x in parts)
+                self.total.frame = sum(x.frame for x in parts)
+                self.total.total_size = sum(x.total_size for x in parts)
+                running = [x for x in parts if not x.finished]
+                self.total.fps = sum(x.fps for x in running)
+                self.total.speed = sum(x.speed for x in running)
+                self.total.updated_at = time.monotonic()
+            if self.emit:
+                self.emit(self.total)
+        return update
+
+
+# Fragmented MP4 playable while it is written: moov up front, one moof per keyframe
+FRAGMENTED_MOVFLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+
+class Mp4FileOutput:
+    """Plain MP4 output; faststart moves the moov to the front after encoding."""
+    streamed = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pass_fds: Tuple[int, ...] = ()
+
+    @property
+    def args(self) -> List[str]:
+        return ['-movflags', '+faststart', str(self.path)]
+
+    def __enter__(self) -> 'Mp4FileOutput':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def finish(self) -> None:
+        """Called once ffmpeg exited successfully."""
+
+
+class Mp4PipeOutput(Mp4FileOutput):
+    """
+    Fragmented MP4 on pipe:<fd>. A copier thread writes the stream to path and
+    reports the running byte count to sink.feed(total); finish() waits for the
+    last byte and calls sink.complete(total). Leaving the block without
+    finish() (ffmpeg failed or was killed) calls sink.abort().
+    """
+    streamed = True
+
+    def __init__(self, path: Path, sink: Any, read_size: int = 1024 * 1024):
+        super().__init__(path)
+        self.sink = sink
+        self.read_size = read_size
+        self.total = 0
+        self._read_fd: Optional[int] = None
+        self._write_fd: Optional[int] = None
+        self._copier: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._finished = False
+
+    @property
+    def args(self) -> List[str]:
+        return ['-movflags', FRAGMENTED_MOVFLAGS, '-f', 'mp4', f"pipe:{self._write_fd}"]
+
+    def __enter__(self) -> 'Mp4PipeOutput':
+        self.sink.start()
+        self._read_fd, self._write_fd = os.pipe()
+        self.pass_fds = (self._write_fd,)
+        self._copier = threading.Thread(target=self._copy, name="mp4-pipe", daemon=True)
+        self._copier.start()
+        return self
+
+    def _copy(self) -> None:
+        try:
+            with open(self.path, 'wb') as out:
+                while True:
+                    chunk = os.read(self._read_fd, self.read_size)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    out.flush()  # the sink reads parts back from the file
+                    self.total += len(chunk)
+                    self.sink.feed(self.total)
+        except BaseException as e:
+            self._error = e
+            # Keep draining so ffmpeg never blocks on a full pipe; its output is discarded
+            try:
+                while os.read(self._read_fd, self.read_size):
+                    pass
+            except OSError:
+                pass
+
+    def _close_writer(self) -> None:
+        """ffmpeg has exited; drop our write end so the copier sees EOF."""
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+        if self._copier is not None:
+            self._copier.join()
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None
+
+    def finish(self) -> None:
+        self._close_writer()
+        if self._error is not None:
+            raise RetryableError(f"Copying the ffmpeg output stream failed: {self._error}")
+        try:
+            self.sink.complete(self.total)
+        except RetryableError:
+            raise
+        except Exception as e:
+            raise RetryableError(f"Streaming upload of {self.path.name} failed: {e}") from e
+        self._finished = True
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._finished:
+            return
+        self._close_writer()
+        self.sink.abort()
+
+
+class FileInput:
+    """Local input file (ffmpeg may seek in it)."""
+    streamed = False
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pass_fds: Tuple[int, ...] = ()
+
+    @property
+    def arg(self) -> str:
+        return str(self.path)
+
+    def __enter__(self) -> 'FileInput':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def finish(self) -> None:
+        """Called once ffmpeg exited successfully."""
+
+
+class PipeInput(FileInput):
+    """
+    Input on pipe:<fd>. produce(write) runs in a thread and passes every chunk
+    of the source to write(); returning ends the input. ffmpeg cannot seek, so
+    only sources that demux front to back (MP4 with the moov first) fit.
+    If ffmpeg succeeds without reading to the end, the producer still runs to
+    completion (its hash/size checks cover the whole source). finish()
+    re-raises a producer error, since ffmpeg may exit cleanly on a truncated
+    input; leaving the block without finish() stops the producer.
+    """
+    streamed = True
+
+    def __init__(self, path: Path, produce: Callable[[Callable[[bytes], None]], None]):
+        super().__init__(path)  # what the stream stands for, for messages
+        self.produce = produce
+        self._read_fd: Optional[int] = None
+        self._write_fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._cancelled = False
+        self._detached = False
+
+    @property
+    def arg(self) -> str:
+        return f"pipe:{self._read_fd}"
+
+    def __enter__(self) -> 'PipeInput':
+        self._read_fd, self._write_fd = os.pipe()
+        self.pass_fds = (self._read_fd,)
+        self._thread = threading.Thread(target=self._feed, name="ffmpeg-input", daemon=True)
+        self._thread.start()
+        return self
+
+    def _write(self, data: bytes) -> None:
+        if self._detached:
+            return
+        view = memoryview(data)
+        try:
+            while view:
+                view = view[os.write(self._write_fd, view):]
+        except BrokenPipeError:
+            if self._cancelled:
+                raise
+            self._detached = True  # ffmpeg is done with the input; keep consuming the source
+
+    def _feed(self) -> None:
+        try:
+            self.produce(self._write)
+        except BaseException as e:
+            self._error = e
+        finally:
+            os.close(self._write_fd)  # EOF for ffmpeg
+            self._write_fd = None
+
+    def _close_reader(self) -> None:
+        """ffmpeg has exited; drop our read end so a blocked write fails instead of hanging."""
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self) -> None:
+        self._close_reader()
+        if self._error is not None:
+            if isinstance(self._error, (RetryableError, NonRetryableError)):
+                raise self._error
+            raise RetryableError(f"Streaming source {self.path.name} failed: {self._error}") from self._error
+
+    def __exit__(self, *exc: Any) -> None:
+        self._cancelled = True
+        self._close_reader()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Per-job journal for resuming after a worker crash.
+
+After each stage the worker appends the stage, a JSON snapshot of the job
+state and the artifacts later stages need (source, thumbnails, encoded file)
+with their sizes and SHA-256 checksums to TEMP_DIR/<code>.journal.json. A
+normal finish, success or failure, deletes the journal with the artifacts;
+only a worker that died mid-job leaves one behind. When the job is claimed
+again, the latest stage whose artifacts still verify is the resume point and
+the stages up to it are skipped.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = '.journal.json'
+
+
+def file_sha256(path: Path, chunk_size: int = 4 * 1024 * 1024) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class JobJournal:
+    def __init__(self, directory: Path, video_code: str, fingerprint: str):
+        self.directory = directory
+        self.video_code = video_code
+        self.fingerprint = fingerprint
+        self.path = directory / f"{video_code}{JOURNAL_SUFFIX}"
+        self.stages: List[Dict[str, Any]] = []
+        self.checksums: Dict[str, Dict[str, Any]] = {}
+
+    # -------------------- writing --------------------
+    def record(self, stage: str, state: Dict[str, Any], artifacts: Dict[Path, Optional[str]]) -> None:
+        """
+        Append a completed stage. artifacts maps each file later stages need to
+        its SHA-256 when already known (None = compute it here).
+        """
+        names = []
+        for path, digest in artifacts.items():
+            if not path.exists():
+                continue
+            st = path.stat()
+            known = self.checksums.get(path.name)
+            if digest is None and known and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns:
+                digest = known['sha256']
+            self.checksums[path.name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                                         'sha256': digest or file_sha256(path)}
+            names.append(path.name)
+        self.stages.append({'name': stage, 'completed_at': time.time(), 'artifacts': names, 'state': state})
+        self._write()
+
+    def _write(self) -> None:
+        doc = {
+            'version': JOURNAL_VERSION,
+            'video_code': self.video_code,
+            'fingerprint': self.fingerprint,
+            'updated_at': time.time(),
+            'stages': self.stages,
+            'checksums': self.checksums,
+        }
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(doc, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.path.with_name(self.path.name + '.tmp').unlink(missing_ok=True)
+
+    # -------------------- resuming --------------------
+    def resume(self) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+        """
+        Load a journal left by an earlier run of this job. Returns (stages
+        already done, state after the last of them) for the latest stage whose
+        artifacts verify, or None to start from scratch. Stages past the resume
+        point are dropped so recording continues from there.
+        """
+        try:
+            doc = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[{self.video_code}] unreadable journal, starting over: {e}")
+            self.discard()
+            return None
+        if doc.get('version') != JOURNAL_VERSION or doc.get('fingerprint') != self.fingerprint:
+            logger.info(f"[{self.video_code}] journal is for a different source or settings; starting over")
+            self.discard()
+            return None
+
+        stages = doc.get('stages') or []
+        checksums = doc.get('checksums') or {}
+        verified: Dict[str, bool] = {}
+        for idx in range(len(stages) - 1, -1, -1):
+            if all(self._verify(name, checksums.get(name), verified) for name in stages[idx]['artifacts']):
+                self.stages = stages[:idx + 1]
+                self.checksums = {n: c for n, c in checksums.items() if verified.get(n)}
+                self._write()
+                return [s['name'] for s in self.stages], self.stages[-1]['state']
+            logger.info(f"[{self.video_code}] artifacts of stage {stages[idx]['name']} did not verify")
+        self.discard()
+        return None
+
+    def _verify(self, name: str, expected: Optional[Dict[str, Any]], verified: Dict[str, bool]) -> bool:
+        if name not in verified:
+            path = self.directory / name
+            ok = False
+            if expected and path.exists() and path.stat().st_size == expected['size']:
+                ok = file_sha256(path) == expected['sha256']
+            if ok:
+                expected['mtime_ns'] = path.stat().st_mtime_ns
+            verified[name] = ok
+        return verified[name]
+
+
+def stale_journals(directory: Path, max_age_seconds: float) -> List[Tuple[Path, List[Path]]]:
+    """(journal, artifact paths) for journals untouched for max_age_seconds."""
+    cutoff = time.time() - max_age_seconds
+    found = []
+    for path in directory.glob(f"*{JOURNAL_SUFFIX}"):
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+            doc = json.loads(path.read_text())
+            artifacts = [directory / name for name in (doc.get('checksums') or {})]
+        except (OSError, ValueError):
+            artifacts = []
+        found.append((path, artifacts))
+    return found
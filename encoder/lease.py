@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Job lease heartbeat.
+
+A claimed job carries a lease token that expires unless it is renewed.
+LeaseKeeper renews every tracked lease from one background thread while the
+job's stages run, and flags a lease as lost when the API refuses the renewal
+(job reset, finished elsewhere, or claimed by another worker).
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from errors import LeaseLostError
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    def __init__(self, video_code: str, token: str, lease_seconds: int):
+        self.video_code = video_code
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self.renewed_at = time.monotonic()
+        self.lost = False
+
+
+class LeaseKeeper:
+    """
+    renew(video_code, token, lease_seconds) must return truthy on success and
+    raise LeaseLostError when the API reports the lease is gone; any other
+    exception is treated as transient and retried on the next tick.
+    """
+
+    def __init__(self, renew: Callable[[str, str, int], bool], interval: float):
+        self.renew = renew
+        self.interval = max(1.0, float(interval))
+        self._leases: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, video_code: str, token: str, lease_seconds: int) -> None:
+        with self._lock:
+            self._leases[video_code] = Lease(video_code, token, lease_seconds)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+                self._thread.start()
+
+    def release(self, video_code: str) -> None:
+        with self._lock:
+            self._leases.pop(video_code, None)
+
+    def token(self, video_code: str) -> Optional[str]:
+        with self._lock:
+            lease = self._leases.get(video_code)
+            return lease.token if lease else None
+
+    def is_lost(self, video_code: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(video_code)
+            return bool(lease and lease.lost)
+
+    def active(self) -> int:
+        with self._lock:
+            return sum(1 for lease in self._leases.values() if not lease.lost)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                due = [lease for lease in self._leases.values()
+                       if not lease.lost and time.monotonic() - lease.renewed_at >= self.interval]
+                if not self._leases:
+                    self._thread = None
+                    return
+            for lease in due:
+                self._renew(lease)
+
+    def _renew(self, lease: Lease) -> None:
+        try:
+            self.renew(lease.video_code, lease.token, lease.lease_seconds)
+            lease.renewed_at = time.monotonic()
+        except LeaseLostError as e:
+            lease.lost = True
+            logger.error(f"Lease lost for {lease.video_code}: {e}")
+        except Exception as e:
+            overdue = time.monotonic() - lease.renewed_at
+            logger.warning(f"Lease heartbeat for {lease.video_code} failed ({e}); "
+                           f"last renewed {overdue:.0f}s ago of {lease.lease_seconds}s")
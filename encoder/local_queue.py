@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Laravel encoding-queue API.
+
+Implements the endpoints the encoder talks to (next-pending, claim with
+leases and long-poll, processing/heartbeat/progress/completed/failed, status, stats,
+video activate/metadata) in memory on a stdlib HTTP server, so the worker
+loop can be exercised without the web app:
+
+    python local_queue.py --port 8001 --job abc=http://host/abc.mp4
+    LARAVEL_API_URL=http://127.0.0.1:8001 python video_encoder.py
+
+or from Python:
+
+    server = LocalQueueServer().start()
+    server.queue.add_job('abc', 'http://host/abc.mp4')
+    ... VideoEncoder with LARAVEL_API_URL=server.base_url ...
+    server.stop()
+"""
+import argparse
+import json
+import logging
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300
+MAX_CLAIM_BATCH = 10
+MAX_CLAIM_WAIT_SECONDS = 15
+
+
+class LocalQueue:
+    """In-memory job table with the same state rules as EncodingQueue."""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.events: List[Tuple[float, str, str]] = []  # (time, action, video_code)
+        self._cond = threading.Condition()
+
+    # -------------------- setup --------------------
+    def add_job(self, video_code: str, input_file_url: str,
+                encoding_options: Optional[Dict[str, Any]] = None, max_retries: int = 3) -> None:
+        with self._cond:
+            self.jobs[video_code] = {
+                'video_code': video_code,
+                'status': 'pending',
+                'input_file_url': input_file_url,
+                'encoding_options': encoding_options or {},
+                'retry_count': 0,
+                'max_retries': max_retries,
+                'lease_token': None,
+                'lease_expires_at': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'completed_at': None,
+                'progress': None,
+                'last_retry_at': None,
+                'output_file_path': None,
+                'thumbnail_paths': None,
+                'encoding_result': None,
+                'manifest_path': None,
+                'error_message': None,
+            }
+            self._cond.notify_all()
+
+    def _event(self, action: str, video_code: str = '') -> None:
+        self.events.append((time.time(), action, video_code))
+
+    # -------------------- queue rules --------------------
+    def _sweep_expired(self) -> None:
+        now = time.time()
+        for job in self.jobs.values():
+            if job['status'] == 'processing' and job['lease_expires_at'] and job['lease_expires_at'] < now:
+                job.update(status='pending', lease_token=None, lease_expires_at=None,
+                           error_message='Job was stuck in processing state', last_retry_at=now)
+                job['retry_count'] += 1
+                self._event('lease_expired', job['video_code'])
+
+    def _candidates(self) -> List[Dict[str, Any]]:
+        retryable = sorted((j for j in self.jobs.values()
+                            if j['status'] == 'failed' and j['retry_count'] < j['max_retries']),
+                           key=lambda j: j['last_retry_at'] or 0)
+        pending = sorted((j for j in self.jobs.values() if j['status'] == 'pending'),
+                         key=lambda j: j['created_at'])
+        return retryable + pending
+
+    def _lease(self, job: Dict[str, Any], lease_seconds: int) -> None:
+        now = time.time()
+        job.update(status='processing', started_at=now, lease_token=secrets.token_hex(20),
+                   lease_expires_at=now + lease_seconds)
+
+    def next_pending(self) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            self._sweep_expired()
+            candidates = self._candidates()
+            return self.payload(candidates[0]) if candidates else None
+
+    def claim(self, limit: int, lease_seconds: int, wait: float = 0) -> List[Dict[str, Any]]:
+        deadline = time.time() + min(wait, MAX_CLAIM_WAIT_SECONDS)
+        with self._cond:
+            while True:
+                self._sweep_expired()
+                claimed = self._candidates()[:limit]
+                if claimed or time.time() >= deadline:
+                    break
+                self._cond.wait(timeout=min(1.0, deadline - time.time()))
+            out = []
+            for job in claimed:
+                self._lease(job, lease_seconds)
+                self._event('claim', job['video_code'])
+                out.append(dict(self.payload(job), lease_token=job['lease_token'],
+                                lease_expires_at=job['lease_expires_at'], lease_seconds=lease_seconds))
+            return out
+
+    def mark_processing(self, video_code: str, lease_seconds: Optional[int]) -> Tuple[int, Dict[str, Any]]:
+        with self._cond:
+            job = self.jobs.get(video_code)
+            if not job:
+                return 404, {'error': 'Job not found'}
+            if lease_seconds is None:
+                job.update(status='processing', started_at=time.time())
+                self._event('processing', video_code)
+                return 200, {'message': 'Job marked as processing'}
+            if (job['status'] == 'processing' and job['lease_expires_at']
+                    and job['lease_expires_at'] >= time.time()):
+                return 409, {'error': 'Job is leased by another worker'}
+            self._lease(job, lease_seconds)
+            self._event('processing', video_code)
+            return 200, {'message': 'Job marked as processing', 'lease_token': job['lease_token'],
+                         'lease_expires_at': job['lease_expires_at'], 'lease_seconds': lease_seconds}
+
+    def _holds_lease(self, job: Dict[str, Any], token: Optional[str]) -> bool:
+        return job['lease_token'] is None or token == job['lease_token']
+
+    def heartbeat(self, video_code: str, token: str, lease_seconds: int) -> Tuple[int, Dict[str, Any]]:
+        with self._cond:
+            job = self.jobs.get(video_code)
+            if not job:
+                return 404, {'error': 'Job not found'}
+            if job['status'] != 'processing' or token != job['lease_token']:
+                return 409, {'error': 'Lease lost'}
+            job['lease_expires_at'] = time.time() + lease_seconds
+            self._event('heartbeat', video_code)
+            return 200, {'message': 'Lease renewed', 'lease_expires_at': job['lease_expires_at'],
+                         'lease_seconds': lease_seconds}
+
+    def progress(self, video_code: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._cond:
+            job = self.jobs.get(video_code)
+            if not job:
+                return 404, {'error': 'Job not found'}
+            if job['status'] != 'processing' or not self._holds_lease(job, body.get('lease_token')):
+                return 409, {'error': 'Lease lost'}
+            job['progress'] = body.get('progress')
+            self._event('progress', video_code)
+            return 200, {'message': 'Progress recorded'}
+
+    def finish(self, video_code: str, status: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._cond:
+            job = self.jobs.get(video_code)
+            if not job:
+                return 404, {'error': 'Job not found'}
+            if not self._holds_lease(job, body.get('lease_token')):
+                return 409, {'error': 'Lease lost'}
+            job.update(status=status, completed_at=time.time(), lease_token=None, lease_expires_at=None,
+                       progress=None)
+            if status == 'completed':
+                job.update(output_file_path=body.get('output_file_path'),
+                           thumbnail_paths=body.get('thumbnail_paths') or [],
+                           encoding_result=body.get('encoding_result'),
+                           manifest_path=body.get('manifest_path'))
+            else:
+                job['error_message'] = body.get('error_message')
+            self._event(status, video_code)
+            self._cond.notify_all()
+            return 200, {'message': f'Job marked as {status}'}
+
+    def status(self, video_code: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self.jobs.get(video_code)
+            return dict(job) if job else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            done = [j for j in self.jobs.values() if j['status'] == 'completed' and j['started_at']]
+            avg = (sum(j['completed_at'] - j['started_at'] for j in done) / len(done)) if done else 0
+            paths: Dict[str, int] = {'encode': 0, 'copy_video': 0, 'copy': 0}
+            for job in done:
+                path = (job['encoding_result'] or {}).get('encode_path')
+                if path in paths:
+                    paths[path] += 1
+            return {
+                'pending': counts.get('pending', 0),
+                'processing': counts.get('processing', 0),
+                'completed': counts.get('completed', 0),
+                'failed': counts.get('failed', 0),
+                'total': len(self.jobs),
+                'avg_processing_time_seconds': int(round(avg)),
+                'encode_paths': paths,
+                'active_jobs': [
+                    {'video_code': j['video_code'], 'started_at': j['started_at'], 'progress': j['progress']}
+                    for j in self.jobs.values() if j['status'] == 'processing'
+                ],
+            }
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until no job is pending or processing (used by tests/benchmarks)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while any(j['status'] in ('pending', 'processing') for j in self.jobs.values()):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=1.0 if remaining is None else min(1.0, remaining))
+            return True
+
+    def payload(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'video_code': job['video_code'],
+            'input_file_url': job['input_file_url'],
+            'uploaded_thumbnail_url': None,
+            'encoding_options': job['encoding_options'],
+            'retry_count': job['retry_count'],
+            'max_retries': job['max_retries'],
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: '_Server'
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.debug(fmt % args)
+
+    def _send(self, code: int, body: Any) -> None:
+        data = json.dumps(body, default=str).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        queue = self.server.queue
+        if parts[:2] != ['api', 'encoding-queue']:
+            return self._send(404, {'message': 'Not found'})
+        if parts[2:] == ['next-pending']:
+            job = queue.next_pending()
+            return self._send(200, job) if job else self._send(404, {'message': 'No pending jobs'})
+        if parts[2:] == ['stats']:
+            return self._send(200, queue.stats())
+        if len(parts) == 4 and parts[3] == 'status':
+            job = queue.status(parts[2])
+            return self._send(200, job) if job else self._send(404, {'error': 'Job not found'})
+        return self._send(404, {'message': 'Not found'})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        queue = self.server.queue
+
+        if parts[:2] == ['api', 'videos'] and len(parts) == 4:
+            return self._send(200, {'message': f'Video {parts[3]} ok'})
+        if parts[:2] != ['api', 'encoding-queue']:
+            return self._send(404, {'message': 'Not found'})
+
+        if parts[2:] == ['claim']:
+            if not self.server.claim_enabled:
+                return self._send(404, {'message': 'Not found'})
+            limit = max(1, min(int(query.get('limit') or body.get('limit') or 1), MAX_CLAIM_BATCH))
+            lease = int(body.get('lease_seconds') or query.get('lease_seconds') or DEFAULT_LEASE_SECONDS)
+            wait = float(query.get('wait') or body.get('wait') or 0) if self.server.long_poll else 0
+            jobs = queue.claim(limit, lease, wait)
+            reply: Dict[str, Any] = {'jobs': jobs}
+            if self.server.long_poll:
+                reply['wait'] = int(min(wait, MAX_CLAIM_WAIT_SECONDS))
+            return self._send(200, reply)
+        if parts[2:] == ['reset-stuck']:
+            return self._send(200, {'message': 'Reset 0 stuck jobs'})
+
+        if len(parts) != 4:
+            return self._send(404, {'message': 'Not found'})
+        video_code, action = parts[2], parts[3]
+        if action == 'processing':
+            lease = body.get('lease_seconds')
+            return self._send(*queue.mark_processing(video_code, int(lease) if lease else None))
+        if action == 'heartbeat':
+            lease = int(body.get('lease_seconds') or DEFAULT_LEASE_SECONDS)
+            return self._send(*queue.heartbeat(video_code, body.get('lease_token') or '', lease))
+        if action == 'progress':
+            return self._send(*queue.progress(video_code, body))
+        if action in ('completed', 'failed'):
+            return self._send(*queue.finish(video_code, action, body))
+        return self._send(404, {'message': 'Not found'})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    queue: LocalQueue
+    claim_enabled: bool
+    long_poll: bool
+
+
+class LocalQueueServer:
+    """
+    claim_enabled=False emulates an API without the claim endpoint;
+    long_poll=False one whose claim ignores `wait`.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, queue: Optional[LocalQueue] = None,
+                 claim_enabled: bool = True, long_poll: bool = True):
+        self.queue = queue or LocalQueue()
+        self._server = _Server((host, port), _Handler)
+        self._server.queue = self.queue
+        self._server.claim_enabled = claim_enabled
+        self._server.long_poll = long_poll
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'LocalQueueServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-queue", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the encoding-queue API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--job', action='append', default=[], metavar='CODE=URL',
+                        help='Queue a job (repeatable)')
+    parser.add_argument('--resolution', default='720p', help='encoding_options.resolution for --job entries')
+    parser.add_argument('--no-claim', action='store_true', help='Emulate an API without POST claim')
+    parser.add_argument('--no-long-poll', action='store_true', help='Ignore the claim wait parameter')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = LocalQueueServer(args.host, args.port, claim_enabled=not args.no_claim,
+                              long_poll=not args.no_long_poll)
+    for spec in args.job:
+        code, _, url = spec.partition('=')
+        server.queue.add_job(code, url, {'resolution': args.resolution})
+    server.start()
+    logger.info(f"Local queue listening on {server.base_url} with {len(args.job)} job(s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Single-probe media information.
+
+One ffprobe call (restricted with -show_entries) per file, parsed into a
+MediaInfo and cached by path + size + mtime so every helper that needs
+duration/dimensions/codecs reads the same result.
+"""
+import json
+import logging
+import struct
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PROBE_ENTRIES = (
+    'format=duration,bit_rate,size,format_name'
+    ':stream=index,codec_type,codec_name,profile,width,height,pix_fmt,'
+    'bit_rate,avg_frame_rate,r_frame_rate,sample_rate,channels,start_time'
+)
+
+
+def mp4_moov_end(head: bytes) -> Optional[int]:
+    """
+    End offset of the moov box if it comes before any media data, i.e. the
+    file can be demuxed front to back (from a pipe). head is the start of the
+    file; the returned offset may lie beyond it. None for moov-at-end files
+    and anything that doesn't parse as MP4/MOV top-level boxes.
+    """
+    pos = 0
+    while pos + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[pos:pos + 8])
+        if size == 1:
+            if pos + 16 > len(head):
+                return None
+            size = struct.unpack('>Q', head[pos + 8:pos + 16])[0]
+        if size < 8 or not all(32 <= c < 127 for c in kind):
+            return None  # size 0 (box runs to EOF), or not a box header
+        if kind == b'moov':
+            return pos + size
+        if kind in (b'mdat', b'moof'):
+            return None
+        pos += size
+    return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        f = float(value)
+        return f if f == f else None  # drop NaN
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate(value: Optional[str]) -> Optional[float]:
+    """'30000/1001' -> 29.97"""
+    if not value:
+        return None
+    try:
+        if '/' in value:
+            num, den = value.split('/', 1)
+            return float(num) / float(den) if float(den) else None
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MediaInfo:
+    """Parsed ffprobe result for one file (first video + first audio stream)."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.raw = data
+        fmt = data.get('format', {}) or {}
+        streams = data.get('streams', []) or []
+
+        self.duration: Optional[float] = _to_float(fmt.get('duration'))
+        self.bit_rate: Optional[int] = _to_int(fmt.get('bit_rate'))
+        self.size: Optional[int] = _to_int(fmt.get('size'))
+        self.format_name: str = fmt.get('format_name') or ''
+
+        video = next((s for s in streams if s.get('codec_type') == 'video'
+                      and s.get('width') and s.get('height')), None)
+        video = video or next((s for s in streams if s.get('codec_type') == 'video'), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+        self.has_video = video is not None
+        self.video_codec: Optional[str] = video.get('codec_name') if video else None
+        self.video_profile: Optional[str] = video.get('profile') if video else None
+        self.width: Optional[int] = _to_int(video.get('width')) if video else None
+        self.height: Optional[int] = _to_int(video.get('height')) if video else None
+        self.pix_fmt: Optional[str] = video.get('pix_fmt') if video else None
+        self.video_bitrate: Optional[int] = _to_int(video.get('bit_rate')) if video else None
+        self.fps: Optional[float] = (
+            _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate'))
+        ) if video else None
+        self.video_start_time: Optional[float] = _to_float(video.get('start_time')) if video else None
+
+        self.has_audio = audio is not None
+        self.audio_codec: Optional[str] = audio.get('codec_name') if audio else None
+        self.audio_bitrate: Optional[int] = _to_int(audio.get('bit_rate')) if audio else None
+        self.audio_channels: Optional[int] = _to_int(audio.get('channels')) if audio else None
+        self.sample_rate: Optional[int] = _to_int(audio.get('sample_rate')) if audio else None
+        self.audio_start_time: Optional[float] = _to_float(audio.get('start_time')) if audio else None
+
+    @property
+    def duration_seconds(self) -> Optional[int]:
+        return int(self.duration) if self.duration else None
+
+    @property
+    def av_offset(self) -> float:
+        """Seconds the video starts after the audio (negative: before); 0 when either is unknown."""
+        if self.video_start_time is None or self.audio_start_time is None:
+            return 0.0
+        return self.video_start_time - self.audio_start_time
+
+    @property
+    def is_vertical(self) -> bool:
+        return bool(self.width and self.height and self.height > self.width)
+
+    @property
+    def estimated_video_bitrate(self) -> Optional[int]:
+        """Stream bitrate, or container bitrate minus audio when the stream doesn't report one."""
+        if self.video_bitrate:
+            return self.video_bitrate
+        if self.bit_rate:
+            return max(0, self.bit_rate - (self.audio_bitrate or 0))
+        return None
+
+    def __repr__(self) -> str:
+        return (f"MediaInfo({self.width}x{self.height}, {self.duration}s, "
+                f"v={self.video_codec}/{self.pix_fmt}@{self.video_bitrate}, "
+                f"a={self.audio_codec}@{self.audio_bitrate})")
+
+
+class MediaProbe:
+    """
+    Thread-safe ffprobe cache.
+    Entries are keyed by (path, size, mtime) so a rewritten file is re-probed.
+    """
+
+    def __init__(self, max_entries: int = 64, timeout: int = 30,
+                 observe: Optional[Callable[[float], None]] = None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.observe = observe  # called with the wall time of each ffprobe run
+        self.probe_count = 0
+        self._cache: "OrderedDict[Tuple[str, int, int], MediaInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: Union[str, Path]) -> Optional[Tuple[str, int, int]]:
+        try:
+            st = Path(path).stat()
+        except OSError:
+            return None
+        return (str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+
+    def probe(self, path: Union[str, Path]) -> Optional[MediaInfo]:
+        """Return MediaInfo for path (cached), or None if ffprobe fails."""
+        key = self._key(path)
+        if key is None:
+            return None
+        with self._lock:
+            info = self._cache.get(key)
+            if info is not None:
+                self._cache.move_to_end(key)
+                return info
+
+        info = self._run_ffprobe(str(path))
+        if info is None:
+            return None
+
+        with self._lock:
+            self._cache[key] = info
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return info
+
+    def forget(self, *paths: Union[str, Path, None]) -> None:
+        """Drop cached entries for the given paths (called when a job is cleaned up)."""
+        names = set()
+        for p in paths:
+            if p:
+                try:
+                    names.add(str(Path(p).resolve()))
+                except OSError:
+                    continue
+        if not names:
+            return
+        with self._lock:
+            for key in [k for k in self._cache if k[0] in names]:
+                del self._cache[key]
+
+    def _run_ffprobe(self, target: str) -> Optional[MediaInfo]:
+        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_entries', PROBE_ENTRIES, target]
+        started = time.monotonic()
+        try:
+            res = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+            with self._lock:
+                self.probe_count += 1
+            if self.observe:
+                self.observe(time.monotonic() - started)
+            if res.returncode != 0:
+                return None
+            return MediaInfo(json.loads(res.stdout or '{}'))
+        except Exception as e:
+            logger.warning(f"ffprobe failed for {target}: {e}")
+            return None
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for the encoder worker, without extra dependencies.
+
+A small registry of counters, gauges and histograms rendered in the text
+exposition format, and a stdlib HTTP server that serves it on /metrics from
+a background thread:
+
+    metrics = EncoderMetrics()
+    metrics.stage_seconds.observe(12.5, stage='encode')
+    server = MetricsServer(metrics.registry, port=9108).start()
+"""
+import logging
+import math
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds: sub-second API calls up to multi-hour encodes
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+# Seconds of video per wall-clock second
+REALTIME_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+SampleKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+_UNESCAPE = {'\\\\': '\\', '\\n': '\n', '\\"': '"'}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\\\|\\n|\\"', lambda m: _UNESCAPE[m.group(0)], value)
+
+
+def parse_samples(text: str) -> Dict[SampleKey, float]:
+    """
+    Samples of a text exposition as {(name, sorted (label, value) pairs): value};
+    the reverse of MetricsRegistry.render(), for scrapers such as --health-check.
+    """
+    samples: Dict[SampleKey, float] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = _SAMPLE_RE.match(line)
+        if not m:
+            raise ValueError(f"Malformed sample line: {line!r}")
+        name, labels, value = m.groups()
+        pairs = tuple(sorted((k, _unescape(v)) for k, v in _LABEL_RE.findall(labels or '')))
+        samples[(name, pairs)] = float(value)
+    return samples
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names: Tuple[str, ...] = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def _labels(self, key: LabelValues, extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name}: counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Set/inc/dec explicitly, or pass fn to compute the value at scrape time
+    (fn returns a number, or {label values tuple: number} for labelled gauges).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 fn: Optional[Callable[[], GaugeValue]] = None):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return []
+            if value is None:
+                return []
+            values = value if isinstance(value, dict) else {(): value}
+            items = sorted((tuple(str(x) for x in k), float(v)) for k, v in values.items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            row = self._values.get(self._key(labels))
+            return int(row[-1]) if row else 0
+
+    def snapshot(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """{label values: (count, sum)} for every label set observed so far."""
+        with self._lock:
+            return {k: (int(v[-1]), v[-2]) for k, v in self._values.items()}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            for i, bound in enumerate(self.buckets):
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', _format_value(bound))])} "
+                             f"{_format_value(row[i])}")
+            lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {_format_value(row[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              fn: Optional[Callable[[], GaugeValue]] = None) -> Gauge:
+        return self._add(Gauge(name, help_text, labels, fn))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class EncoderMetrics:
+    """The worker's metric set; gauges backed by live state are attached by the owner."""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.stage_seconds = r.histogram(
+            'encoder_stage_duration_seconds', 'Wall time of job stages.', ['stage'])
+        self.download_seconds = r.histogram(
+            'encoder_source_download_duration_seconds', 'Wall time of source downloads (prefetched or not).',
+            ['source'])
+        self.probe_seconds = r.histogram(
+            'encoder_probe_duration_seconds', 'Wall time of ffprobe runs (cache misses only).')
+        self.api_seconds = r.histogram(
+            'encoder_api_request_duration_seconds', 'Queue API response time (long-poll claims included).',
+            ['endpoint'])
+        self.api_requests = r.counter(
+            'encoder_api_requests_total', 'Queue API responses by endpoint and HTTP status.',
+            ['endpoint', 'status'])
+        self.transfer_bytes = r.counter(
+            'encoder_transfer_bytes_total', 'Bytes moved through this worker.', ['direction'])
+        self.realtime_factor = r.histogram(
+            'encoder_realtime_factor', 'Encode speed in seconds of video per wall-clock second.',
+            ['encode_path'], buckets=REALTIME_BUCKETS)
+        self.media_seconds = r.counter(
+            'encoder_media_seconds_total', 'Seconds of source video encoded.', ['encode_path'])
+        self.jobs = r.counter(
+            'encoder_jobs_total', 'Finished jobs by outcome and error category.', ['outcome', 'category'])
+        self.encode_cache = r.counter(
+            'encoder_encode_cache_lookups_total', 'Encode cache lookups by result (hit, miss, error).', ['result'])
+        self.source_cache = r.counter(
+            'encoder_source_cache_lookups_total', 'Local source cache lookups by result (hit, miss).', ['result'])
+        self.preset_jobs = r.counter(
+            'encoder_preset_jobs_total', 'Encodes by the x264 preset the preset policy chose.', ['preset'])
+        self.stage_active = r.gauge(
+            'encoder_stage_active_jobs', 'Jobs currently running each stage.', ['stage'])
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], GaugeValue],
+              labels: Sequence[str] = ()) -> Gauge:
+        return self.registry.gauge(name, help_text, labels, fn)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: '_Server'
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.debug(fmt % args)
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] not in ('/metrics', '/metrics/'):
+            self.send_error(404)
+            return
+        try:
+            body = self.server.registry.render().encode()
+        except Exception as e:
+            logger.warning(f"Rendering metrics failed: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    registry: MetricsRegistry
+
+
+class MetricsServer:
+    """Serves registry.render() on GET /metrics from a daemon thread."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = '0.0.0.0', port: int = 0):
+        self._server = _Server((host, port), _Handler)
+        self._server.registry = registry
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'MetricsServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
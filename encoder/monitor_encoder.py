@@ -70,6 +70,23 @@ class EncoderMonitor:
             print(f"Error getting job status: {e}")
         return {}
     
+    @staticmethod
+    def format_progress(progress):
+        """One-line summary of an encode progress snapshot"""
+        if not progress:
+            return "waiting for progress"
+        parts = []
+        if progress.get('percent') is not None:
+            parts.append(f"{progress['percent']:5.1f}%")
+        else:
+            parts.append(f"{progress.get('out_time', 0):.0f}s encoded")
+        parts.append(f"{progress.get('fps', 0):.1f} fps")
+        parts.append(f"{progress.get('speed', 0):.2f}x")
+        eta = progress.get('eta_seconds')
+        if eta is not None:
+            parts.append(f"ETA {timedelta(seconds=int(eta))}")
+        return "  ".join(parts)
+
     def display_dashboard(self):
         """Display a real-time monitoring dashboard"""
         try:
@@ -100,6 +117,14 @@ class EncoderMonitor:
                 if stats.get('avg_processing_time_formatted'):
                     print(f"Avg Processing Time: {stats['avg_processing_time_formatted']}")
                 
+                encode_paths = stats.get('encode_paths') or {}
+                remux_total = sum(encode_paths.values())
+                if remux_total:
+                    remuxed = encode_paths.get('copy', 0) + encode_paths.get('copy_video', 0)
+                    print(f"Remux Hit Rate: {remuxed / remux_total * 100:.1f}% "
+                          f"(copy {encode_paths.get('copy', 0)}, copy_video {encode_paths.get('copy_video', 0)}, "
+                          f"encode {encode_paths.get('encode', 0)})")
+                
                 if stats.get('last_completed'):
                     last_completed = stats['last_completed']
                     print(f"Last Completed: {last_completed.get('video_code', 'N/A')} at {last_completed.get('completed_at', 'N/A')}")
@@ -107,6 +132,15 @@ class EncoderMonitor:
                         print(f"Processing Time: {last_completed['processing_time_seconds']}s")
                 print()
                 
+                # Live progress of running encodes (pushed by the workers)
+                active_jobs = stats.get('active_jobs') or []
+                if active_jobs:
+                    print("ACTIVE ENCODES:")
+                    print("-" * 30)
+                    for job in active_jobs:
+                        print(f"{job.get('video_code', 'N/A'):<14} {self.format_progress(job.get('progress'))}")
+                    print()
+                
                 # Check for stuck jobs
                 if stats.get('stuck_jobs', 0) > 0:
                     print("STUCK JOBS DETECTED:")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Staged job pipeline for the video encoder.
+
+Each stage owns a bounded input queue and its own pool of worker threads.
+Items flow stage -> stage; a full downstream queue blocks the upstream
+workers (backpressure), so only a bounded number of jobs is ever in flight.
+CPU-heavy stages (ffmpeg) additionally draw from a shared CPU budget so that
+concurrent encodes don't oversubscribe the box.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class CpuBudget:
+    """Counting semaphore measured in CPU 'slots' (roughly: cores)."""
+
+    def __init__(self, slots: int):
+        self.slots = max(1, int(slots))
+        self._used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, cost: int) -> int:
+        # A single job may never need more than the whole budget
+        cost = max(1, min(int(cost), self.slots))
+        with self._cond:
+            while self._used + cost > self.slots:
+                self._cond.wait()
+            self._used += cost
+        return cost
+
+    def release(self, cost: int) -> None:
+        with self._cond:
+            self._used = max(0, self._used - cost)
+            self._cond.notify_all()
+
+    @property
+    def used(self) -> int:
+        with self._cond:
+            return self._used
+
+
+class Stage:
+    """
+    One pipeline step.
+      * handler(item) does the work; exceptions fail the item.
+      * workers: size of the thread pool for this stage.
+      * queue_size: how many items may wait in front of the stage.
+      * cpu_cost: CPU slots each running item holds (0 = I/O stage).
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], None], workers: int = 1,
+                 queue_size: int = 1, cpu_cost: int = 0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.cpu_cost = max(0, int(cpu_cost))
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'queued': self.queue.qsize(),
+                'active': self.active,
+                'workers': self.workers,
+                'processed': self.processed,
+                'failed': self.failed,
+            }
+
+
+class Pipeline:
+    """
+    Runs items through a list of stages.
+      * on_success(item) is called after the last stage.
+      * on_failure(item, exc, stage_name) is called when a stage raises.
+      * on_finish(item) always runs last (cleanup).
+    """
+
+    def __init__(self, stages: List[Stage],
+                 on_success: Optional[Callable[[Any], None]] = None,
+                 on_failure: Optional[Callable[[Any, Exception, str], None]] = None,
+                 on_finish: Optional[Callable[[Any], None]] = None,
+                 cpu_budget: Optional[CpuBudget] = None,
+                 max_in_flight: Optional[int] = None):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage.")
+        self.stages = stages
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_finish = on_finish
+        self.cpu_budget = cpu_budget
+        # Default: everything that can sit in a queue or be worked on at once
+        self.max_in_flight = max_in_flight or sum(s.workers + s.queue.maxsize for s in stages)
+        self._in_flight = 0
+        self._in_flight_cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._started = False
+
+    # -------------------- lifecycle --------------------
+    def start(self) -> None:
+        if self._started:
+            return
+        for idx, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker, args=(idx,),
+                    name=f"pipeline-{stage.name}-{n + 1}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+        self._started = True
+        logger.info("Pipeline started: " + ", ".join(
+            f"{s.name}(workers={s.workers}, queue={s.queue.maxsize}"
+            + (f", cpu={s.cpu_cost}" if s.cpu_cost else "") + ")"
+            for s in self.stages
+        ))
+
+    def stop(self, wait: bool = True, timeout: Optional[float] = None) -> None:
+        """Drain: wait for in-flight items to finish, then stop workers."""
+        if wait:
+            self.wait_idle(timeout)
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        self._started = False
+
+    # -------------------- submission --------------------
+    def has_capacity(self) -> bool:
+        with self._in_flight_cond:
+            return self._in_flight < self.max_in_flight and not self.stages[0].queue.full()
+
+    def free_slots(self) -> int:
+        with self._in_flight_cond:
+            return max(0, min(self.max_in_flight - self._in_flight,
+                              self.stages[0].queue.maxsize - self.stages[0].queue.qsize()))
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._in_flight_cond:
+            while self._in_flight >= self.max_in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._in_flight_cond.wait(remaining)
+            return True
+
+    def submit(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """Queue an item for the first stage. Returns False if it didn't fit in time."""
+        if not self.wait_for_capacity(timeout if block else 0):
+            return False
+        with self._in_flight_cond:
+            self._in_flight += 1
+        try:
+            self.stages[0].queue.put(item, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            self._done()
+            return False
+
+    def in_flight(self) -> int:
+        with self._in_flight_cond:
+            return self._in_flight
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._in_flight_cond:
+            while self._in_flight > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._in_flight_cond.wait(remaining)
+            return True
+
+    # -------------------- introspection --------------------
+    def queue_depths(self) -> Dict[str, Dict[str, int]]:
+        return {s.name: s.snapshot() for s in self.stages}
+
+    def format_depths(self) -> str:
+        parts = []
+        for name, snap in self.queue_depths().items():
+            parts.append(f"{name}={snap['queued']}q/{snap['active']}a")
+        budget = f" cpu={self.cpu_budget.used}/{self.cpu_budget.slots}" if self.cpu_budget else ""
+        return f"in_flight={self.in_flight()} " + " ".join(parts) + budget
+
+    # -------------------- internals --------------------
+    def _done(self) -> None:
+        with self._in_flight_cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._in_flight_cond.notify_all()
+
+    def _finish(self, item: Any) -> None:
+        try:
+            if self.on_finish:
+                self.on_finish(item)
+        except Exception as e:
+            logger.warning(f"Pipeline finish hook failed: {e}")
+        finally:
+            self._done()
+
+    def _worker(self, idx: int) -> None:
+        stage = self.stages[idx]
+        next_stage = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+
+            cost = 0
+            with stage._lock:
+                stage.active += 1
+            try:
+                if stage.cpu_cost and self.cpu_budget:
+                    cost = self.cpu_budget.acquire(stage.cpu_cost)
+                stage.handler(item)
+            except Exception as e:
+                with stage._lock:
+                    stage.failed += 1
+                try:
+                    if self.on_failure:
+                        self.on_failure(item, e, stage.name)
+                except Exception as hook_error:
+                    logger.error(f"Pipeline failure hook raised: {hook_error}")
+                self._finish(item)
+                continue
+            finally:
+                if cost:
+                    self.cpu_budget.release(cost)
+                with stage._lock:
+                    stage.active -= 1
+
+            with stage._lock:
+                stage.processed += 1
+
+            if next_stage is not None:
+                # Blocks while the next stage is saturated (backpressure)
+                next_stage.queue.put(item)
+                continue
+
+            try:
+                if self.on_success:
+                    self.on_success(item)
+            except Exception as e:
+                logger.error(f"Pipeline success hook raised: {e}")
+            finally:
+                self._finish(item)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Prefetch buffer for claimed jobs.
+
+Jobs claimed ahead of time wait here while a single background thread
+downloads their sources one after another, so the next job's download
+overlaps the current job's encode. The buffer is bounded twice: by the
+number of jobs it holds and by the bytes of finished-but-unconsumed
+downloads it may keep on disk.
+"""
+import logging
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchEntry:
+    def __init__(self, item: Any, path: Path):
+        self.item = item
+        self.path = path
+        self.started = False
+        self.ready = False  # source fully downloaded by the prefetch thread
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.size = 0
+
+
+class PrefetchBuffer:
+    """
+    download(item) fetches item's source to path_of(item).
+    A failed prefetch is not fatal: the entry is handed out with .error set
+    and the job's own download stage tries again.
+    """
+
+    def __init__(self, download: Callable[[Any], None], path_of: Callable[[Any], Path],
+                 max_items: int = 1, disk_budget_bytes: int = 0, reserve_bytes: int = 0):
+        self.download = download
+        self.path_of = path_of
+        self.max_items = max(0, int(max_items))
+        self.disk_budget_bytes = max(0, int(disk_budget_bytes))
+        self.reserve_bytes = max(0, int(reserve_bytes))
+        self._entries: Deque[PrefetchEntry] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    # -------------------- producer side --------------------
+    def free_slots(self) -> int:
+        with self._cond:
+            return max(0, self.max_items - len(self._entries))
+
+    def put(self, item: Any) -> None:
+        with self._cond:
+            self._entries.append(PrefetchEntry(item, self.path_of(item)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    # -------------------- consumer side --------------------
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def get(self) -> Optional[PrefetchEntry]:
+        """
+        Pop the oldest entry, waiting for its download if it is in progress.
+        An entry the thread hasn't started (budget exhausted) comes back with
+        ready=False and the caller downloads it itself.
+        """
+        with self._cond:
+            if not self._entries:
+                return None
+            entry = self._entries[0]
+            if not entry.started:
+                entry.started = True  # keep the prefetch thread off it
+                entry.done.set()
+        entry.done.wait()
+        with self._cond:
+            self._entries.popleft()
+            self._cond.notify_all()  # frees budget for the next download
+        return entry
+
+    def drain(self) -> list:
+        """Remove and return every queued item (worker shutdown)."""
+        with self._cond:
+            self._stopped = True
+            items = [e.item for e in self._entries]
+            self._entries.clear()
+            self._cond.notify_all()
+        return items
+
+    # -------------------- internals --------------------
+    def _held_bytes(self) -> int:
+        return sum(e.size for e in self._entries if e.done.is_set())
+
+    def _has_room(self) -> bool:
+        if self.disk_budget_bytes and self._held_bytes() >= self.disk_budget_bytes:
+            return False
+        if self.reserve_bytes:
+            try:
+                st = os.statvfs(self.path_of(self._entries[0].item).parent)
+                if st.f_bavail * st.f_frsize < self.reserve_bytes:
+                    return False
+            except (OSError, IndexError):
+                pass
+        return True
+
+    def _next_entry(self) -> Optional[PrefetchEntry]:
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                pending = next((e for e in self._entries if not e.started), None)
+                if pending is not None and self._has_room():
+                    pending.started = True
+                    return pending
+                self._cond.wait(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            entry = self._next_entry()
+            if entry is None:
+                return
+            try:
+                self.download(entry.item)
+                entry.size = entry.path.stat().st_size if entry.path.exists() else 0
+                entry.ready = True
+                logger.info(f"Prefetched {entry.path.name} ({entry.size / (1024 * 1024):.1f} MB)")
+            except BaseException as e:
+                entry.error = e
+                logger.warning(f"Prefetch of {entry.path.name} failed: {e}")
+            finally:
+                entry.done.set()
+                with self._cond:
+                    self._cond.notify_all()
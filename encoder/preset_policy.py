@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Backlog-aware x264 preset selection.
+
+Before each encode the worker asks PresetPolicy for a preset. The policy
+projects how long the queue would take to drain at each preset tier:
+
+    pending jobs x seconds per job at that tier / busy workers
+
+Pending and busy (processing) counts come from the queue stats endpoint,
+refreshed at most every stats_interval seconds. A worker that prefetches
+holds several jobs in processing at once, so the busy count is divided by
+jobs_per_worker (1 + PREFETCH_JOBS) to get the workers actually encoding.
+
+Seconds per job come from this worker's own finished jobs: the encode stage
+time, normalised to medium with the relative preset speeds below, plus
+everything else the job spent (downloads, uploads, ...), which the preset
+does not change. Until the worker has finished an encode the API's average
+processing time stands in.
+
+The slowest tier whose projected drain time fits the target wins. Moving to
+a faster tier happens as soon as the current one no longer fits; moving back
+to a slower one needs the drain time to fit with a `hysteresis` margin and
+the current tier to have been held for min_dwell_seconds, so the choice
+does not flap as the queue hovers around the target.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+# Encode speed relative to medium (x264 defaults, 8-bit 1080p; content moves these, the order holds)
+PRESET_SPEED = {
+    'ultrafast': 6.0, 'superfast': 4.5, 'veryfast': 2.8, 'faster': 1.8, 'fast': 1.35,
+    'medium': 1.0, 'slow': 0.6, 'slower': 0.3, 'veryslow': 0.15,
+}
+EWMA_ALPHA = 0.3
+
+
+def parse_tiers(spec: str) -> List[str]:
+    """'slow,medium,veryfast' -> the presets ordered slowest first."""
+    tiers = [p.strip().lower() for p in (spec or '').split(',') if p.strip()]
+    unknown = [p for p in tiers if p not in PRESET_SPEED]
+    if unknown or not tiers:
+        raise ValueError(f"Bad preset tiers {spec!r} (x264 presets: {', '.join(X264_PRESETS)})")
+    return sorted(set(tiers), key=lambda p: PRESET_SPEED[p])
+
+
+class PresetPolicy:
+    """
+    fetch_stats() returns the queue stats dict ({'pending', 'processing',
+    'avg_processing_time_seconds', ...}); any exception keeps the last stats.
+    """
+
+    def __init__(self, tiers: List[str], default: str, fetch_stats: Callable[[], Dict[str, Any]],
+                 target_drain_seconds: float, hysteresis: float = 0.25, min_dwell_seconds: float = 300.0,
+                 stats_interval: float = 30.0, jobs_per_worker: int = 1):
+        self.tiers = tiers
+        self.fetch_stats = fetch_stats
+        self.target_drain_seconds = target_drain_seconds
+        self.hysteresis = min(0.9, max(0.0, hysteresis))
+        self.min_dwell_seconds = min_dwell_seconds
+        self.stats_interval = stats_interval
+        self.jobs_per_worker = max(1, jobs_per_worker)
+        self.current = default if default in tiers else tiers[len(tiers) // 2]
+        self.changed_at = time.monotonic()
+        self.last_decision: Dict[str, Any] = {'preset': self.current, 'reason': 'initial'}
+        self._stats: Optional[Dict[str, Any]] = None
+        self._stats_at = 0.0
+        self._encode_seconds: Optional[float] = None  # per job, at medium
+        self._other_seconds: Optional[float] = None  # per job, preset-independent
+        self._lock = threading.Lock()
+
+    # -------------------- inputs --------------------
+    def observe_job(self, preset: Optional[str], encode_seconds: float, other_seconds: float) -> None:
+        """A finished job: seconds its encode took at `preset` (None = no x264 encode) and everything else."""
+        with self._lock:
+            if preset in PRESET_SPEED:  # a remux or copy says nothing about encode speed
+                medium = encode_seconds * PRESET_SPEED[preset]
+                self._encode_seconds = medium if self._encode_seconds is None else (
+                    EWMA_ALPHA * medium + (1 - EWMA_ALPHA) * self._encode_seconds)
+            self._other_seconds = other_seconds if self._other_seconds is None else (
+                EWMA_ALPHA * other_seconds + (1 - EWMA_ALPHA) * self._other_seconds)
+
+    def _refresh_stats(self) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        if self._stats is None or now - self._stats_at >= self.stats_interval:
+            try:
+                self._stats = self.fetch_stats()
+            except Exception as e:
+                logger.debug(f"Queue stats unavailable for preset policy: {e}")
+                if self._stats is not None and now - self._stats_at > self.stats_interval * 5:
+                    self._stats = None  # too old to steer by
+                return self._stats
+            self._stats_at = now
+        return self._stats
+
+    # -------------------- decision --------------------
+    def _job_seconds(self, preset: str, stats: Dict[str, Any]) -> Optional[float]:
+        if self._encode_seconds is not None:
+            return (self._other_seconds or 0.0) + self._encode_seconds / PRESET_SPEED[preset]
+        fleet = stats.get('avg_processing_time_seconds')
+        return fleet / PRESET_SPEED[preset] if fleet else None
+
+    def workers(self, stats: Dict[str, Any]) -> float:
+        """Workers busy on the queue: processing jobs less those sitting in prefetch buffers."""
+        return max(1.0, int(stats.get('processing') or 0) / self.jobs_per_worker)
+
+    def projected_drain_seconds(self, preset: str, stats: Dict[str, Any]) -> Optional[float]:
+        """Seconds to work off the pending jobs at `preset` (None without a throughput estimate)."""
+        pending = int(stats.get('pending') or 0)
+        if not pending:
+            return 0.0
+        per_job = self._job_seconds(preset, stats)
+        if per_job is None:
+            return None
+        return pending * per_job / self.workers(stats)
+
+    def decide(self) -> Dict[str, Any]:
+        """The preset for the next encode: {'preset', 'previous', 'pending', 'processing', 'workers', 'drain_seconds', 'reason'}."""
+        with self._lock:
+            stats = self._refresh_stats()
+            previous = self.current
+            if stats is None:
+                decision = {'preset': previous, 'reason': 'no queue stats'}
+            elif self.projected_drain_seconds(previous, stats) is None:
+                decision = {'preset': previous, 'reason': 'no throughput estimate'}
+            else:
+                decision = {'preset': self._next_tier(stats), 'reason': 'backlog'}
+                decision['pending'] = int(stats.get('pending') or 0)
+                decision['processing'] = int(stats.get('processing') or 0)
+                decision['workers'] = round(self.workers(stats), 1)
+                decision['drain_seconds'] = round(self.projected_drain_seconds(decision['preset'], stats), 1)
+            decision['previous'] = previous
+            if decision['preset'] != previous:
+                self.current = decision['preset']
+                self.changed_at = time.monotonic()
+                logger.info(f"Preset {previous} -> {decision['preset']}: {decision['pending']} pending on "
+                            f"{decision['workers']:g} worker(s), projected drain "
+                            f"{decision['drain_seconds'] / 60:.1f} min (target {self.target_drain_seconds / 60:.1f} min)")
+            self.last_decision = decision
+            return dict(decision)
+
+    def _next_tier(self, stats: Dict[str, Any]) -> str:
+        current = self.tiers.index(self.current)
+        fits = [self.projected_drain_seconds(p, stats) <= self.target_drain_seconds for p in self.tiers]
+        if not fits[current]:
+            # Behind: the slowest faster tier that fits, or the fastest there is
+            return next((p for i, p in enumerate(self.tiers) if i > current and fits[i]), self.tiers[-1])
+        if time.monotonic() - self.changed_at < self.min_dwell_seconds:
+            return self.current
+        # Ahead: slow down only with margin to spare
+        margin = self.target_drain_seconds * (1 - self.hysteresis)
+        for i in range(current):
+            if self.projected_drain_seconds(self.tiers[i], stats) <= margin:
+                return self.tiers[i]
+        return self.current
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'preset': self.current,
+                'tiers': list(self.tiers),
+                'held_seconds': round(time.monotonic() - self.changed_at, 1),
+                'encode_seconds_at_medium': round(self._encode_seconds, 1) if self._encode_seconds is not None else None,
+                'other_seconds': round(self._other_seconds, 1) if self._other_seconds is not None else None,
+                'last_decision': dict(self.last_decision),
+            }
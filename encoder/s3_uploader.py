@@ -1,13 +1,206 @@
 import boto3
 import logging
+import os
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
 from botocore.exceptions import ClientError, NoCredentialsError
 from botocore.config import Config as BotocoreConfig
 from config import config
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+MAX_SINGLE_COPY_BYTES = 5 * 1024 * MB  # CopyObject limit; larger objects need UploadPartCopy
+
+# boto3 clients are thread-safe; building one costs tens of ms (endpoint/credential
+# resolution), so every transfer in the process shares one client per endpoint.
+_clients: Dict[Tuple, Any] = {}
+_clients_lock = threading.Lock()
+_transfer_config: Optional[TransferConfig] = None
+
+
+def get_transfer_config() -> TransferConfig:
+    """Multipart settings shared by uploads and downloads (from .env)."""
+    global _transfer_config
+    if _transfer_config is None:
+        chunk = max(5, config.get_int('S3_MULTIPART_CHUNK_MB', 64)) * MB
+        _transfer_config = TransferConfig(
+            multipart_threshold=max(5, config.get_int('S3_MULTIPART_THRESHOLD_MB', 64)) * MB,
+            multipart_chunksize=chunk,
+            max_concurrency=max(1, config.get_int('S3_MAX_CONCURRENCY', 16)),
+            io_chunksize=max(64 * 1024, config.get_int('S3_IO_CHUNK_KB', 1024) * 1024),
+            use_threads=True,
+        )
+    return _transfer_config
+
+
+def use_path_style(endpoint_url: Optional[str]) -> bool:
+    """AWS_USE_PATH_STYLE_ENDPOINT, defaulting to path-style for custom (S3-compatible) endpoints."""
+    return config.get_bool('AWS_USE_PATH_STYLE_ENDPOINT', bool(endpoint_url))
+
+
+def get_s3_client(region_name: Optional[str] = None, endpoint_url: Optional[str] = None,
+                  aws_access_key_id: Optional[str] = None, aws_secret_access_key: Optional[str] = None,
+                  path_style: Optional[bool] = None):
+    """Return the shared S3 client for this endpoint/credential set, creating it once.
+
+    path_style=None resolves it with use_path_style(), so every caller on the same
+    endpoint lands on the same client.
+    """
+    region_name = region_name or config.get('AWS_DEFAULT_REGION', 'us-east-1')
+    if path_style is None:
+        path_style = use_path_style(endpoint_url)
+    key = (region_name, endpoint_url, aws_access_key_id, aws_secret_access_key, path_style)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+        session_kwargs: Dict[str, Any] = {'region_name': region_name}
+        # Only set credentials if they're provided (allows IAM roles/environment to work)
+        if aws_access_key_id and aws_secret_access_key:
+            session_kwargs.update({
+                'aws_access_key_id': aws_access_key_id,
+                'aws_secret_access_key': aws_secret_access_key
+            })
+        session = boto3.Session(**session_kwargs)
+
+        # The pool must cover every concurrent multipart part across parallel jobs
+        pool = max(config.get_int('S3_MAX_POOL_CONNECTIONS', 64), get_transfer_config().max_request_concurrency)
+        client_kwargs: Dict[str, Any] = {
+            'config': BotocoreConfig(
+                s3={'addressing_style': 'path' if path_style else 'virtual'},
+                signature_version='s3v4',
+                max_pool_connections=pool,
+                retries={'max_attempts': config.get_int('S3_MAX_ATTEMPTS', 5), 'mode': 'standard'},
+                tcp_keepalive=True,
+            )
+        }
+        if endpoint_url:
+            client_kwargs['endpoint_url'] = endpoint_url
+
+        client = session.client('s3', **client_kwargs)
+        _clients[key] = client
+        logger.debug(f"Created S3 client for {endpoint_url or region_name} (pool={pool})")
+        return client
+
+
+class MultipartStream:
+    """
+    Multipart upload of a file that is still being written. The writer calls
+    feed(total) as bytes land; every part_size bytes go up as one part from
+    a background thread (read back from the file), so the upload keeps pace
+    with the writer. complete(total) sends the remaining tail as the last
+    part and completes the upload; abort() discards it.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, path: Path, part_size: int,
+                 extra_args: Optional[Dict[str, Any]] = None, part_retries: int = 3):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.path = path
+        self.part_size = max(5 * MB, part_size)  # S3 minimum for all but the last part
+        self.extra_args = extra_args or {}
+        self.part_retries = part_retries
+        self.upload_id: Optional[str] = None
+        self.parts: List[Dict[str, Any]] = []
+        self.uploaded = 0
+        self._written = 0
+        self._closed = False
+        self._aborted = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        resp = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.extra_args)
+        self.upload_id = resp['UploadId']
+        self._thread = threading.Thread(target=self._run, name="s3-stream", daemon=True)
+        self._thread.start()
+
+    def feed(self, total: int) -> None:
+        with self._cond:
+            self._written = total
+            self._cond.notify_all()
+
+    def _next_part(self) -> Optional[int]:
+        """Length of the next part to send, or None when there is nothing more to do."""
+        with self._cond:
+            while True:
+                if self._aborted:
+                    return None
+                pending = self._written - self.uploaded
+                if pending >= self.part_size:
+                    return self.part_size
+                if self._closed:
+                    return pending or None
+                self._cond.wait()
+
+    def _run(self) -> None:
+        fd: Optional[int] = None
+        try:
+            while True:
+                length = self._next_part()
+                if length is None:
+                    return
+                if fd is None:
+                    fd = os.open(self.path, os.O_RDONLY)  # exists once the writer has fed bytes
+                data = os.pread(fd, length, self.uploaded)
+                if len(data) != length:
+                    raise IOError(f"short read at {self.uploaded}: {len(data)} of {length} bytes")
+                part_number = len(self.parts) + 1
+                self.parts.append({'PartNumber': part_number, 'ETag': self._upload_part(part_number, data)})
+                self.uploaded += length
+        except BaseException as e:
+            self._error = e
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _upload_part(self, part_number: int, data: bytes) -> str:
+        for attempt in range(self.part_retries + 1):
+            try:
+                resp = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  PartNumber=part_number, Body=data)
+                return resp['ETag']
+            except Exception as e:
+                if attempt >= self.part_retries:
+                    raise
+                logger.warning(f"Part {part_number} of {self.key} failed ({e}), retrying")
+                time.sleep(2 ** attempt)
+
+    def complete(self, total: int) -> None:
+        """The writer is done at `total` bytes: send the tail and finish the upload."""
+        with self._cond:
+            self._written = total
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if not self.parts:
+            raise IOError(f"Nothing was written for {self.key}")
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                 MultipartUpload={'Parts': self.parts})
+        logger.info(f"Streamed {total / MB:.1f} MB to s3://{self.bucket}/{self.key} in {len(self.parts)} parts")
+
+    def abort(self) -> None:
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self.upload_id:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logger.warning(f"Aborting multipart upload of {self.key} failed: {e}")
+
+
 class S3Uploader:
     def __init__(self, bucket_name: Optional[str] = None, region_name: Optional[str] = None, 
                  aws_access_key_id: Optional[str] = None, 
@@ -25,41 +218,20 @@ class S3Uploader:
         if not self.bucket_name:
             raise ValueError("S3 bucket name is required. Set AWS_BUCKET or S3_BUCKET in .env file or pass bucket_name parameter.")
         
-        # Configure boto3 for S3-compatible services
-        session_kwargs = {
-            'region_name': self.region_name
-        }
-        
-        # Only set credentials if they're provided (allows IAM roles/environment to work)
-        if access_key and secret_key:
-            session_kwargs.update({
-                'aws_access_key_id': access_key,
-                'aws_secret_access_key': secret_key
-            })
+        self.transfer_config = get_transfer_config()
+        self._transfer_manager = None
+        self._transfer_manager_lock = threading.Lock()
         
         try:
-            session = boto3.Session(**session_kwargs)
-            
-            # S3 client configuration for custom endpoints
-            s3_config = {}
-            
-            # Handle path-style endpoints (common for S3-compatible services)
-            use_path_style = config.get_bool('AWS_USE_PATH_STYLE_ENDPOINT', True if self.endpoint_url else False)
-            if use_path_style:
-                s3_config['addressing_style'] = 'path'
-            
-            # Configure signature version if needed
-            s3_config['signature_version'] = 's3v4'
-            
-            client_kwargs = {}
             if self.endpoint_url:
-                client_kwargs['endpoint_url'] = self.endpoint_url
                 logger.info(f"Using custom S3 endpoint: {self.endpoint_url}")
             
-            if s3_config:
-                client_kwargs['config'] = BotocoreConfig(**s3_config)
-            
-            self.s3_client = session.client('s3', **client_kwargs)
+            self.s3_client = get_s3_client(
+                region_name=self.region_name,
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+            )
             
             # Test connection by checking if bucket is accessible
             try:
@@ -88,40 +260,51 @@ class S3Uploader:
         """Create S3Uploader instance using only .env configuration"""
         return cls()
     
+    @staticmethod
+    def _extra_args(s3_key: str, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """ContentType + caching metadata for an object key"""
+        # Determine content type if not provided
+        if not content_type:
+            if s3_key.endswith('.mp4'):
+                content_type = 'video/mp4'
+            elif s3_key.endswith('.jpg') or s3_key.endswith('.jpeg'):
+                content_type = 'image/jpeg'
+            elif s3_key.endswith('.m3u8'):
+                content_type = 'application/vnd.apple.mpegurl'
+            elif s3_key.endswith('.m4s'):
+                content_type = 'video/iso.segment'
+            else:
+                content_type = 'application/octet-stream'
+        
+        extra_args: Dict[str, Any] = {'ContentType': content_type}
+        
+        # For video files, add metadata for better streaming
+        if content_type in ('video/mp4', 'video/iso.segment'):
+            extra_args['Metadata'] = {
+                'Content-Disposition': 'inline',
+                'Cache-Control': 'max-age=31536000'
+            }
+        
+        # For images, add caching headers
+        elif content_type.startswith('image/'):
+            extra_args['Metadata'] = {
+                'Cache-Control': 'max-age=31536000'
+            }
+        return extra_args
+    
     def upload_file(self, local_file_path: Path, s3_key: str, 
                    content_type: Optional[str] = None) -> bool:
         """Upload a file to S3"""
         try:
-            # Determine content type if not provided
-            if not content_type:
-                if s3_key.endswith('.mp4'):
-                    content_type = 'video/mp4'
-                elif s3_key.endswith('.jpg') or s3_key.endswith('.jpeg'):
-                    content_type = 'image/jpeg'
-                else:
-                    content_type = 'application/octet-stream'
-            
-            extra_args = {'ContentType': content_type}
-            
-            # For video files, add metadata for better streaming
-            if content_type == 'video/mp4':
-                extra_args['Metadata'] = {
-                    'Content-Disposition': 'inline',
-                    'Cache-Control': 'max-age=31536000'
-                }
-            
-            # For images, add caching headers
-            elif content_type.startswith('image/'):
-                extra_args['Metadata'] = {
-                    'Cache-Control': 'max-age=31536000'
-                }
+            extra_args = self._extra_args(s3_key, content_type)
             
             # Upload file
             self.s3_client.upload_file(
                 str(local_file_path),
                 self.bucket_name,
                 s3_key,
-                ExtraArgs=extra_args
+                ExtraArgs=extra_args,
+                Config=self.transfer_config
             )
             
             logger.info(f"Successfully uploaded {local_file_path.name} to s3://{self.bucket_name}/{s3_key}")
@@ -150,13 +333,123 @@ class S3Uploader:
             if attempt < max_retries:
                 wait_time = 2 ** attempt  # Exponential backoff
                 logger.warning(f"Upload attempt {attempt + 1} failed, retrying in {wait_time}s...")
-                import time
                 time.sleep(wait_time)
             else:
                 logger.error(f"All {max_retries + 1} upload attempts failed for {s3_key}")
         
         return False
     
+    def copy_object(self, source_bucket: str, source_key: str, s3_key: str,
+                    content_type: Optional[str] = None) -> bool:
+        """
+        Server-side copy into this bucket (no bytes pass through the encoder).
+        Objects up to 5 GB use a single CopyObject; larger ones a parallel
+        multipart UploadPartCopy via the shared TransferConfig.
+        """
+        copy_source = {'Bucket': source_bucket, 'Key': source_key}
+        extra_args = self._extra_args(s3_key, content_type)
+        try:
+            size = self.s3_client.head_object(**copy_source)['ContentLength']
+            if size <= MAX_SINGLE_COPY_BYTES:
+                self.s3_client.copy_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    CopySource=copy_source,
+                    MetadataDirective='REPLACE',
+                    **extra_args
+                )
+            else:
+                self.s3_client.copy(
+                    copy_source,
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs=extra_args,
+                    Config=self.transfer_config
+                )
+            
+            logger.info(f"Copied s3://{source_bucket}/{source_key} to s3://{self.bucket_name}/{s3_key} "
+                        f"({size / MB:.1f} MB, server-side)")
+            return True
+            
+        except NoCredentialsError:
+            logger.error("AWS credentials not found")
+            return False
+        except ClientError as e:
+            logger.error(f"S3 copy failed: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Unexpected error during S3 copy: {e}")
+            return False
+    
+    def open_stream(self, local_file_path: Path, s3_key: str, part_size: Optional[int] = None,
+                    content_type: Optional[str] = None) -> MultipartStream:
+        """Multipart upload that follows local_file_path while it is being written (see MultipartStream)."""
+        return MultipartStream(self.s3_client, self.bucket_name, s3_key, local_file_path,
+                               part_size or self.transfer_config.multipart_chunksize,
+                               self._extra_args(s3_key, content_type))
+    
+    def _get_transfer_manager(self):
+        """One transfer manager per uploader; its executor bounds concurrent requests."""
+        with self._transfer_manager_lock:
+            if self._transfer_manager is None:
+                self._transfer_manager = create_transfer_manager(self.s3_client, self.transfer_config)
+            return self._transfer_manager
+    
+    def upload_many(self, items: List[Tuple[Union[Path, Dict[str, str]], str]],
+                    max_retries: int = 2) -> Dict[str, bool]:
+        """
+        Transfer several objects concurrently through the shared transfer manager.
+        items: (source, s3_key) pairs; source is a local Path to upload or a
+        {'Bucket': ..., 'Key': ...} dict for a server-side copy.
+        Returns {s3_key: success} in the order given; failed objects are retried
+        together with exponential backoff.
+        """
+        results: Dict[str, bool] = {s3_key: False for _, s3_key in items}
+        pending = list(items)
+        manager = self._get_transfer_manager()
+        
+        for attempt in range(max_retries + 1):
+            futures = []
+            for source, s3_key in pending:
+                extra_args = self._extra_args(s3_key)
+                if isinstance(source, dict):
+                    extra_args['MetadataDirective'] = 'REPLACE'
+                    future = manager.copy(copy_source=source, bucket=self.bucket_name,
+                                          key=s3_key, extra_args=extra_args)
+                else:
+                    future = manager.upload(str(source), self.bucket_name, s3_key, extra_args=extra_args)
+                futures.append((source, s3_key, future))
+            
+            failed = []
+            for source, s3_key, future in futures:
+                try:
+                    future.result()
+                    results[s3_key] = True
+                    name = f"s3://{source['Bucket']}/{source['Key']}" if isinstance(source, dict) else source.name
+                    logger.info(f"Successfully transferred {name} to s3://{self.bucket_name}/{s3_key}")
+                except Exception as e:
+                    logger.warning(f"Transfer to {s3_key} failed: {e}")
+                    failed.append((source, s3_key))
+            
+            if not failed:
+                break
+            pending = failed
+            if attempt < max_retries:
+                wait_time = 2 ** attempt  # Exponential backoff
+                logger.warning(f"{len(failed)} transfer(s) failed, retrying in {wait_time}s...")
+                time.sleep(wait_time)
+            else:
+                logger.error(f"All {max_retries + 1} attempts failed for: {', '.join(k for _, k in failed)}")
+        
+        return results
+    
+    def close(self) -> None:
+        """Shut down the transfer manager's worker threads."""
+        with self._transfer_manager_lock:
+            if self._transfer_manager is not None:
+                self._transfer_manager.shutdown()
+                self._transfer_manager = None
+    
     def file_exists(self, s3_key: str) -> bool:
         """Check if a file exists in S3"""
         try:
@@ -187,7 +480,7 @@ class S3Uploader:
         if self.endpoint_url:
             # For custom endpoints, construct URL manually
             base_url = self.endpoint_url.rstrip('/')
-            if config.get_bool('AWS_USE_PATH_STYLE_ENDPOINT', True):
+            if use_path_style(self.endpoint_url):
                 return f"{base_url}/{self.bucket_name}/{s3_key}"
             else:
                 return f"https://{self.bucket_name}.{base_url.replace('https://', '').replace('http://', '')}/{s3_key}"
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Local LRU cache of downloaded job sources.
+
+A job that fails after its download (metadata, upload, lease loss, shutdown)
+leaves its source here instead of deleting it, so a retry or re-claim on the
+same worker skips the download. Entries are keyed by the source URL without
+its query string (presigned signatures change between claims) and are only
+handed out while the origin still reports the same ETag/size.
+
+Sources move in and out by rename inside TEMP_DIR, so a cached file costs no
+extra disk while a job holds it. The least recently stored entries are
+evicted when the cache outgrows its budget or free disk drops below the
+reserve (MIN_DISK_SPACE_GB).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SourceCache:
+    def __init__(self, root: Path, max_bytes: int = 0, reserve_bytes: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes  # 0 = bounded by free disk only
+        self.reserve_bytes = reserve_bytes
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._drop_orphans()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.split('?', 1)[0].encode()).hexdigest()
+
+    @staticmethod
+    def matches(stored: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        """Same object if every validator both sides know agrees (and at least one is known)."""
+        known = [k for k in ('etag', 'size') if stored.get(k) is not None and current.get(k) is not None]
+        return bool(known) and all(stored[k] == current[k] for k in known)
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.root / f"{key}.src", self.root / f"{key}.json"
+
+    # -------------------- public --------------------
+    def take(self, url: str, validator: Dict[str, Any], dest: Path) -> Optional[Dict[str, Any]]:
+        """
+        Move the cached source for url to dest if it is still current; returns
+        its entry (url, validator, sha256, size) or None on a miss. A stale
+        entry is dropped.
+        """
+        key = self.key(url)
+        data_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                entry = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                return None
+            if not self.matches(entry.get('validator') or {}, validator) or not data_path.exists():
+                logger.info(f"Cached source for {url.split('?', 1)[0]} is stale; dropping it")
+                self._remove(key)
+                return None
+            os.replace(data_path, dest)
+            meta_path.unlink(missing_ok=True)
+        return entry
+
+    def put(self, path: Path, url: str, validator: Dict[str, Any], sha256: Optional[str]) -> bool:
+        """Move a fully downloaded source into the cache; False if it doesn't fit."""
+        size = path.stat().st_size
+        if self.max_bytes and size > self.max_bytes:
+            return False
+        key = self.key(url)
+        data_path, meta_path = self._paths(key)
+        entry = {'url': url.split('?', 1)[0], 'validator': validator, 'sha256': sha256, 'size': size,
+                 'stored_at': time.time()}
+        with self._lock:
+            self._remove(key)
+            os.replace(path, data_path)
+            tmp = meta_path.with_name(meta_path.name + '.tmp')
+            tmp.write_text(json.dumps(entry))
+            os.replace(tmp, meta_path)
+            self._evict(0, keep=key)
+        return data_path.exists()
+
+    def make_room(self, incoming_bytes: int) -> None:
+        """Evict until a download of incoming_bytes leaves the reserve free."""
+        with self._lock:
+            self._evict(incoming_bytes)
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    # -------------------- internals --------------------
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        """(key, size, stored_at) oldest first."""
+        entries = []
+        for meta_path in self.root.glob('*.json'):
+            data_path = meta_path.with_suffix('.src')
+            try:
+                st = data_path.stat()
+                entries.append((meta_path.stem, st.st_size, meta_path.stat().st_mtime))
+            except OSError:
+                continue  # taken or evicted meanwhile
+        return sorted(entries, key=lambda e: e[2])
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return 0
+
+    def _evict(self, incoming_bytes: int, keep: Optional[str] = None) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        free = self._free_bytes()
+        for key, size, _ in entries:
+            over_budget = bool(self.max_bytes) and total > self.max_bytes
+            short_on_disk = free - incoming_bytes < self.reserve_bytes
+            if not over_budget and not short_on_disk:
+                break
+            if key == keep and not short_on_disk:
+                continue
+            self._remove(key)
+            total -= size
+            free += size
+            logger.info(f"Evicted cached source {key[:12]} ({size / (1024 * 1024):.1f} MB)")
+
+    def _remove(self, key: str) -> None:
+        for p in self._paths(key):
+            p.unlink(missing_ok=True)
+
+    def _drop_orphans(self) -> None:
+        """Data without metadata (or vice versa) is left over from a crash."""
+        for p in self.root.iterdir():
+            if p.suffix == '.src' and not p.with_suffix('.json').exists():
+                p.unlink(missing_ok=True)
+            elif p.suffix == '.json' and not p.with_suffix('.src').exists():
+                p.unlink(missing_ok=True)
+            elif p.name.endswith('.json.tmp'):
+                p.unlink(missing_ok=True)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ENCODER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ENCODER_DIR not in sys.path:
+    sys.path.insert(0, ENCODER_DIR)
+
+requires_ffmpeg = pytest.mark.skipif(
+    not (shutil.which('ffmpeg') and shutil.which('ffprobe')), reason='ffmpeg/ffprobe not installed')
+
+
+def make_clip(path, seconds=2, size='320x240', rate=25, audio=True, extra=()):
+    """A small H.264/AAC test clip rendered from lavfi sources."""
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f"testsrc=size={size}:rate={rate}:duration={seconds}"]
+    if audio:
+        cmd += ['-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}", '-c:a', 'aac', '-b:a', '96k']
+    cmd += ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', *extra, str(path)]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+@pytest.fixture
+def encoder_env(monkeypatch, tmp_path):
+    """Minimal worker environment: a dead API, no S3, temp files under tmp_path."""
+    monkeypatch.setenv('LARAVEL_API_URL', 'http://127.0.0.1:9')
+    monkeypatch.setenv('TEMP_DIR', str(tmp_path / 'work'))
+    for name in ('AWS_BUCKET', 'S3_BUCKET', 'METRICS_PORT'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.fixture
+def encoder(encoder_env):
+    from video_encoder import VideoEncoder
+    return VideoEncoder()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """An in-process S3 (moto) with the encoder's bucket; yields the bucket name."""
+    moto = pytest.importorskip('moto')
+    import s3_uploader
+    for name, value in (('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1'), ('AWS_BUCKET', 'media')):
+        monkeypatch.setenv(name, value)
+    for name in ('AWS_ENDPOINT', 'AWS_URL', 'S3_BUCKET'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(s3_uploader, '_clients', {})
+    monkeypatch.setattr(s3_uploader, '_transfer_config', None)
+    with moto.mock_aws():
+        s3_uploader.get_s3_client().create_bucket(Bucket='media')
+        yield 'media'
@@ -0,0 +1,74 @@
+import pytest
+
+from abr import hls_args, parse_ladder, select_renditions
+from conftest import make_clip, requires_ffmpeg
+from local_queue import LocalQueueServer
+
+
+def test_parse_ladder():
+    assert parse_ladder('720p:2.8M, 1080:5000k,,360:800000') == [(1080, '5000k'), (720, '2800k'), (360, '800k')]
+    with pytest.raises(ValueError):
+        parse_ladder('')
+    with pytest.raises(ValueError):
+        parse_ladder('hd:fast')
+
+
+LADDER = parse_ladder('1080:5000k,720:2800k,480:1400k')
+
+
+@pytest.mark.parametrize('size, expected', [
+    ((1920, 1080), [('1080p', 1920, 1080), ('720p', 1280, 720), ('480p', 852, 480)]),
+    ((1080, 1920), [('1080p', 1080, 1920), ('720p', 720, 1280), ('480p', 480, 852)]),  # rungs are the short side
+    ((1280, 720), [('720p', 1280, 720), ('480p', 852, 480)]),  # no upscaling
+    ((320, 240), [('240p', 320, 240)]),  # smaller than every rung: its own size
+    ((None, None), [('1080p', 1920, 1080), ('720p', 1280, 720), ('480p', 852, 480)]),
+])
+def test_select_renditions(size, expected):
+    renditions = select_renditions(LADDER, *size)
+    assert [(r['name'], r['width'], r['height']) for r in renditions] == expected
+    assert all(r['width'] % 2 == 0 and r['height'] % 2 == 0 for r in renditions)
+    if size == (320, 240):
+        assert renditions[0]['bitrate'] == '1400k'
+
+
+def test_hls_args_map_every_rendition(tmp_path):
+    renditions = select_renditions(LADDER, 1280, 720)
+    args, master = hls_args(renditions, True, tmp_path, 'abc_hls', 4, '23', preset='fast')
+    assert master == tmp_path / 'abc_hls.m3u8'
+    graph = args[args.index('-filter_complex') + 1]
+    assert graph == '[0:v]split=2[s0][s1];[s0]scale=1280:720[v0];[s1]scale=852:480[v1]'
+    assert args[args.index('-var_stream_map') + 1] == 'v:0,a:0,name:720p v:1,a:1,name:480p'
+    assert args.count('0:a:0') == 2 and '-maxrate:v:1' in args
+    assert args[args.index('-force_key_frames') + 1] == 'expr:gte(t,n_forced*4)'
+
+    silent, _ = hls_args(renditions, False, tmp_path, 'abc_hls', 4, '23')
+    assert '0:a:0' not in silent and silent[silent.index('-var_stream_map') + 1] == 'v:0,name:720p v:1,name:480p'
+
+
+@requires_ffmpeg
+def test_ladder_encode_writes_playable_playlists(encoder, tmp_path):
+    encoder.abr_ladder = parse_ladder('240:400k,144:200k')
+    clip = make_clip(tmp_path / 'src.mp4', seconds=3)
+    hls = encoder.encode_hls(clip, 'abc_hls', {'crf': 30, 'preset': 'ultrafast'})
+    names = {p.name for p in hls['files']}
+    assert {'abc_hls.m3u8', 'abc_hls_240p.m3u8', 'abc_hls_144p.m3u8', 'abc_hls_240p_init.mp4'} <= names
+    master = (encoder.temp_dir / 'abc_hls.m3u8').read_text()
+    assert 'abc_hls_240p.m3u8' in master and 'abc_hls_144p.m3u8' in master
+    assert 'RESOLUTION=192x144' in master  # 320x240 source
+    assert [r['name'] for r in hls['renditions']] == ['240p', '144p']
+
+
+def test_completion_reports_the_manifest(encoder_env):
+    from video_encoder import VideoEncoder
+
+    server = LocalQueueServer().start()
+    try:
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        server.queue.add_job('abc', 'http://example.com/abc.mp4')
+        encoder = VideoEncoder()
+        token = encoder.mark_as_processing('abc')['lease_token']
+        encoder.mark_as_completed('abc', 'videos/a/abc.mp4', lease_token=token,
+                                  manifest_path='videos/a/abc_hls.m3u8')
+        assert server.queue.status('abc')['manifest_path'] == 'videos/a/abc_hls.m3u8'
+    finally:
+        server.stop()
@@ -0,0 +1,95 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from bench.compare import compare_reports, format_comparison, regressions
+from bench.corpus import Clip, build_corpus
+from conftest import requires_ffmpeg
+
+
+def report(commit='abc', **totals):
+    base = {'jobs_per_hour': 100.0, 'realtime_factor': 4.0, 'cpu_seconds_per_output_minute': 30.0,
+            'wall_seconds': 60.0, 'failed': 0}
+    return {'meta': {'commit': commit, 'profile': 'quick', 'cpu_count': 8},
+            'totals': dict(base, **totals),
+            'stages': {'encode': {'mean_seconds': 10.0}, 'upload': {'mean_seconds': 1.0}},
+            'source_downloads': {'mean_seconds': 0.5}}
+
+
+def rows(comparison):
+    return {r['metric']: r for r in comparison['rows']}
+
+
+def test_regression_direction_follows_the_metric():
+    comparison = compare_reports(report(), report('def', jobs_per_hour=80.0, wall_seconds=45.0))
+    by_metric = rows(comparison)
+    assert by_metric['totals.jobs_per_hour']['change_pct'] == -20.0
+    assert by_metric['totals.jobs_per_hour']['regression_pct'] == 20.0  # fewer jobs/hour is worse
+    assert by_metric['totals.wall_seconds']['regression_pct'] == -25.0  # less wall time is better
+    assert [r['metric'] for r in regressions(comparison, 10)] == ['totals.jobs_per_hour']
+    assert regressions(comparison, 25) == []
+
+
+def test_tiny_timing_moves_are_noise():
+    new = report()
+    new['stages']['upload']['mean_seconds'] = 1.04  # +4% but only 40ms
+    row = rows(compare_reports(report(), new))['stages.upload.mean_seconds']
+    assert row['change_pct'] == 4.0 and row['regression_pct'] is None
+
+
+def test_missing_or_zero_baselines_have_no_change():
+    new = report()
+    new['stages']['thumbnails'] = {'mean_seconds': 2.0}
+    by_metric = rows(compare_reports(report(), new))
+    assert by_metric['stages.thumbnails.mean_seconds']['before'] is None
+    assert by_metric['stages.thumbnails.mean_seconds']['change_pct'] is None
+    assert by_metric['totals.failed']['change_pct'] is None
+
+
+def test_mismatched_settings_are_flagged():
+    new = report('def')
+    new['meta']['cpu_count'] = 2
+    comparison = compare_reports(report(), new)
+    assert comparison['mismatched_meta'] == {'cpu_count': (8, 2)}
+    assert 'WARNING: cpu_count differs' in format_comparison(comparison)
+
+
+def test_cli_fails_above_threshold(tmp_path):
+    before, after = tmp_path / 'before.json', tmp_path / 'after.json'
+    before.write_text(json.dumps(report()))
+    after.write_text(json.dumps(report('def', realtime_factor=3.0)))
+    run = lambda *extra: subprocess.run([sys.executable, '-m', 'bench.compare', str(before), str(after), *extra],
+                                        capture_output=True, text=True)
+    failed = run('--fail-above', '10')
+    assert failed.returncode == 1 and 'regressed by more than 10' in failed.stderr
+    assert 'totals.realtime_factor' in failed.stdout and 'worse' in failed.stdout
+    assert run('--fail-above', '30').returncode == 0
+    assert json.loads(run('--json').stdout)['after']['commit'] == 'def'
+
+
+def test_clip_file_name_tracks_the_spec():
+    clip = Clip('x', 10, 1280, 720)
+    assert clip.file_name == Clip('x', 10, 1280, 720).file_name
+    assert clip.file_name != Clip('x', 10, 1280, 720, audio=False).file_name
+    assert '1:a:0' not in Clip('x', 1, 64, 64, audio=False).command(Path('out.mp4'))
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        build_corpus('nope', None)
+
+
+@requires_ffmpeg
+def test_corpus_is_generated_once(tmp_path, monkeypatch):
+    import bench.corpus as corpus
+
+    monkeypatch.setitem(corpus.PROFILES, 'tiny', [Clip('tiny', 1, 64, 64, fps=10)])
+    entries = build_corpus('tiny', tmp_path)
+    path = tmp_path / entries[0]['file']
+    assert entries[0]['bytes'] == path.stat().st_size > 0
+    mtime = path.stat().st_mtime_ns
+    build_corpus('tiny', tmp_path)
+    assert path.stat().st_mtime_ns == mtime
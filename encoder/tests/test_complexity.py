@@ -0,0 +1,118 @@
+import subprocess
+
+import pytest
+
+from complexity import HIGH_BPP, LOW_BPP, choose_parameters, sample_args, sample_size, sample_windows
+from conftest import make_clip, requires_ffmpeg
+from media_info import MediaInfo
+
+
+def test_sample_windows():
+    assert sample_windows(10, 3, 4) == [(0.0, 10)]  # short: the whole source
+    assert sample_windows(None, 3, 4) == [(0.0, 12)]
+    windows = sample_windows(600, 3, 4)
+    assert windows == [(98.0, 4), (298.0, 4), (498.0, 4)]
+
+
+@pytest.mark.parametrize('size, expected', [
+    ((1920, 1080), (640, 360)),
+    ((1080, 1920), (360, 640)),
+    ((320, 240), (320, 240)),  # never upscaled
+    ((853, 481), (638, 360)),  # rounded down to even dimensions
+    ((None, None), (640, 360)),
+])
+def test_sample_size(size, expected):
+    assert sample_size(*size) == expected
+
+
+def test_sample_args_concatenate_the_windows():
+    cmd = sample_args('in.mp4', [(10, 4), (50, 4)], 640, 360, 'out.h264', threads=2)
+    assert cmd.count('-i') == 2 and cmd[cmd.index('-ss') + 1] == '10'
+    graph = cmd[cmd.index('-filter_complex') + 1]
+    assert graph.endswith('[s0][s1]concat=n=2:v=1:a=0[out]')
+    assert cmd[-3:] == ['-f', 'h264', 'out.h264'] and '-threads' in cmd
+
+
+def params(bpp, crf_min=18, crf_max=30, **kwargs):
+    return choose_parameters(bpp, 1280, 720, 30, 23, 2000, crf_min, crf_max, 0.5, 1.5, **kwargs)
+
+
+def test_easy_content_gets_a_higher_crf_and_a_lower_cap():
+    easy = params(LOW_BPP / 2)
+    assert (easy['class'], easy['score'], easy['crf']) == ('low', 0.0, 26)
+    assert easy['maxrate'] == '1000k'  # floored at min factor
+    assert easy['estimated_savings_pct'] > 0
+
+
+def test_hard_content_gets_a_lower_crf_and_a_higher_cap():
+    hard = params(HIGH_BPP * 2)
+    assert (hard['class'], hard['score'], hard['crf']) == ('high', 1.0, 21)
+    assert hard['maxrate'] == '3000k'  # capped at max factor
+
+
+def test_crf_band_is_respected():
+    assert params(LOW_BPP / 2, crf_max=24)['crf'] == 24
+    assert params(HIGH_BPP * 2, crf_min=22)['crf'] == 22
+
+
+def test_score_is_monotonic_in_bpp():
+    scores = [params(bpp)['score'] for bpp in (0.005, 0.02, 0.05, 0.1, 0.2)]
+    crfs = [params(bpp)['crf'] for bpp in (0.005, 0.02, 0.05, 0.1, 0.2)]
+    assert scores == sorted(scores) and crfs == sorted(crfs, reverse=True)
+
+
+@requires_ffmpeg
+def test_flat_source_scores_easier_than_noise(encoder, tmp_path):
+    encoder.remux_enabled = False  # both clips would otherwise be copied, not encoded
+    flat = tmp_path / 'flat.mp4'
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=gray:size=640x360:rate=25:d=3',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-b:v', '8M', str(flat)],
+                   check=True)
+    noisy = make_clip(tmp_path / 'noisy.mp4', seconds=3, size='640x360', audio=False,
+                      extra=('-vf', 'noise=alls=80:allf=t', '-b:v', '8M'))
+    options = {'crf': 23, 'bitrate': '2000k'}
+    easy = encoder.analyze_complexity(flat, tmp_path / 'flat.h264', options)
+    hard = encoder.analyze_complexity(noisy, tmp_path / 'noisy.h264', options)
+    assert easy['sample_bpp'] < hard['sample_bpp']
+    assert easy['crf'] > hard['crf']
+    assert not (tmp_path / 'flat.h264').exists()  # the sample is removed
+
+
+@requires_ffmpeg
+def test_remuxed_source_is_not_analysed(encoder, tmp_path):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=1)
+    assert encoder.analyze_complexity(clip, tmp_path / 's.h264', {}) is None
+
+
+@requires_ffmpeg
+def test_analyze_stage_feeds_the_encode_options(encoder, tmp_path):
+    from video_encoder import JobContext
+
+    encoder.remux_enabled = False
+    ctx = JobContext({'video_code': 'abc', 'encoding_options': {'per_title': True, 'crf': 23, 'bitrate': '2000k'}},
+                     encoder.temp_dir)
+    make_clip(ctx.input_file, seconds=2)
+    encoder._stage_analyze(ctx)
+    options = encoder._encoding_options(ctx)
+    assert (options['crf'], options['bitrate']) == (ctx.complexity['crf'], ctx.complexity['maxrate'])
+
+    # A failed analysis keeps the job's own settings
+    broken = JobContext({'video_code': 'bad', 'encoding_options': {'per_title': True, 'crf': 23}}, encoder.temp_dir)
+    broken.input_file.write_bytes(b'not a video')
+    encoder._stage_analyze(broken)
+    assert broken.complexity is None and encoder._encoding_options(broken)['crf'] == 23
+
+
+def test_per_title_maxrate_does_not_open_the_remux_path(encoder):
+    from video_encoder import JobContext
+
+    # Fits the profile except for its rate: 3000k against the job's 2000k cap
+    info = MediaInfo({'format': {'duration': '60', 'bit_rate': '3100000'}, 'streams': [
+        {'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720, 'pix_fmt': 'yuv420p',
+         'bit_rate': '3000000', 'avg_frame_rate': '30/1'}]})
+    ctx = JobContext({'video_code': 'abc', 'encoding_options': {'per_title': True, 'bitrate': '2000k'}},
+                     encoder.temp_dir)
+    ctx.complexity = {'crf': 22, 'maxrate': '4000k', 'baseline': {'crf': 25, 'maxrate': '2000k'}}
+    assert encoder._plan_encode(info, {'bitrate': '4000k'})['path'] == 'copy'
+    plan = encoder._plan_encode(info, encoder._encoding_options(ctx))
+    assert (plan['path'], plan['bitrate'], plan['crf']) == ('encode', '4000k', '22')
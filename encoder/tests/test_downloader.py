@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import random
+
+import pytest
+import requests
+
+from bench.servers import MediaServer
+from downloader import MB, ContentHasher, RangedDownloader
+from errors import NonRetryableError, RetryableError
+
+
+class RecordingSession(requests.Session):
+    """Session that records the Range of every GET and can drop chosen ranges."""
+
+    def __init__(self, fail_starts=()):
+        super().__init__()
+        self.ranges = []
+        self.fail_starts = set(fail_starts)
+
+    def get(self, url, **kwargs):
+        rng = (kwargs.get('headers') or {}).get('Range')
+        self.ranges.append(rng)
+        if rng and int(rng[6:].split('-')[0]) in self.fail_starts:
+            raise requests.exceptions.ConnectionError(f"dropped {rng}")
+        return super().get(url, **kwargs)
+
+
+@pytest.fixture
+def served(tmp_path):
+    root = tmp_path / 'www'
+    root.mkdir()
+    content = random.Random(7).randbytes(3 * MB + 4321)
+    (root / 'src.mp4').write_bytes(content)
+    server = MediaServer(root).start()
+    yield f"{server.base_url}/src.mp4", content
+    server.stop()
+
+
+def downloader(session, **kwargs):
+    return RangedDownloader(session, **dict(dict(connections=2, part_size=MB, min_ranged_size=0, part_retries=0),
+                                            **kwargs))
+
+
+def test_ranged_download_with_hash(served, tmp_path):
+    url, content = served
+    target = tmp_path / 'out.mp4'
+    hasher = ContentHasher(target)
+    session = RecordingSession()
+    assert downloader(session).download(url, target, hasher=hasher) == len(content)
+    assert target.read_bytes() == content
+    assert hasher.finish(len(content)) == hashlib.sha256(content).hexdigest()
+    assert {r for r in session.ranges if r != 'bytes=0-0'} == {
+        'bytes=0-1048575', 'bytes=1048576-2097151', 'bytes=2097152-3145727', f'bytes=3145728-{len(content) - 1}'}
+    assert not (tmp_path / 'out.mp4.parts').exists()
+
+
+def test_retry_resumes_from_parts_file(served, tmp_path):
+    url, content = served
+    target = tmp_path / 'out.mp4'
+    with pytest.raises(RetryableError):
+        downloader(RecordingSession(fail_starts={2 * MB})).download(url, target)
+    state = json.loads((tmp_path / 'out.mp4.parts').read_text())
+    assert 2 not in state['done'] and state['done']
+
+    session = RecordingSession()
+    hasher = ContentHasher(target)
+    downloader(session).download(url, target, hasher=hasher)
+    fetched = [r for r in session.ranges if r != 'bytes=0-0']
+    assert 'bytes=2097152-3145727' in fetched
+    assert len(fetched) == 4 - len(state['done'])
+    assert target.read_bytes() == content
+    # Parts kept from the first attempt are hashed from disk
+    assert hasher.finish(len(content)) == hashlib.sha256(content).hexdigest()
+
+
+def test_changed_source_discards_parts_file(served, tmp_path):
+    url, content = served
+    target = tmp_path / 'out.mp4'
+    target.write_bytes(b'\0' * len(content))
+    (tmp_path / 'out.mp4.parts').write_text(json.dumps(
+        {'size': len(content), 'etag': '"other"', 'part_size': MB, 'done': [0, 1, 2, 3]}))
+    downloader(RecordingSession()).download(url, target)
+    assert target.read_bytes() == content
+
+
+def test_small_file_streams_in_one_request(served, tmp_path):
+    url, content = served
+    session = RecordingSession()
+    downloader(session, min_ranged_size=64 * MB).download(url, tmp_path / 'out.mp4')
+    assert (tmp_path / 'out.mp4').read_bytes() == content
+    assert session.ranges[-1] is None
+
+
+def test_missing_source_is_not_retryable(served, tmp_path):
+    url, _ = served
+    with pytest.raises(NonRetryableError):
+        downloader(RecordingSession()).download(url.replace('src.mp4', 'gone.mp4'), tmp_path / 'out.mp4')
+
+
+def test_hasher_accepts_chunks_out_of_order(tmp_path):
+    data = random.Random(1).randbytes(200_000)
+    path = tmp_path / 'f'
+    path.write_bytes(data)
+    chunks = [(off, data[off:off + 7_000]) for off in range(0, len(data), 7_000)]
+    random.Random(2).shuffle(chunks)
+    hasher = ContentHasher(path)
+    for off, chunk in chunks[:-3]:
+        hasher.update(off, chunk)
+    # The last few chunks are never reported: finish() reads them back from disk
+    assert hasher.finish(len(data)) == hashlib.sha256(data).hexdigest()
+
+
+def test_hasher_mark_written_merges_extents(tmp_path):
+    data = os.urandom(50_000)
+    path = tmp_path / 'f'
+    path.write_bytes(data)
+    hasher = ContentHasher(path)
+    hasher.mark_written(20_000, 30_000)
+    hasher.mark_written(10_000, 20_000)
+    hasher.update(30_000, data[30_000:])
+    hasher.update(0, data[:10_000])
+    assert hasher.finish(len(data)) == hashlib.sha256(data).hexdigest()
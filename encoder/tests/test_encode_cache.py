@@ -0,0 +1,135 @@
+import subprocess
+
+import boto3
+import pytest
+
+from bench.servers import MediaServer
+from conftest import requires_ffmpeg
+from encode_cache import S3CacheIndex, SqliteCacheIndex, cache_key
+
+SHA = 'a' * 64
+
+
+def test_cache_key_is_canonical():
+    assert cache_key(SHA, {'a': 1, 'b': [1, 2]}) == cache_key(SHA, {'b': [1, 2], 'a': 1})
+    assert cache_key(SHA, {'a': 1}) != cache_key('b' * 64, {'a': 1})
+    assert cache_key(SHA, {'a': 1}) != cache_key(SHA, {'a': 2})
+
+
+def test_sqlite_index_round_trip(tmp_path):
+    index = SqliteCacheIndex(tmp_path / 'cache.sqlite3')
+    assert index.get('k') is None
+    index.put('k', {'key': 'videos/a/abc.mp4'})
+    assert SqliteCacheIndex(tmp_path / 'cache.sqlite3').get('k') == {'key': 'videos/a/abc.mp4'}
+    index.delete('k')
+    assert index.get('k') is None
+
+
+def test_s3_index_round_trip(s3):
+    index = S3CacheIndex(boto3.client('s3', region_name='us-east-1'), s3, prefix='/encode-cache/')
+    assert index.get('abcd') is None
+    index.put('abcd', {'key': 'videos/a/abc.mp4'})
+    assert index.get('abcd') == {'key': 'videos/a/abc.mp4'}
+    keys = [o['Key'] for o in boto3.client('s3', region_name='us-east-1').list_objects_v2(Bucket=s3)['Contents']]
+    assert keys == ['encode-cache/ab/abcd.json']
+    index.delete('abcd')
+    assert index.get('abcd') is None
+
+
+@pytest.fixture
+def cached_encoder(encoder_env, s3):
+    from video_encoder import VideoEncoder
+
+    encoder_env.setenv('ENCODE_CACHE_ENABLED', 'true')
+    return VideoEncoder()
+
+
+def job(encoder, **options):
+    from video_encoder import JobContext
+
+    ctx = JobContext({'video_code': 'abc', 'encoding_options': dict({'resolution': '720p'}, **options)},
+                     encoder.temp_dir)
+    ctx.content_sha256 = SHA
+    return ctx
+
+
+def test_encode_cache_is_off_by_default(encoder_env, s3):
+    from video_encoder import VideoEncoder
+
+    assert VideoEncoder().encode_cache is None
+
+
+def test_fingerprint_uses_the_requested_options(cached_encoder):
+    fast, slow = job(cached_encoder), job(cached_encoder)
+    fast.preset, slow.preset = 'veryfast', 'slow'
+    # The backlog policy's pick does not split the cache ...
+    assert 'preset' not in cached_encoder._encode_fingerprint(fast)['options']
+    assert cache_key(SHA, cached_encoder._encode_fingerprint(fast)) == \
+        cache_key(SHA, cached_encoder._encode_fingerprint(slow))
+    # ... a preset the job asks for does
+    assert cache_key(SHA, cached_encoder._encode_fingerprint(job(cached_encoder, preset='slow'))) != \
+        cache_key(SHA, cached_encoder._encode_fingerprint(slow))
+
+    # Per-title picks stay out of the key, its settings go in; storage layout never does
+    tuned = job(cached_encoder, per_title=True, storage_config={'videos': 'v'})
+    tuned.complexity = {'crf': 21, 'maxrate': '1800k'}
+    fingerprint = cached_encoder._encode_fingerprint(tuned)
+    assert fingerprint['options'] == {'resolution': '720p', 'per_title': True}
+    assert fingerprint['per_title'] and cached_encoder._encode_fingerprint(job(cached_encoder))['per_title'] is None
+
+
+def test_cache_hit_miss_and_stale_entry(cached_encoder, s3):
+    ctx = job(cached_encoder)
+    assert cached_encoder._cached_encode(ctx) is None
+    key = ctx.cache_key
+
+    boto3.client('s3', region_name='us-east-1').put_object(Bucket=s3, Key='videos/x/xyz.mp4', Body=b'mp4')
+    cached_encoder.encode_cache.put(key, {'key': 'videos/x/xyz.mp4',
+                                          'report': {'encode_path': 'encode', 'encode_seconds': 12}})
+    hit = job(cached_encoder)
+    report = cached_encoder._cached_encode(hit)
+    assert report == {'encode_path': 'encode', 'encode_cache': 'hit', 'cached_from': 'videos/x/xyz.mp4'}
+    assert hit.cache_entry['key'] == 'videos/x/xyz.mp4'
+
+    # The cached output was deleted: the entry is dropped and the job encodes
+    boto3.client('s3', region_name='us-east-1').delete_object(Bucket=s3, Key='videos/x/xyz.mp4')
+    assert cached_encoder._cached_encode(job(cached_encoder)) is None
+    assert cached_encoder.encode_cache.get(key) is None
+    assert cached_encoder.metrics.encode_cache.value(result='hit') == 1
+    assert cached_encoder.metrics.encode_cache.value(result='miss') == 2
+
+
+def test_cache_hit_skips_the_per_title_analysis(cached_encoder, s3, monkeypatch):
+    def analyze(*args):
+        raise AssertionError('analysed a cached encode')
+
+    monkeypatch.setattr(cached_encoder, 'analyze_complexity', analyze)
+    ctx = job(cached_encoder, per_title=True)
+    ctx.input_file.parent.mkdir(parents=True, exist_ok=True)
+    ctx.input_file.write_bytes(b'source')
+    boto3.client('s3', region_name='us-east-1').put_object(Bucket=s3, Key='videos/x/xyz.mp4', Body=b'mp4')
+    cached_encoder.encode_cache.put(cache_key(SHA, cached_encoder._encode_fingerprint(ctx)),
+                                    {'key': 'videos/x/xyz.mp4', 'report': {'encode_path': 'encode'}})
+
+    cached_encoder._stage_analyze(ctx)
+    assert ctx.complexity is None and ctx.cache_entry['key'] == 'videos/x/xyz.mp4'
+    assert cached_encoder._cached_encode(ctx)['cached_from'] == 'videos/x/xyz.mp4'
+    assert cached_encoder.metrics.encode_cache.value(result='hit') == 1  # looked up once
+
+
+@requires_ffmpeg
+def test_uploaded_thumbnail_is_a_plain_fetch(encoder, tmp_path):
+    www = tmp_path / 'www'
+    www.mkdir()
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=640x360', '-frames:v', '1',
+                    str(www / 'thumb.jpg')], check=True)
+    server = MediaServer(www).start()
+    try:
+        thumb = encoder._process_uploaded_thumbnail({'uploaded_thumbnail_url': f"{server.base_url}/thumb.jpg"},
+                                                    'abc', False)
+    finally:
+        server.stop()
+    assert thumb is not None and thumb.name == 'abc_thumb_1.jpg' and thumb.stat().st_size > 0
+    # Not a source download: nothing hashed, nothing in the download metrics
+    assert encoder.metrics.download_seconds.snapshot() == {}
+    assert not (encoder.temp_dir / 'abc_uploaded_src.jpg').exists()
@@ -0,0 +1,96 @@
+import pytest
+
+from conftest import make_clip, requires_ffmpeg
+from ffmpeg_runner import FfmpegProgress, ProgressAggregator, run_ffmpeg, with_progress
+from local_queue import LocalQueueServer
+
+
+def test_progress_block_parsing():
+    p = FfmpegProgress(duration=100)
+    p.update({'frame': '250', 'fps': '50.0', 'total_size': '1024', 'out_time_us': '10000000',
+              'out_time': '00:00:10.000000', 'speed': '2.5x', 'progress': 'continue'})
+    assert (p.out_time, p.frame, p.fps, p.speed, p.total_size) == (10.0, 250, 50.0, 2.5, 1024)
+    assert p.percent == 10.0 and p.eta == 36.0 and not p.finished
+    # N/A fields (e.g. before the first frame is muxed) keep the previous values
+    p.update({'out_time_us': 'N/A', 'out_time': '00:00:20.500000', 'speed': 'N/A', 'fps': 'x',
+              'progress': 'end'})
+    assert (p.out_time, p.speed, p.fps) == (20.5, 2.5, 50.0)
+    assert p.finished and p.eta == 0.0
+    assert p.to_dict()['percent'] == 20.5
+
+
+def test_unknown_duration_has_no_percent_or_eta():
+    p = FfmpegProgress()
+    p.update({'out_time': '00:01:00.000000', 'speed': '1x', 'progress': 'continue'})
+    assert p.out_time == 60 and p.percent is None and p.eta is None
+
+
+def test_with_progress_inserts_flags_once():
+    cmd = with_progress(['ffmpeg', '-i', 'in.mp4', 'out.mp4'])
+    assert cmd == ['ffmpeg', '-progress', 'pipe:1', '-nostats', '-i', 'in.mp4', 'out.mp4']
+    assert with_progress(cmd) == cmd
+
+
+def test_aggregator_sums_segments():
+    seen = []
+    agg = ProgressAggregator(20.0, seen.append)
+    a, b = FfmpegProgress(10), FfmpegProgress(10)
+    a.update({'out_time_us': '4000000', 'frame': '100', 'speed': '2x', 'progress': 'continue'})
+    b.update({'out_time_us': '10000000', 'frame': '250', 'speed': '3x', 'progress': 'end'})
+    agg.part('seg0')(a)
+    agg.part('seg1')(b)
+    total = seen[-1]
+    assert (total.out_time, total.frame, total.speed) == (14.0, 350, 2.0)  # finished parts add no speed
+    assert total.percent == 70.0
+
+
+@requires_ffmpeg
+def test_run_ffmpeg_streams_progress_and_keeps_a_bounded_stderr_tail(tmp_path):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=2)
+    updates = []
+    res = run_ffmpeg(['ffmpeg', '-y', '-v', 'verbose', '-i', str(clip), '-c:v', 'libx264', '-preset', 'ultrafast',
+                      str(tmp_path / 'out.mp4')], duration=2.0, on_progress=lambda p: updates.append(p.to_dict()),
+                     stderr_lines=5)
+    assert res.returncode == 0
+    assert len(res.stderr_tail) <= 5
+    assert updates and res.progress.finished
+    assert updates[-1]['percent'] == pytest.approx(100.0, abs=5)
+
+
+@requires_ffmpeg
+def test_failed_run_reports_the_error_in_the_tail(tmp_path):
+    res = run_ffmpeg(['ffmpeg', '-i', str(tmp_path / 'missing.mp4'), str(tmp_path / 'out.mp4')])
+    assert res.returncode != 0
+    assert 'No such file' in res.stderr
+
+
+def test_progress_is_recorded_and_pushed_to_the_api(encoder_env):
+    from video_encoder import VideoEncoder
+
+    server = LocalQueueServer().start()
+    try:
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        server.queue.add_job('abc', 'http://example.com/abc.mp4')
+        encoder = VideoEncoder()
+        encoder.progress_push_interval = 60
+        token = encoder.mark_as_processing('abc')['lease_token']
+        encoder.leases.track('abc', token, 300)
+        report = encoder._progress_reporter('abc', 10.0)
+
+        p = FfmpegProgress(10.0)
+        p.update({'out_time_us': '2500000', 'speed': '1x', 'progress': 'continue'})
+        report(p)
+        assert encoder.job_progress['abc']['percent'] == 25.0
+        assert server.queue.status('abc')['progress']['percent'] == 25.0
+
+        p.update({'out_time_us': '5000000', 'speed': '1x', 'progress': 'continue'})
+        report(p)  # inside the push interval: recorded locally only
+        assert encoder.job_progress['abc']['percent'] == 50.0
+        assert server.queue.status('abc')['progress']['percent'] == 25.0
+
+        p.update({'out_time_us': '10000000', 'speed': '1x', 'progress': 'end'})
+        report(p)  # the final block is always pushed
+        assert server.queue.status('abc')['progress']['percent'] == 100.0
+        encoder.leases.release('abc')
+    finally:
+        server.stop()
@@ -0,0 +1,62 @@
+import sys
+import time
+
+import pytest
+
+from errors import FfmpegStallError, FfmpegTimeoutError, RetryableError
+from ffmpeg_runner import run_ffmpeg
+
+
+def fake_ffmpeg(tmp_path, body):
+    """A stand-in for the ffmpeg binary: run_ffmpeg only needs progress blocks on stdout."""
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f"#!{sys.executable}\nimport sys, time\n{body}\n")
+    script.chmod(0o755)
+    return [str(script), '-i', 'in.mp4', 'out.mp4']
+
+
+def test_stalled_output_is_killed(tmp_path):
+    cmd = fake_ffmpeg(tmp_path, "print('frame=1\\nout_time_us=40000\\nprogress=continue', flush=True)\n"
+                                "print('stuck on input', file=sys.stderr, flush=True)\n"
+                                "time.sleep(60)")
+    started = time.monotonic()
+    with pytest.raises(FfmpegStallError) as exc:
+        run_ffmpeg(cmd, duration=10, stall_timeout=1)
+    assert time.monotonic() - started < 10
+    assert 'stalled' in str(exc.value) and 'stuck on input' in str(exc.value)
+    assert isinstance(exc.value, RetryableError)
+
+
+def test_advancing_output_is_not_a_stall_but_still_times_out(tmp_path):
+    cmd = fake_ffmpeg(tmp_path, "for i in range(1, 600):\n"
+                                "    print(f'frame={i}\\nout_time_us={i * 40000}\\nprogress=continue', flush=True)\n"
+                                "    time.sleep(0.1)")
+    with pytest.raises(FfmpegTimeoutError) as exc:
+        run_ffmpeg(cmd, duration=60, timeout=2.5, stall_timeout=1)
+    assert 'timeout' in str(exc.value)
+    assert isinstance(exc.value, RetryableError)
+
+
+def test_clean_exit_within_limits(tmp_path):
+    cmd = fake_ffmpeg(tmp_path, "print('frame=25\\nout_time_us=1000000\\nprogress=end', flush=True)")
+    res = run_ffmpeg(cmd, duration=1, timeout=30, stall_timeout=5)
+    assert res.returncode == 0 and res.progress.finished
+
+
+@pytest.mark.parametrize('duration, expected', [
+    (None, 7200.0),     # unknown duration: the fixed default
+    (10.0, 300.0),      # short clips get the floor
+    (3600.0, 14400.0),  # otherwise duration x factor
+])
+def test_timeout_scales_with_duration(encoder, duration, expected):
+    assert encoder._ffmpeg_timeout(duration) == expected
+
+
+def test_timeout_factor_zero_uses_default(encoder):
+    encoder.ffmpeg_timeout_factor = 0
+    assert encoder._ffmpeg_timeout(3600.0) == encoder.ffmpeg_timeout_default
+
+
+def test_watchdog_errors_are_categorised(encoder):
+    assert encoder._categorize_error(FfmpegStallError('x')) == 'ffmpeg_stalled'
+    assert encoder._categorize_error(FfmpegTimeoutError('x')) == 'ffmpeg_timeout'
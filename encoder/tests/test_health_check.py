@@ -0,0 +1,43 @@
+import pytest
+
+from metrics import EncoderMetrics, MetricsServer, parse_samples
+
+
+@pytest.fixture
+def worker_metrics():
+    """A stand-in for a running pipeline worker's /metrics endpoint."""
+    metrics = EncoderMetrics()
+    metrics.gauge('encoder_jobs_in_flight', 'Jobs in flight.', lambda: 3)
+    metrics.gauge('encoder_pipeline_queued_jobs', 'Queued per stage.',
+                  lambda: {('download', ): 1, ('encode', ): 2}, labels=['stage'])
+    metrics.stage_active.inc(stage='encode')
+    server = MetricsServer(metrics.registry, '127.0.0.1', 0).start()
+    yield server
+    server.stop()
+
+
+def test_parse_samples_reads_labels_and_values():
+    samples = parse_samples('# HELP x X.\n# TYPE x gauge\nx 2\ny{stage="a",kind="b\\"c"} 1.5\n\n')
+    assert samples == {('x', ()): 2.0, ('y', (('kind', 'b"c'), ('stage', 'a'))): 1.5}
+
+
+def test_parse_samples_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_samples('not a sample line at all\n')
+
+
+def test_health_check_reports_running_worker_pipeline(encoder, worker_metrics):
+    encoder.metrics_port = worker_metrics.port
+    status = encoder.health_check()
+    assert status['checks']['worker_metrics'] == 'ok'
+    assert status['worker']['jobs_in_flight'] == 3
+    assert status['worker']['stages']['download'] == {'queued': 1}
+    assert status['worker']['stages']['encode'] == {'queued': 2, 'active': 1}
+
+
+def test_health_check_flags_unreachable_worker(encoder, worker_metrics):
+    encoder.metrics_port = worker_metrics.port
+    worker_metrics.stop()
+    status = encoder.health_check()
+    assert status['checks']['worker_metrics'] == 'unreachable'
+    assert 'worker' not in status
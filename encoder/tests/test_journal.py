@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import time
+
+from journal import JobJournal, file_sha256, stale_journals
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def journal(tmp_path, fingerprint='fp'):
+    return JobJournal(tmp_path, 'abc', fingerprint)
+
+
+def record_three_stages(tmp_path):
+    src = write(tmp_path / 'abc.mp4', b'source')
+    thumb = write(tmp_path / 'abc_thumb_1.jpg', b'thumb')
+    out = write(tmp_path / 'abc_encoded.mp4', b'encoded')
+    j = journal(tmp_path)
+    j.record('download', {'content_sha256': hashlib.sha256(b'source').hexdigest()},
+             {src: hashlib.sha256(b'source').hexdigest()})
+    j.record('thumbnails', {'thumbnail_files': [thumb.name]}, {src: None, thumb: None})
+    j.record('encode', {'encode_report': {'encode_path': 'encode'}}, {src: None, thumb: None, out: None})
+    return src, thumb, out
+
+
+def test_resume_from_the_last_stage(tmp_path):
+    record_three_stages(tmp_path)
+    stages, state = journal(tmp_path).resume()
+    assert stages == ['download', 'thumbnails', 'encode']
+    assert state == {'encode_report': {'encode_path': 'encode'}}
+
+
+def test_artifacts_that_do_not_verify_fall_back_to_an_earlier_stage(tmp_path):
+    _, _, out = record_three_stages(tmp_path)
+    write(out, b'ENCODED')  # same size, different bytes: half-written or corrupted
+    j = journal(tmp_path)
+    stages, state = j.resume()
+    assert stages == ['download', 'thumbnails'] and state == {'thumbnail_files': ['abc_thumb_1.jpg']}
+    # The journal was rewritten from the resume point on
+    doc = json.loads(j.path.read_text())
+    assert [s['name'] for s in doc['stages']] == stages and 'abc_encoded.mp4' not in doc['checksums']
+
+
+def test_missing_source_means_starting_over(tmp_path):
+    src, _, _ = record_three_stages(tmp_path)
+    src.unlink()
+    j = journal(tmp_path)
+    assert j.resume() is None and not j.path.exists()
+
+
+def test_other_source_or_settings_discard_the_journal(tmp_path):
+    record_three_stages(tmp_path)
+    j = journal(tmp_path, fingerprint='other')
+    assert j.resume() is None and not j.path.exists()
+
+
+def test_unreadable_journal_is_discarded(tmp_path):
+    j = journal(tmp_path)
+    j.path.write_text('{not json')
+    assert j.resume() is None and not j.path.exists()
+    assert journal(tmp_path).resume() is None  # and no journal at all is simply a fresh start
+
+
+def test_unchanged_files_are_not_rehashed(tmp_path, monkeypatch):
+    src = write(tmp_path / 'abc.mp4', b'source')
+    j = journal(tmp_path)
+    j.record('download', {}, {src: None})
+    import journal as journal_module
+    monkeypatch.setattr(journal_module, 'file_sha256', lambda path: (_ for _ in ()).throw(AssertionError(path)))
+    j.record('thumbnails', {}, {src: None})
+    assert j.checksums['abc.mp4']['sha256'] == file_sha256(src)
+
+
+def test_stale_journals_are_found_with_their_artifacts(tmp_path):
+    record_three_stages(tmp_path)
+    fresh = JobJournal(tmp_path, 'new', 'fp')
+    fresh.record('download', {}, {})
+    old = time.time() - 7200
+    os.utime(tmp_path / 'abc.journal.json', (old, old))
+    found = stale_journals(tmp_path, 3600)
+    assert [(p.name, sorted(a.name for a in arts)) for p, arts in found] == [
+        ('abc.journal.json', ['abc.mp4', 'abc_encoded.mp4', 'abc_thumb_1.jpg'])]
+
+
+def test_journal_is_off_by_default(encoder):
+    from video_encoder import JobContext
+
+    ctx = JobContext({'video_code': 'abc', 'input_file_url': 'http://example.com/abc.mp4'}, encoder.temp_dir)
+    encoder._open_journal(ctx)
+    assert ctx.journal is None
+
+
+def test_reclaimed_job_resumes_from_its_journal(encoder_env):
+    from video_encoder import JobContext, VideoEncoder
+
+    encoder_env.setenv('JOB_JOURNAL_ENABLED', 'true')
+    encoder = VideoEncoder()
+    job = {'video_code': 'abc', 'input_file_url': 'http://example.com/abc.mp4?sig=1', 'encoding_options': {}}
+    first = JobContext(job, encoder.temp_dir)
+    encoder._open_journal(first)
+    write(first.input_file, b'source')
+    first.content_sha256 = hashlib.sha256(b'source').hexdigest()
+    first.complexity = {'crf': 22, 'maxrate': '2000k'}
+    encoder._journal_stage(first, 'download')
+    encoder._journal_stage(first, 'analyze')
+
+    # The worker died; the job is claimed again with a fresh presigned URL
+    retry = JobContext(dict(job, input_file_url='http://example.com/abc.mp4?sig=2'), encoder.temp_dir)
+    encoder._open_journal(retry)
+    assert retry.resumed_stages == {'download', 'analyze'}
+    assert retry.content_sha256 == first.content_sha256 and retry.complexity == first.complexity
+
+    # Stale leftovers nobody resumed are swept with their artifacts
+    encoder.journal_max_age_hours = 0
+    old = time.time() - 60
+    os.utime(retry.journal.path, (old, old))
+    encoder.sweep_journals()
+    assert not retry.journal.path.exists() and not retry.input_file.exists()
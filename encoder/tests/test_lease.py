@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from errors import LeaseLostError
+from lease import LeaseKeeper
+from local_queue import LocalQueueServer
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class FakeApi:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def renew(self, video_code, token, lease_seconds):
+        with self.lock:
+            self.calls.append((video_code, token, lease_seconds))
+            outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def test_lease_lost_on_refused_renewal():
+    api = FakeApi([LeaseLostError('abc: 409 Lease lost')])
+    keeper = LeaseKeeper(api.renew, interval=1)
+    keeper.track('abc', 'tok', 300)
+    assert keeper.active() == 1 and not keeper.is_lost('abc')
+    assert wait_until(lambda: keeper.is_lost('abc'))
+    assert api.calls == [('abc', 'tok', 300)]
+    assert keeper.active() == 0
+    keeper.release('abc')
+
+
+def test_transient_errors_keep_renewing():
+    api = FakeApi([ConnectionError('api down'), True])
+    keeper = LeaseKeeper(api.renew, interval=1)
+    keeper.track('abc', 'tok', 300)
+    assert wait_until(lambda: len(api.calls) >= 2)
+    assert not keeper.is_lost('abc')
+    keeper.release('abc')
+    assert keeper.token('abc') is None
+
+
+@pytest.fixture
+def api(encoder_env):
+    server = LocalQueueServer().start()
+    encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+    yield server
+    server.stop()
+
+
+def test_renew_lease_against_the_queue_api(api):
+    from video_encoder import VideoEncoder
+
+    api.queue.add_job('abc', 'http://example.com/abc.mp4')
+    encoder = VideoEncoder()
+    token = encoder.mark_as_processing('abc')['lease_token']
+    assert encoder.renew_lease('abc', token, 120)
+    with pytest.raises(LeaseLostError):
+        encoder.renew_lease('abc', 'stale', 120)
+    with pytest.raises(LeaseLostError):
+        encoder.renew_lease('missing', token, 120)
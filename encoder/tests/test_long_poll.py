@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from local_queue import LocalQueueServer
+
+
+@pytest.fixture
+def serve(encoder_env):
+    servers = []
+
+    def start(**kwargs):
+        server = LocalQueueServer(**kwargs).start()
+        servers.append(server)
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_long_poll_is_used_when_the_api_echoes_wait(serve):
+    from video_encoder import VideoEncoder
+
+    serve(long_poll=True)
+    encoder = VideoEncoder()
+    started = time.monotonic()
+    assert encoder.claim_jobs(1, wait=1) == []
+    assert time.monotonic() - started >= 0.9
+    assert encoder._long_poll_supported
+
+
+def test_api_without_long_poll_falls_back_to_polling(serve):
+    from video_encoder import VideoEncoder
+
+    serve(long_poll=False)
+    encoder = VideoEncoder()
+    encoder._long_poll_supported = True
+    started = time.monotonic()
+    assert encoder.claim_jobs(1, wait=5) == []
+    assert time.monotonic() - started < 2
+    assert not encoder._long_poll_supported
+
+
+def test_long_poll_returns_as_soon_as_a_job_arrives(serve):
+    from video_encoder import VideoEncoder
+
+    server = serve(long_poll=True)
+    server.queue.add_job('abc', 'http://example.com/abc.mp4')
+    started = time.monotonic()
+    assert [j['video_code'] for j in VideoEncoder().claim_jobs(1, wait=10)] == ['abc']
+    assert time.monotonic() - started < 2
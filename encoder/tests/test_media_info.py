@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from conftest import make_clip, requires_ffmpeg
+from media_info import MediaInfo, MediaProbe
+
+
+def test_media_info_parses_first_video_and_audio_stream():
+    info = MediaInfo({
+        'format': {'duration': '12.5', 'bit_rate': '2000000', 'size': '3125000', 'format_name': 'mov,mp4'},
+        'streams': [
+            {'codec_type': 'video', 'codec_name': 'mjpeg'},  # cover art: no dimensions
+            {'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720, 'pix_fmt': 'yuv420p',
+             'avg_frame_rate': '30000/1001'},
+            {'codec_type': 'audio', 'codec_name': 'aac', 'bit_rate': '128000', 'channels': 2},
+        ],
+    })
+    assert (info.width, info.height, info.video_codec) == (1280, 720, 'h264')
+    assert round(info.fps, 2) == 29.97
+    assert info.duration_seconds == 12
+    assert info.audio_codec == 'aac' and info.audio_bitrate == 128000
+    # No stream bitrate: container rate minus audio
+    assert info.estimated_video_bitrate == 2000000 - 128000
+
+
+def test_media_info_tolerates_missing_fields():
+    info = MediaInfo({'format': {'duration': 'N/A'}, 'streams': []})
+    assert info.duration is None and not info.has_video and not info.has_audio
+    assert info.estimated_video_bitrate is None
+
+
+def test_probe_of_missing_file_is_none(tmp_path):
+    assert MediaProbe().probe(tmp_path / 'nope.mp4') is None
+
+
+@requires_ffmpeg
+def test_probe_is_cached_by_path_size_and_mtime(tmp_path):
+    clip = make_clip(tmp_path / 'a.mp4', seconds=1)
+    observed = []
+    probe = MediaProbe(observe=observed.append)
+
+    first = probe.probe(clip)
+    assert first.has_video and first.width == 320
+    assert probe.probe(clip) is first
+    assert probe.probe_count == 1 and len(observed) == 1
+
+    # Same path, new mtime: probed again
+    st = os.stat(clip)
+    os.utime(clip, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert probe.probe(clip) is not first
+    assert probe.probe_count == 2
+
+    # Same path, rewritten with another size
+    make_clip(clip, seconds=1, size='160x120')
+    assert probe.probe(clip).width == 160
+    assert probe.probe_count == 3
+
+
+@requires_ffmpeg
+def test_forget_and_lru_eviction(tmp_path):
+    a = make_clip(tmp_path / 'a.mp4', seconds=1, audio=False)
+    b = str(tmp_path / 'b.mp4')
+    shutil.copy(a, b)
+    probe = MediaProbe(max_entries=1)
+    probe.probe(a)
+    probe.probe(b)  # evicts a
+    probe.probe(a)
+    assert probe.probe_count == 3
+    probe.forget(a)
+    probe.probe(a)
+    assert probe.probe_count == 4
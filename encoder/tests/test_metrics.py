@@ -0,0 +1,116 @@
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import CONTENT_TYPE, MetricsRegistry, MetricsServer, parse_samples
+
+# Text exposition format 0.0.4, checked line by line independently of parse_samples
+NAME = r'[a-zA-Z_:][a-zA-Z0-9_:]*'
+LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\n"])*"'
+VALUE = r'(?:[+-]?Inf|NaN|[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)'
+SAMPLE = re.compile(rf'^({NAME})(?:\{{{LABEL}(?:,{LABEL})*\}})? {VALUE}$')
+HELP = re.compile(rf'^# HELP ({NAME}) .*$')
+TYPE = re.compile(rf'^# TYPE ({NAME}) (counter|gauge|histogram|summary|untyped)$')
+SUFFIXES = {'histogram': ('_bucket', '_sum', '_count'), 'counter': ('',), 'gauge': ('',)}
+
+
+def assert_valid_exposition(text):
+    assert text.endswith('\n')
+    families, current, kind = set(), None, None
+    for line in text.rstrip('\n').split('\n'):
+        if m := HELP.match(line):
+            current, kind = m.group(1), None
+            assert current not in families, f"{current} rendered twice"
+            families.add(current)
+        elif m := TYPE.match(line):
+            assert m.group(1) == current and kind is None, f"TYPE out of place: {line}"
+            kind = m.group(2)
+        else:
+            m = SAMPLE.match(line)
+            assert m, f"malformed line: {line!r}"
+            assert kind and m.group(1) in {current + s for s in SUFFIXES[kind]}, f"stray sample: {line}"
+    return families
+
+
+@pytest.fixture
+def registry():
+    r = MetricsRegistry()
+    r.counter('jobs_total', 'Jobs.', ['outcome']).inc(outcome='ok')
+    r.gauge('queue_depth', 'Depth.').set(3.5)
+    h = r.histogram('stage_seconds', 'Stage time.', ['stage'], buckets=(1, 10, 100))
+    for value in (0.5, 5, 50, 500):
+        h.observe(value, stage='encode')
+    return r
+
+
+def test_render_is_valid_exposition(registry):
+    text = registry.render()
+    assert assert_valid_exposition(text) == {'jobs_total', 'queue_depth', 'stage_seconds'}
+    assert '# TYPE stage_seconds histogram' in text
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_inf(registry):
+    samples = parse_samples(registry.render())
+    bucket = lambda le: samples[('stage_seconds_bucket', (('le', le), ('stage', 'encode')))]
+    assert [bucket(le) for le in ('1', '10', '100', '+Inf')] == [1, 2, 3, 4]
+    assert samples[('stage_seconds_count', (('stage', 'encode'),))] == 4
+    assert samples[('stage_seconds_sum', (('stage', 'encode'),))] == 555.5
+
+
+def test_label_values_are_escaped_and_round_trip():
+    r = MetricsRegistry()
+    tricky = 'a "quoted" \\path\nnext'
+    r.counter('errors_total', 'Errors.', ['message']).inc(2, message=tricky)
+    text = r.render()
+    assert 'message="a \\"quoted\\" \\\\path\\nnext"' in text
+    assert_valid_exposition(text)
+    assert parse_samples(text) == {('errors_total', (('message', tricky),)): 2}
+
+
+def test_gauge_callbacks_render_at_scrape_time():
+    r = MetricsRegistry()
+    state = {('encode',): 2, ('upload',): 0}
+    r.gauge('stage_active', 'Active.', ['stage'], fn=lambda: state)
+    r.gauge('broken', 'Fails.', fn=lambda: 1 / 0)
+    samples = parse_samples(r.render())
+    assert samples[('stage_active', (('stage', 'encode'),))] == 2
+    state[('encode',)] = 1
+    assert parse_samples(r.render())[('stage_active', (('stage', 'encode'),))] == 1
+    assert not any(name == 'broken' for name, _ in samples)
+    assert_valid_exposition(r.render())
+
+
+def test_metric_misuse_is_rejected():
+    r = MetricsRegistry()
+    c = r.counter('c_total', 'C.', ['a'])
+    with pytest.raises(ValueError):
+        c.inc(-1, a='x')
+    with pytest.raises(ValueError):
+        c.inc(b='x')
+    with pytest.raises(ValueError):
+        r.gauge('c_total', 'Duplicate.')
+
+
+def test_worker_registry_renders_valid_exposition(encoder):
+    m = encoder.metrics
+    m.stage_seconds.observe(12.5, stage='encode')
+    m.realtime_factor.observe(3.2, encode_path='encode')
+    m.api_requests.inc(endpoint='claim', status='200')
+    families = assert_valid_exposition(m.registry.render())
+    assert {'encoder_stage_duration_seconds', 'encoder_jobs_in_flight', 'encoder_api_requests_total'} <= families
+
+
+def test_metrics_server(registry):
+    server = MetricsServer(registry, host='127.0.0.1').start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as r:
+            assert r.headers['Content-Type'] == CONTENT_TYPE
+            body = r.read().decode()
+        assert body == registry.render()
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+        assert exc.value.code == 404
+    finally:
+        server.stop()
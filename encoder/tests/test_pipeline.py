@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import CpuBudget, Pipeline, Stage
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_items_run_through_every_stage_in_order():
+    seen = []
+    done = []
+    stages = [Stage('a', lambda item: seen.append(('a', item))), Stage('b', lambda item: seen.append(('b', item)))]
+    pipeline = Pipeline(stages, on_success=done.append)
+    pipeline.start()
+    try:
+        for i in range(3):
+            assert pipeline.submit(i)
+        assert pipeline.wait_idle(timeout=5)
+    finally:
+        pipeline.stop()
+    assert sorted(done) == [0, 1, 2]
+    for i in range(3):
+        assert seen.index(('a', i)) < seen.index(('b', i))
+    assert pipeline.queue_depths()['b']['processed'] == 3
+
+
+def test_full_downstream_stage_blocks_upstream():
+    gate = threading.Event()
+    stages = [
+        Stage('fast', lambda item: None, workers=1, queue_size=1),
+        Stage('slow', lambda item: gate.wait(5), workers=1, queue_size=1),
+    ]
+    pipeline = Pipeline(stages, max_in_flight=10)
+    pipeline.start()
+    try:
+        for i in range(4):
+            assert pipeline.submit(i, timeout=1)
+        # slow: one running, one queued; fast: one finished but blocked handing over, one queued
+        assert wait_until(lambda: pipeline.queue_depths()['slow']['active'] == 1
+                          and pipeline.queue_depths()['slow']['queued'] == 1
+                          and pipeline.queue_depths()['fast']['queued'] == 1)
+        assert not pipeline.has_capacity()
+        assert pipeline.submit(99, timeout=0.2) is False
+        assert pipeline.in_flight() == 4
+        gate.set()
+        assert pipeline.wait_idle(timeout=5)
+    finally:
+        gate.set()
+        pipeline.stop()
+    assert pipeline.in_flight() == 0
+
+
+def test_max_in_flight_bounds_submissions():
+    gate = threading.Event()
+    pipeline = Pipeline([Stage('only', lambda item: gate.wait(5), queue_size=5)], max_in_flight=2)
+    pipeline.start()
+    try:
+        assert pipeline.submit(1) and pipeline.submit(2)
+        assert pipeline.free_slots() == 0
+        assert pipeline.submit(3, block=False) is False
+        assert pipeline.in_flight() == 2
+        gate.set()
+        assert pipeline.wait_idle(timeout=5)
+        assert pipeline.free_slots() == 2
+    finally:
+        gate.set()
+        pipeline.stop()
+
+
+def test_failure_calls_hooks_and_skips_later_stages():
+    failures = []
+    finished = []
+    later = []
+
+    def boom(item):
+        raise RuntimeError(f"bad {item}")
+
+    pipeline = Pipeline([Stage('first', boom), Stage('second', later.append)],
+                        on_failure=lambda item, exc, stage: failures.append((item, str(exc), stage)),
+                        on_finish=finished.append)
+    pipeline.start()
+    try:
+        pipeline.submit('x')
+        assert pipeline.wait_idle(timeout=5)
+    finally:
+        pipeline.stop()
+    assert failures == [('x', 'bad x', 'first')]
+    assert finished == ['x']
+    assert later == []
+    assert pipeline.queue_depths()['first']['failed'] == 1
+
+
+def test_cpu_budget_limits_concurrent_cpu_stages():
+    budget = CpuBudget(2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def encode(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(item)
+
+    pipeline = Pipeline([Stage('encode', encode, workers=4, queue_size=8, cpu_cost=2)], cpu_budget=budget)
+    pipeline.start()
+    try:
+        for i in range(4):
+            pipeline.submit(i)
+        assert pipeline.wait_idle(timeout=5)
+    finally:
+        pipeline.stop()
+    assert max(peak) == 1
+    assert budget.used == 0
+
+
+def test_cpu_budget_caps_cost_at_slots():
+    budget = CpuBudget(2)
+    assert budget.acquire(8) == 2
+    assert budget.used == 2
+    budget.release(2)
+    assert budget.used == 0
+
+
+def test_pipeline_needs_a_stage():
+    with pytest.raises(ValueError):
+        Pipeline([])
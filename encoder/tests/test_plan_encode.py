@@ -0,0 +1,60 @@
+import pytest
+
+from conftest import make_clip, requires_ffmpeg
+from media_info import MediaInfo
+
+
+def media(video=None, audio=None, bit_rate='1500000'):
+    streams = []
+    v = {'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720, 'pix_fmt': 'yuv420p',
+         'bit_rate': '1200000', 'avg_frame_rate': '30/1'}
+    if video is not False:
+        streams.append(dict(v, **(video or {})))
+    a = {'codec_type': 'audio', 'codec_name': 'aac', 'channels': 2, 'bit_rate': '128000'}
+    if audio is not False:
+        streams.append({k: val for k, val in dict(a, **(audio or {})).items() if val is not None})
+    return MediaInfo({'format': {'duration': '60', 'bit_rate': bit_rate}, 'streams': streams})
+
+
+@pytest.mark.parametrize('video, audio, path, plan_audio', [
+    ({}, {}, 'copy', 'copy'),
+    ({}, False, 'copy', 'none'),
+    ({}, {'codec_name': 'mp3'}, 'copy_video', 'aac'),
+    ({}, {'channels': 6}, 'copy_video', 'aac'),
+    ({}, {'bit_rate': '320000'}, 'copy_video', 'aac'),
+    ({}, {'bit_rate': None}, 'copy_video', 'aac'),  # unknown audio rate is not copied
+    ({'codec_name': 'hevc'}, {}, 'encode', 'aac'),
+    ({'pix_fmt': 'yuv420p10le'}, {}, 'encode', 'aac'),
+    ({'width': 3840, 'height': 2160}, {}, 'encode', 'aac'),
+    ({'bit_rate': '9000000'}, {}, 'encode', 'aac'),
+])
+def test_plan_decision_table(encoder, video, audio, path, plan_audio):
+    plan = encoder._plan_encode(media(video, audio), {'bitrate': '2000k'})
+    assert (plan['path'], plan['audio']) == (path, plan_audio)
+    assert bool(plan['reasons']) == (path == 'encode')
+
+
+def test_unknown_video_bitrate_is_encoded(encoder):
+    plan = encoder._plan_encode(media({'bit_rate': None}, False, bit_rate=None), {})
+    assert plan['path'] == 'encode'
+    assert 'unknown bitrate' in plan['reasons']
+
+
+def test_remux_disabled_always_encodes(encoder):
+    encoder.remux_enabled = False
+    assert encoder._plan_encode(media(), {})['path'] == 'encode'
+
+
+def test_geometry_and_rate_control(encoder):
+    plan = encoder._plan_encode(media({'width': 1080, 'height': 1920}), {'resolution': '720p', 'bitrate': '1500k',
+                                                                         'crf': 23, 'preset': 'bogus'})
+    assert (plan['width'], plan['height'], plan['is_vertical']) == (720, 1280, True)
+    assert (plan['crf'], plan['bitrate'], plan['bufsize'], plan['preset']) == ('23', '1500k', '3000k', 'medium')
+
+
+@requires_ffmpeg
+def test_h264_aac_source_is_remuxed(encoder, tmp_path):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=2)
+    report = encoder.encode_video(clip, tmp_path / 'out.mp4', {})
+    assert report['encode_path'] == 'copy'
+    assert encoder.media_probe.probe(tmp_path / 'out.mp4').video_codec == 'h264'
@@ -0,0 +1,112 @@
+import threading
+import time
+
+from local_queue import LocalQueueServer
+from prefetch import PrefetchBuffer
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def make_buffer(tmp_path, fail=(), sizes=None, **kwargs):
+    downloaded = []
+
+    def download(item):
+        if item in fail:
+            raise IOError(f"cannot fetch {item}")
+        (tmp_path / item).write_bytes(b'x' * (sizes or {}).get(item, 10))
+        downloaded.append(item)
+
+    return PrefetchBuffer(download, lambda item: tmp_path / item, **kwargs), downloaded
+
+
+def test_entries_come_back_downloaded_in_order(tmp_path):
+    buffer, downloaded = make_buffer(tmp_path, max_items=2)
+    buffer.put('a')
+    buffer.put('b')
+    assert buffer.free_slots() == 0
+    assert wait_until(lambda: len(downloaded) == 2)
+    first, second = buffer.get(), buffer.get()
+    assert (first.item, first.ready, first.size) == ('a', True, 10)
+    assert second.item == 'b' and second.ready
+    assert downloaded == ['a', 'b']
+    assert buffer.get() is None and buffer.free_slots() == 2
+
+
+def test_failed_prefetch_is_handed_out_with_the_error(tmp_path):
+    buffer, _ = make_buffer(tmp_path, fail={'bad'})
+    buffer.put('bad')
+    assert wait_until(lambda: buffer._entries[0].done.is_set())
+    entry = buffer.get()
+    assert not entry.ready and isinstance(entry.error, IOError)
+
+
+def test_disk_budget_holds_back_the_next_download(tmp_path):
+    buffer, downloaded = make_buffer(tmp_path, sizes={'a': 100, 'b': 100}, max_items=2, disk_budget_bytes=50)
+    buffer.put('a')
+    buffer.put('b')
+    assert wait_until(lambda: downloaded)
+    time.sleep(0.2)
+    assert downloaded == ['a']  # 'a' holds the whole budget until it is consumed
+    assert buffer.get().item == 'a'
+    assert wait_until(lambda: downloaded == ['a', 'b'])
+    assert buffer.get().ready
+
+
+def test_unstarted_entry_is_left_to_the_caller(tmp_path):
+    gate = threading.Event()
+    buffer = PrefetchBuffer(lambda item: gate.wait(5), lambda item: tmp_path / item, max_items=2)
+    buffer.put('slow')
+    buffer.put('next')
+    time.sleep(0.1)
+    gate.set()
+    assert buffer.get().item == 'slow'
+    entry = buffer.get()
+    # Either the thread already fetched it or the caller must (never both)
+    assert entry.item == 'next' and entry.done.is_set()
+
+
+def test_drain_returns_queued_items(tmp_path):
+    gate = threading.Event()
+    buffer = PrefetchBuffer(lambda item: gate.wait(5), lambda item: tmp_path / item, max_items=3)
+    for item in ('a', 'b', 'c'):
+        buffer.put(item)
+    assert buffer.drain() == ['a', 'b', 'c']
+    gate.set()
+    assert len(buffer) == 0
+
+
+def test_claim_jobs_batch_with_leases(encoder_env):
+    from video_encoder import VideoEncoder
+
+    server = LocalQueueServer().start()
+    try:
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        for code in ('a1', 'b2', 'c3'):
+            server.queue.add_job(code, f"http://example.com/{code}.mp4")
+        encoder = VideoEncoder()
+        jobs = encoder.claim_jobs(2)
+        assert [j['video_code'] for j in jobs] == ['a1', 'b2']
+        assert all(j['lease_token'] for j in jobs)
+        assert server.queue.stats()['processing'] == 2
+        assert [j['video_code'] for j in encoder.claim_jobs(5)] == ['c3']
+        assert encoder.claim_jobs(5) == []
+    finally:
+        server.stop()
+
+
+def test_claim_jobs_without_endpoint(encoder_env):
+    from video_encoder import VideoEncoder
+
+    server = LocalQueueServer(claim_enabled=False).start()
+    try:
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        assert VideoEncoder().claim_jobs(2) is None
+    finally:
+        server.stop()
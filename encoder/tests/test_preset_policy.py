@@ -0,0 +1,149 @@
+import pytest
+
+from local_queue import LocalQueueServer
+from preset_policy import PresetPolicy, parse_tiers
+
+TIERS = ['slow', 'medium', 'fast', 'veryfast']
+
+
+class Stats:
+    def __init__(self, pending=0, processing=1, avg=None):
+        self.value = {'pending': pending, 'processing': processing, 'avg_processing_time_seconds': avg}
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if isinstance(self.value, BaseException):
+            raise self.value
+        return dict(self.value)
+
+
+def policy(stats, **kwargs):
+    return PresetPolicy(TIERS, 'medium', stats, **dict(dict(target_drain_seconds=600, hysteresis=0.25,
+                                                            min_dwell_seconds=0, stats_interval=0), **kwargs))
+
+
+def test_parse_tiers_orders_slowest_first():
+    assert parse_tiers('veryfast, Slow,medium,slow') == ['slow', 'medium', 'veryfast']
+    with pytest.raises(ValueError):
+        parse_tiers('medium,warp')
+    with pytest.raises(ValueError):
+        parse_tiers('')
+
+
+def test_deep_backlog_moves_to_a_faster_tier():
+    stats = Stats(pending=10)
+    p = policy(stats)
+    p.observe_job('medium', 100.0, 0.0)
+    # medium: 10 x 100 s = 1000 s > 600; fast: 10 x 100 / 1.35 = 741 s; veryfast: 357 s
+    d = p.decide()
+    assert (d['preset'], d['previous'], d['reason']) == ('veryfast', 'medium', 'backlog')
+    assert d['drain_seconds'] == pytest.approx(357.1, abs=0.1)
+
+
+def test_slowing_down_needs_margin_and_dwell(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('preset_policy.time.monotonic', lambda: clock[0])
+    stats = Stats(pending=3)
+    p = policy(stats, min_dwell_seconds=300)
+    p.observe_job('medium', 100.0, 0.0)
+    p.current = 'veryfast'
+    # medium (300 s) fits the 450 s margin but veryfast has not been held long enough
+    assert p.decide()['preset'] == 'veryfast'
+    clock[0] += 301
+    assert p.decide()['preset'] == 'medium'
+    # slow (500 s) fits the 600 s target, not the margin
+    clock[0] += 301
+    assert p.decide()['preset'] == 'medium'
+    stats.value['pending'] = 2  # slow: 333 s
+    p.changed_at = clock[0]
+    clock[0] += 100
+    assert p.decide()['preset'] == 'medium'
+    clock[0] += 200
+    assert p.decide()['preset'] == 'slow'
+
+
+def test_falling_behind_ignores_dwell(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('preset_policy.time.monotonic', lambda: clock[0])
+    stats = Stats(pending=1)
+    p = policy(stats, min_dwell_seconds=3600)
+    p.observe_job('medium', 100.0, 0.0)
+    assert p.decide()['preset'] == 'medium'
+    stats.value['pending'] = 8  # medium: 800 s; fast: 593 s
+    assert p.decide()['preset'] == 'fast'
+
+
+def test_remux_jobs_leave_the_encode_estimate_alone():
+    p = policy(Stats(pending=10))
+    p.observe_job('medium', 100.0, 20.0)
+    for _ in range(5):
+        p.observe_job(None, 0.0, 20.0)
+    snap = p.snapshot()
+    assert snap['encode_seconds_at_medium'] == 100.0
+    assert snap['other_seconds'] == 20.0
+
+
+def test_other_time_alone_falls_back_to_fleet_average():
+    p = policy(Stats(pending=2, avg=300.0))
+    p.observe_job(None, 0.0, 20.0)
+    # No encode measured yet: the API's average still steers
+    assert p.projected_drain_seconds('medium', p.fetch_stats()) == 600.0
+
+
+def test_encode_time_is_normalised_to_medium():
+    p = policy(Stats(pending=1))
+    p.observe_job('veryfast', 10.0, 5.0)
+    assert p.snapshot()['encode_seconds_at_medium'] == 28.0
+    assert p.projected_drain_seconds('slow', p.fetch_stats()) == pytest.approx(5.0 + 28.0 / 0.6)
+
+
+def test_prefetched_jobs_do_not_count_as_workers():
+    stats = Stats(pending=10, processing=6)
+    p = policy(stats, jobs_per_worker=3)
+    p.observe_job('medium', 60.0, 0.0)
+    # 6 jobs in processing across 2 workers each holding 2 prefetched jobs
+    assert p.workers(stats()) == 2.0
+    assert p.projected_drain_seconds('medium', stats()) == 300.0
+    stats.value['processing'] = 0
+    assert p.projected_drain_seconds('medium', stats()) == 600.0
+    d = p.decide()
+    assert d['workers'] == 1.0 and d['processing'] == 0
+
+
+def test_no_stats_or_throughput_keeps_the_current_preset():
+    stats = Stats(pending=10)
+    p = policy(stats)
+    assert p.decide() == {'preset': 'medium', 'previous': 'medium', 'reason': 'no throughput estimate'}
+    stats.value = ConnectionError('api down')
+    p = policy(stats)
+    assert p.decide()['reason'] == 'no queue stats'
+
+
+def test_stats_are_cached_for_the_interval():
+    stats = Stats(pending=1, avg=10.0)
+    p = policy(stats, stats_interval=3600)
+    p.decide()
+    p.decide()
+    assert stats.calls == 1
+
+
+def test_policy_wired_to_queue_stats(encoder_env):
+    from video_encoder import VideoEncoder
+
+    server = LocalQueueServer().start()
+    try:
+        encoder_env.setenv('LARAVEL_API_URL', server.base_url)
+        encoder_env.setenv('PRESET_POLICY_ENABLED', 'true')
+        encoder_env.setenv('PRESET_TARGET_DRAIN_MINUTES', '1')
+        encoder_env.setenv('PREFETCH_JOBS', '2')
+        for code in ('a1', 'b2', 'c3', 'd4'):
+            server.queue.add_job(code, f"http://example.com/{code}.mp4")
+        encoder = VideoEncoder()
+        assert encoder.preset_policy.jobs_per_worker == 3
+        encoder.preset_policy.observe_job('medium', 30.0, 0.0)
+        d = encoder.preset_policy.decide()
+        # medium: 4 x 30 s = 120 s > 60 s; fast: 89 s; veryfast: 43 s
+        assert (d['pending'], d['preset']) == (4, 'veryfast')
+    finally:
+        server.stop()
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+import s3_uploader
+from s3_uploader import S3Uploader, get_s3_client, get_transfer_config
+
+
+def test_clients_are_shared_per_endpoint(s3):
+    assert get_s3_client() is get_s3_client()
+    assert get_s3_client(endpoint_url='http://minio:9000') is not get_s3_client()
+    uploader = S3Uploader()
+    assert uploader.s3_client is S3Uploader().s3_client
+
+
+def test_source_downloads_share_the_uploader_client(s3, encoder_env):
+    from video_encoder import VideoEncoder
+
+    encoder_env.setenv('AWS_BUCKET', s3)
+    encoder_env.delenv('AWS_USE_PATH_STYLE_ENDPOINT', raising=False)
+    encoder = VideoEncoder()
+    source = encoder._s3_source_client({'region': 'us-east-1', 'endpoint_url': None})
+    assert source is S3Uploader().s3_client
+    assert source.meta.config.s3['addressing_style'] == 'virtual'
+
+    # Custom endpoints default to path-style on both sides
+    minio = encoder._s3_source_client({'region': 'us-east-1', 'endpoint_url': 'http://minio:9000'})
+    assert minio is get_s3_client('us-east-1', 'http://minio:9000', os.environ['AWS_ACCESS_KEY_ID'],
+                                  os.environ['AWS_SECRET_ACCESS_KEY'], path_style=True)
+    assert minio.meta.config.s3['addressing_style'] == 'path'
+
+
+def test_transfer_config_from_env(s3, monkeypatch):
+    monkeypatch.setenv('S3_MULTIPART_CHUNK_MB', '8')
+    monkeypatch.setenv('S3_MAX_CONCURRENCY', '3')
+    monkeypatch.setattr(s3_uploader, '_transfer_config', None)
+    tc = get_transfer_config()
+    assert (tc.multipart_chunksize, tc.max_request_concurrency) == (8 * 1024 * 1024, 3)
+    assert get_transfer_config() is tc
+    assert S3Uploader().transfer_config is tc
+
+
+def test_upload_file_sets_content_type(s3, tmp_path):
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'jpeg')
+    uploader = S3Uploader()
+    assert uploader.upload_file(path, 'thumbnails/a/a_thumb_1.jpg')
+    head = uploader.s3_client.head_object(Bucket=s3, Key='thumbnails/a/a_thumb_1.jpg')
+    assert head['ContentType'] == 'image/jpeg'
+
+
+@pytest.fixture
+def s3_encoder(encoder_env, s3):
+    from video_encoder import VideoEncoder
+    return VideoEncoder()
+
+
+def job_context(encoder, url):
+    from video_encoder import JobContext
+    return JobContext({'video_code': 'abc', 'input_file_url': url}, encoder.temp_dir)
+
+
+def test_copy_object_is_server_side(s3, tmp_path):
+    uploader = S3Uploader()
+    uploader.s3_client.put_object(Bucket=s3, Key='uploads/raw.mp4', Body=b'video')
+    assert uploader.copy_object(s3, 'uploads/raw.mp4', 'origin/a/abc.mp4')
+    head = uploader.s3_client.head_object(Bucket=s3, Key='origin/a/abc.mp4')
+    assert head['ContentType'] == 'video/mp4' and head['ContentLength'] == 5
+    assert not uploader.copy_object(s3, 'uploads/missing.mp4', 'origin/a/x.mp4')
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://media.s3.us-east-1.amazonaws.com/uploads/my%20clip.mp4', {'Bucket': 'media', 'Key': 'uploads/my clip.mp4'}),
+    ('https://media.s3.us-east-1.amazonaws.com/origin/a/abc.mp4', None),
+    ('https://other.s3.us-east-1.amazonaws.com/uploads/raw.mp4', 'local'),
+    ('https://cdn.example.com/raw.mp4', 'local'),
+])
+def test_origin_source(s3_encoder, url, expected):
+    ctx = job_context(s3_encoder, url)
+    source = s3_encoder._origin_source(ctx)
+    assert source == (ctx.input_file if expected == 'local' else expected)
+
+
+def test_origin_source_on_custom_endpoint(s3_encoder, monkeypatch):
+    monkeypatch.setenv('AWS_URL', 'https://files.example.com')
+    s3_encoder.s3_uploader.endpoint_url = 'https://files.example.com'
+    ctx = job_context(s3_encoder, 'https://files.example.com/media/uploads/raw.mp4')
+    assert s3_encoder._origin_source(ctx) == {'Bucket': 'media', 'Key': 'uploads/raw.mp4'}
+    ctx = job_context(s3_encoder, 'https://cdn.example.net/uploads/raw.mp4')
+    assert s3_encoder._origin_source(ctx) == ctx.input_file
+
+
+def test_upload_many_mixes_uploads_and_copies(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(s3_uploader.time, 'sleep', lambda s: None)
+    uploader = S3Uploader()
+    uploader.s3_client.put_object(Bucket=s3, Key='uploads/raw.mp4', Body=b'raw')
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f"t{i}.jpg")
+        files[-1].write_bytes(b'x' * (i + 1))
+    items = [({'Bucket': s3, 'Key': 'uploads/raw.mp4'}, 'origin/a/abc.mp4')]
+    items += [(p, f"thumbnails/a/{p.name}") for p in files]
+    items.append((tmp_path / 'missing.mp4', 'videos/a/abc.mp4'))
+    try:
+        results = uploader.upload_many(items, max_retries=1)
+    finally:
+        uploader.close()
+    assert list(results) == [key for _, key in items]
+    assert results == {'origin/a/abc.mp4': True, 'thumbnails/a/t0.jpg': True, 'thumbnails/a/t1.jpg': True,
+                       'thumbnails/a/t2.jpg': True, 'videos/a/abc.mp4': False}
+    listed = {o['Key']: o['Size'] for o in uploader.s3_client.list_objects_v2(Bucket=s3)['Contents']}
+    assert listed['thumbnails/a/t2.jpg'] == 3 and listed['origin/a/abc.mp4'] == 3
+
+
+def test_upload_many_retries_only_failures(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(s3_uploader.time, 'sleep', lambda s: None)
+    uploader = S3Uploader()
+    ok, flaky = tmp_path / 'ok.jpg', tmp_path / 'flaky.jpg'
+    ok.write_bytes(b'ok')
+    manager = uploader._get_transfer_manager()
+    real_upload = manager.upload
+    calls = []
+
+    def upload(path, bucket, key, extra_args=None):
+        calls.append(key)
+        if key.endswith('flaky.jpg') and calls.count(key) == 1:
+            flaky.write_bytes(b'late')  # missing on the first attempt only
+            return real_upload(str(tmp_path / 'absent'), bucket, key, extra_args=extra_args)
+        return real_upload(path, bucket, key, extra_args=extra_args)
+
+    monkeypatch.setattr(manager, 'upload', upload)
+    try:
+        results = uploader.upload_many([(ok, 't/ok.jpg'), (flaky, 't/flaky.jpg')], max_retries=2)
+    finally:
+        uploader.close()
+    assert results == {'t/ok.jpg': True, 't/flaky.jpg': True}
+    assert calls == ['t/ok.jpg', 't/flaky.jpg', 't/flaky.jpg']
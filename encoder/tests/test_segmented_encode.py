@@ -0,0 +1,63 @@
+import subprocess
+
+import pytest
+
+from conftest import make_clip, requires_ffmpeg
+
+pytestmark = requires_ffmpeg
+
+
+@pytest.fixture
+def segmenting(encoder):
+    encoder.remux_enabled = False
+    encoder.segment_min_duration = 0.0
+    encoder.segment_min_length = 1.0
+    encoder.segment_workers = 2
+    return encoder
+
+
+def shifted(src, dst, delay_video=0.0, delay_audio=0.0):
+    """Copy of src whose video (or audio) starts `delay` seconds into the file."""
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-itsoffset', str(delay_video), '-i', str(src),
+                    '-itsoffset', str(delay_audio), '-i', str(src),
+                    '-map', '0:v', '-map', '1:a', '-c', 'copy', str(dst)], check=True)
+    return dst
+
+
+def test_segmented_encode_uses_the_single_process_settings(segmenting, tmp_path, monkeypatch):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=6, extra=('-g', '25'))
+    commands = []
+    run_encode = segmenting._run_encode
+    monkeypatch.setattr(segmenting, '_run_encode', lambda cmd, *a, **kw: commands.append(cmd) or run_encode(cmd, *a, **kw))
+
+    report = segmenting.encode_video(clip, tmp_path / 'out.mp4', {'preset': 'ultrafast'})
+    assert report['segments'] >= 2
+    out = segmenting.media_probe.probe(tmp_path / 'out.mp4')
+    assert out.has_video and out.has_audio
+    assert out.duration == pytest.approx(6.0, abs=0.2)
+    assert not any('-g' in cmd for cmd in commands)  # x264's default GOP, as in the single-process encode
+    audio_cmd = next(cmd for cmd in commands if '-vn' in cmd)
+    assert audio_cmd[audio_cmd.index('-c:a') + 1] == 'aac'
+
+
+@pytest.mark.parametrize('delay_video, delay_audio', [(0.5, 0.0), (0.0, 0.5)], ids=['video-late', 'audio-late'])
+def test_segmented_encode_keeps_av_offset(segmenting, tmp_path, delay_video, delay_audio):
+    clip = make_clip(tmp_path / 'base.mp4', seconds=6, extra=('-g', '25'))
+    src = shifted(clip, tmp_path / 'src.mp4', delay_video, delay_audio)
+    source_offset = segmenting.media_probe.probe(src).av_offset
+    assert source_offset == pytest.approx(delay_video - delay_audio, abs=0.05)
+
+    report = segmenting.encode_video(src, tmp_path / 'out.mp4', {'preset': 'ultrafast'})
+    assert report['segments'] >= 2
+    assert segmenting.media_probe.probe(tmp_path / 'out.mp4').av_offset == pytest.approx(source_offset, abs=0.05)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'thumbnail_request': {'video_code': 'vid', 'count': 2, 'start_index': 1}},
+    {'stream_key': 'videos/v/vid.mp4'},
+], ids=['side-thumbnails', 'streaming-upload'])
+def test_single_process_outputs_skip_segmenting(segmenting, tmp_path, monkeypatch, kwargs):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=4, extra=('-g', '25'))
+    monkeypatch.setattr(segmenting, '_encode_segmented', lambda *a, **kw: pytest.fail('segmented'))
+    report = segmenting.encode_video(clip, tmp_path / 'out.mp4', {'preset': 'ultrafast'}, **kwargs)
+    assert 'segments' not in report
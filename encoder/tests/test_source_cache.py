@@ -0,0 +1,104 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from bench.servers import MediaServer
+from source_cache import SourceCache
+
+URL = 'https://cdn.example.com/uploads/abc.mp4'
+V1 = {'etag': '"v1"', 'size': 4}
+
+
+def source(tmp_path, name='src', data=b'data'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def test_put_then_take_moves_the_file(tmp_path):
+    cache = SourceCache(tmp_path / 'cache')
+    assert cache.put(source(tmp_path), URL + '?X-Amz-Signature=1', V1, 'sha')
+    assert not (tmp_path / 'src').exists() and cache.total_bytes() == 4
+
+    # Presigned query strings differ between claims; the key ignores them
+    entry = cache.take(URL + '?X-Amz-Signature=2', V1, tmp_path / 'dest')
+    assert entry['sha256'] == 'sha' and entry['url'] == URL
+    assert (tmp_path / 'dest').read_bytes() == b'data'
+    assert cache.take(URL, V1, tmp_path / 'again') is None and cache.total_bytes() == 0
+
+
+@pytest.mark.parametrize('current', [{'etag': '"v2"', 'size': 4}, {'etag': None, 'size': 5}, {}])
+def test_stale_or_unverifiable_entries_are_dropped(tmp_path, current):
+    cache = SourceCache(tmp_path / 'cache')
+    cache.put(source(tmp_path), URL, V1, 'sha')
+    assert cache.take(URL, current, tmp_path / 'dest') is None
+    assert cache.total_bytes() == 0 and not (tmp_path / 'dest').exists()
+
+
+def test_validators_match_on_what_both_sides_know():
+    assert SourceCache.matches({'etag': '"a"', 'size': 1}, {'etag': None, 'size': 1})
+    assert not SourceCache.matches({'etag': '"a"'}, {'size': 1})
+
+
+def test_budget_evicts_least_recently_stored(tmp_path):
+    cache = SourceCache(tmp_path / 'cache', max_bytes=10)
+    assert not cache.put(source(tmp_path, 'huge', b'x' * 11), URL, V1, None)
+    for i, name in enumerate('abc'):
+        cache.put(source(tmp_path, name, b'x' * 4), f"{URL}/{name}", V1, None)
+        meta = cache.root / f"{cache.key(f'{URL}/{name}')}.json"
+        os.utime(meta, (time.time() + i, time.time() + i))  # distinct store times
+    assert cache.total_bytes() == 8
+    assert cache.take(f"{URL}/a", V1, tmp_path / 'a_out') is None
+    assert cache.take(f"{URL}/c", V1, tmp_path / 'c_out') is not None
+
+
+def test_make_room_keeps_the_disk_reserve(tmp_path):
+    cache = SourceCache(tmp_path / 'cache')
+    cache.put(source(tmp_path), URL, V1, None)
+    cache.reserve_bytes = cache._free_bytes() + 1  # any incoming download would dip below it
+    cache.make_room(0)
+    assert cache.total_bytes() == 0
+
+
+def test_crash_leftovers_are_removed_on_start(tmp_path):
+    root = tmp_path / 'cache'
+    root.mkdir()
+    for name in ('orphan.src', 'lonely.json', 'half.json.tmp'):
+        (root / name).write_text('x')
+    SourceCache(root)
+    assert list(root.iterdir()) == []
+
+
+def test_source_cache_is_off_by_default(encoder):
+    assert encoder.source_cache is None
+
+
+def test_retry_takes_the_source_from_the_cache(encoder_env, tmp_path):
+    from video_encoder import JobContext, VideoEncoder
+
+    encoder_env.setenv('SOURCE_CACHE_ENABLED', 'true')
+    encoder = VideoEncoder()
+    encoder.source_streaming = False
+    www = tmp_path / 'www'
+    www.mkdir()
+    content = os.urandom(50_000)
+    (www / 'abc.mp4').write_bytes(content)
+    server = MediaServer(www).start()
+    try:
+        job = {'video_code': 'abc', 'input_file_url': f"{server.base_url}/abc.mp4"}
+        first = JobContext(job, encoder.temp_dir)
+        encoder._download_source(first)
+        assert first.content_sha256 == hashlib.sha256(content).hexdigest()
+        encoder._stash_source(first)  # the job failed after its download
+        assert not first.input_file.exists()
+
+        retry = JobContext(job, encoder.temp_dir)
+        encoder._download_source(retry)
+        assert retry.input_file.read_bytes() == content
+        assert retry.content_sha256 == first.content_sha256
+        assert encoder.metrics.source_cache.value(result='hit') == 1
+        assert encoder.metrics.download_seconds.count(source='http') == 1  # the retry downloaded nothing
+    finally:
+        server.stop()
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import struct
+import threading
+
+import pytest
+
+from bench.servers import MediaServer
+from conftest import make_clip, requires_ffmpeg
+from errors import NonRetryableError, RetryableError
+from ffmpeg_runner import PipeInput
+from media_info import mp4_moov_end
+
+
+def box(kind, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def test_moov_end_of_box_layouts():
+    ftyp, moov = box(b'ftyp', b'isom' * 4), box(b'moov', b'\0' * 100)
+    assert mp4_moov_end(ftyp + moov + box(b'mdat', b'\0' * 10)) == len(ftyp) + len(moov)
+    assert mp4_moov_end(ftyp + box(b'mdat', b'\0' * 10) + moov) is None  # moov at the end
+    assert mp4_moov_end(ftyp + box(b'free') + moov[:20]) == len(ftyp) + 8 + len(moov)  # may lie past head
+    large = struct.pack('>I4sQ', 1, b'wide', 16)  # 64-bit box size
+    assert mp4_moov_end(ftyp + large + moov) == len(ftyp) + 16 + len(moov)
+    assert mp4_moov_end(b'\x00\x00\x00\x00ftyp') is None
+    assert mp4_moov_end(b'GIF89a not an mp4 at all') is None
+
+
+@requires_ffmpeg
+def test_moov_end_of_real_files(tmp_path):
+    faststart = make_clip(tmp_path / 'fast.mp4', seconds=1, extra=('-movflags', '+faststart'))
+    plain = make_clip(tmp_path / 'plain.mp4', seconds=1)
+    assert 0 < mp4_moov_end(faststart.read_bytes()[:256 * 1024]) < faststart.stat().st_size
+    assert mp4_moov_end(plain.read_bytes()[:256 * 1024]) is None
+
+
+def read_all(fd):
+    chunks = []
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def test_pipe_input_feeds_the_reader(tmp_path):
+    data = os.urandom(500_000)
+
+    def produce(write):
+        for i in range(0, len(data), 70_000):
+            write(data[i:i + 70_000])
+
+    with PipeInput(tmp_path / 'src.mp4', produce) as source:
+        assert source.arg == f"pipe:{source.pass_fds[0]}"
+        assert read_all(source.pass_fds[0]) == data
+        source.finish()
+
+
+def test_producer_runs_to_completion_after_the_reader_leaves(tmp_path):
+    produced = []
+
+    def produce(write):
+        for _ in range(50):
+            write(b'x' * 65536)
+            produced.append(1)
+
+    with PipeInput(tmp_path / 'src.mp4', produce) as source:
+        os.read(source.pass_fds[0], 1000)  # ffmpeg read what it needed and exited
+        source.finish()
+    assert len(produced) == 50  # hash/size checks still see the whole source
+
+
+@pytest.mark.parametrize('error, expected', [
+    (ConnectionError('reset'), RetryableError),
+    (NonRetryableError('HTTP 404'), NonRetryableError),
+])
+def test_producer_errors_surface_on_finish(tmp_path, error, expected):
+    def produce(write):
+        write(b'partial')
+        raise error
+
+    with pytest.raises(expected):
+        with PipeInput(tmp_path / 'src.mp4', produce) as source:
+            read_all(source.pass_fds[0])
+            source.finish()
+
+
+def test_leaving_without_finish_stops_the_producer(tmp_path):
+    stopped = threading.Event()
+
+    def produce(write):
+        try:
+            while True:
+                write(b'x' * 65536)
+        finally:
+            stopped.set()
+
+    with PipeInput(tmp_path / 'src.mp4', produce):
+        pass  # ffmpeg failed before reading anything
+    assert stopped.is_set()
+
+
+@pytest.fixture
+def streaming(encoder_env, tmp_path):
+    from video_encoder import VideoEncoder
+
+    encoder_env.setenv('SOURCE_STREAMING_ENABLED', 'true')
+    encoder_env.setenv('THUMBNAILS_FROM_ENCODE', 'true')
+    www = tmp_path / 'www'
+    www.mkdir()
+    server = MediaServer(www).start()
+    yield VideoEncoder(), www, server.base_url
+    server.stop()
+
+
+@requires_ffmpeg
+def test_moov_first_source_is_encoded_while_it_downloads(streaming, tmp_path):
+    from video_encoder import JobContext
+
+    encoder, www, base_url = streaming
+    encoder.remux_enabled = False
+    src = make_clip(www / 'abc.mp4', seconds=2, extra=('-movflags', '+faststart'))
+    ctx = JobContext({'video_code': 'abc', 'input_file_url': f"{base_url}/abc.mp4"}, encoder.temp_dir)
+    encoder._download_source(ctx)
+    assert ctx.source_stream == {'size': src.stat().st_size, 'keep_local': False}
+    assert ctx.head_file.exists() and not ctx.input_file.exists()
+
+    report = encoder.encode_video(ctx.head_file, ctx.output_file, {},
+                                  open_input=lambda: PipeInput(ctx.input_file, encoder._source_producer(ctx)))
+    assert report['encode_path'] == 'encode'
+    assert encoder.media_probe.probe(ctx.output_file).duration == pytest.approx(2, abs=0.2)
+    assert ctx.content_sha256 == hashlib.sha256(src.read_bytes()).hexdigest()
+    assert encoder.metrics.download_seconds.count(source='stream') >= 1
+
+
+@requires_ffmpeg
+def test_moov_at_end_source_is_downloaded(streaming):
+    from video_encoder import JobContext
+
+    encoder, www, base_url = streaming
+    src = make_clip(www / 'abc.mp4', seconds=1)
+    ctx = JobContext({'video_code': 'abc', 'input_file_url': f"{base_url}/abc.mp4"}, encoder.temp_dir)
+    encoder._download_source(ctx)
+    assert ctx.source_stream is None
+    assert ctx.input_file.read_bytes() == src.read_bytes()
@@ -0,0 +1,141 @@
+import os
+import threading
+
+import pytest
+
+from conftest import make_clip, requires_ffmpeg
+from errors import RetryableError
+from ffmpeg_runner import FRAGMENTED_MOVFLAGS, Mp4PipeOutput
+from s3_uploader import MB, MultipartStream
+
+
+@pytest.fixture
+def client(s3):
+    from s3_uploader import get_s3_client
+    return get_s3_client()
+
+
+def grow(path, chunks, stream):
+    """Append chunks to path one by one, feeding the stream the running size like the pipe copier does."""
+    total = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            f.flush()
+            total += len(chunk)
+            stream.feed(total)
+    return total
+
+
+def test_parts_go_up_while_the_file_grows(client, s3, tmp_path):
+    path = tmp_path / 'out.mp4'
+    data = os.urandom(12 * MB + 123)
+    stream = MultipartStream(client, s3, 'videos/a/abc.mp4', path, part_size=5 * MB)
+    stream.start()
+    total = grow(path, [data[i:i + MB] for i in range(0, len(data), MB)], stream)
+    stream.complete(total)
+    assert [p['PartNumber'] for p in stream.parts] == [1, 2, 3]
+    assert client.get_object(Bucket=s3, Key='videos/a/abc.mp4')['Body'].read() == data
+
+
+def test_abort_leaves_nothing_behind(client, s3, tmp_path):
+    path = tmp_path / 'out.mp4'
+    stream = MultipartStream(client, s3, 'videos/a/abc.mp4', path, part_size=5 * MB)
+    stream.start()
+    grow(path, [os.urandom(6 * MB)], stream)
+    stream.abort()
+    assert not client.list_multipart_uploads(Bucket=s3).get('Uploads')
+    assert 'Contents' not in client.list_objects_v2(Bucket=s3)
+
+
+def test_empty_stream_is_an_error(client, s3, tmp_path):
+    stream = MultipartStream(client, s3, 'videos/a/abc.mp4', tmp_path / 'out.mp4', part_size=5 * MB)
+    stream.start()
+    with pytest.raises(IOError):
+        stream.complete(0)
+    stream.abort()
+
+
+class RecordingSink:
+    def __init__(self):
+        self.events = []
+        self.fed = 0
+
+    def start(self):
+        self.events.append('start')
+
+    def feed(self, total):
+        self.fed = total
+
+    def complete(self, total):
+        self.events.append(('complete', total))
+
+    def abort(self):
+        self.events.append('abort')
+
+
+def test_pipe_output_copies_and_completes(tmp_path):
+    sink = RecordingSink()
+    data = os.urandom(300_000)
+    with Mp4PipeOutput(tmp_path / 'out.mp4', sink, read_size=65536) as out:
+        assert out.args[:2] == ['-movflags', FRAGMENTED_MOVFLAGS] and out.args[-1] == f"pipe:{out.pass_fds[0]}"
+        writer = threading.Thread(target=lambda: os.write(out.pass_fds[0], data))
+        writer.start()
+        writer.join()
+        out.finish()
+    assert (tmp_path / 'out.mp4').read_bytes() == data
+    assert sink.events == ['start', ('complete', len(data))] and sink.fed == len(data)
+
+
+def test_pipe_output_aborts_when_ffmpeg_failed(tmp_path):
+    sink = RecordingSink()
+    with Mp4PipeOutput(tmp_path / 'out.mp4', sink):
+        pass  # left without finish(): ffmpeg exited non-zero or was killed
+    assert sink.events == ['start', 'abort']
+
+
+def test_failed_upload_is_retryable(tmp_path):
+    class FailingSink(RecordingSink):
+        def complete(self, total):
+            raise ValueError('S3 said no')
+
+    with pytest.raises(RetryableError):
+        with Mp4PipeOutput(tmp_path / 'out.mp4', FailingSink()) as out:
+            os.write(out.pass_fds[0], b'x')
+            out.finish()
+
+
+@pytest.fixture
+def streaming_encoder(encoder_env, s3):
+    from video_encoder import VideoEncoder
+
+    encoder_env.setenv('STREAMING_UPLOAD_ENABLED', 'true')
+    encoder = VideoEncoder()
+    encoder.streaming_part_size = 5 * MB
+    return encoder
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('remux', [False, True])
+def test_encode_streams_fragmented_mp4_to_s3(streaming_encoder, client, s3, tmp_path, remux):
+    streaming_encoder.remux_enabled = remux
+    clip = make_clip(tmp_path / 'src.mp4', seconds=2)
+    out = tmp_path / 'out.mp4'
+    report = streaming_encoder.encode_video(clip, out, {}, stream_key='videos/a/abc.mp4')
+    assert report['streamed_upload'] is True
+    assert report['encode_path'] == ('copy' if remux else 'encode')
+    assert client.get_object(Bucket=s3, Key='videos/a/abc.mp4')['Body'].read() == out.read_bytes()
+    info = streaming_encoder.media_probe.probe(out)
+    assert info.has_video and info.duration == pytest.approx(2, abs=0.2)
+    assert b'moof' in out.read_bytes()[:200_000]  # fragmented, not faststart
+
+
+@requires_ffmpeg
+def test_failed_encode_aborts_the_upload(streaming_encoder, client, s3, tmp_path):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=1)
+    streaming_encoder.remux_enabled = False
+    with pytest.raises(Exception):
+        # ffmpeg rejects the CRF after the upload was opened
+        streaming_encoder.encode_video(clip, tmp_path / 'out.mp4', {'crf': 'x'}, stream_key='videos/a/abc.mp4')
+    assert not client.list_multipart_uploads(Bucket=s3).get('Uploads')
+    assert 'Contents' not in client.list_objects_v2(Bucket=s3)
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import make_clip, requires_ffmpeg
+from video_encoder import VideoEncoder
+
+
+def test_thumbnail_times_spread_over_the_middle():
+    assert VideoEncoder._thumbnail_times(100, 0) == []
+    assert VideoEncoder._thumbnail_times(100, 1) == [50]
+    assert VideoEncoder._thumbnail_times(100, 5) == pytest.approx([10, 30, 50, 70, 90])
+
+
+def test_select_expr_keeps_first_frame_at_each_time():
+    expr = VideoEncoder._thumbnail_select_expr([1.0, 2.5])
+    assert expr == ("select='gte(t\\,1.000)*isnan(prev_selected_t)"
+                    "+gte(t\\,2.500)*lt(prev_selected_t\\,2.500)'")
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('seek_min_duration', [60.0, 0.0], ids=['decode-once', 'seek-per-input'])
+def test_single_pass_writes_every_thumbnail(encoder, tmp_path, seek_min_duration):
+    clip = make_clip(tmp_path / 'src.mp4', seconds=4, audio=False)
+    encoder.thumbnail_seek_min_duration = seek_min_duration
+    times = VideoEncoder._thumbnail_times(4.0, 3)
+    thumbs = encoder._extract_thumbnails_single_pass(clip, 'vid', times, 2, False, 4.0)
+    assert [p.name for p in thumbs] == ['vid_thumb_2.jpg', 'vid_thumb_3.jpg', 'vid_thumb_4.jpg']
+    assert all(p.stat().st_size > 0 for p in thumbs)
+
+
+@requires_ffmpeg
+def test_generate_thumbnails_vertical_source(encoder, tmp_path):
+    clip = make_clip(tmp_path / 'tall.mp4', seconds=3, size='240x320', audio=False)
+    thumbs = encoder.generate_thumbnails(clip, 'tall', {}, num_thumbnails=2, mode='single')
+    assert len(thumbs) == 2
+    info = encoder.media_probe.probe(thumbs[0])
+    assert info.width > info.height  # composed onto a landscape canvas
+
+
+def test_side_thumbnail_args_use_vsync_and_report_times(encoder):
+    branch, args, paths, times = encoder._side_thumbnail_args(
+        {'video_code': 'vid', 'count': 3, 'start_index': 2}, 10.0, False)
+    assert branch.startswith('[th]select=') and branch.endswith('[thout]')
+    assert args[args.index('-vsync') + 1] == 'vfr'
+    assert '-fps_mode:v' not in args
+    assert [p.name for p in paths] == ['vid_thumb_2.jpg', 'vid_thumb_3.jpg', 'vid_thumb_4.jpg']
+    assert times == VideoEncoder._thumbnail_times(10.0, 3)
+
+
+def test_extract_video_thumbnails_uses_given_times(encoder, monkeypatch):
+    calls = []
+    monkeypatch.setattr(encoder, '_extract_thumbnails_single_pass',
+                        lambda path, code, times, start, vertical, duration: calls.append((times, start)) or [])
+    monkeypatch.setattr(encoder, '_extract_thumbnail_at', lambda *a: False)
+    encoder._extract_video_thumbnails('src.mp4', 'vid', 10.0, False, 2, 4, mode='single', times=[7.0, 9.0])
+    assert calls == [([7.0, 9.0], 4)]
+
+
+@requires_ffmpeg
+def test_encode_fallback_extracts_only_the_missing_positions(encoder, tmp_path, monkeypatch):
+    from video_encoder import NUM_THUMBNAILS, JobContext
+
+    encoder.thumbnails_from_encode = True
+    ctx = JobContext({'video_code': 'vid'}, encoder.temp_dir)
+    make_clip(ctx.input_file, seconds=4, audio=False)
+    times = VideoEncoder._thumbnail_times(4.0, NUM_THUMBNAILS)
+    made = [encoder.temp_dir / 'vid_thumb_1.jpg', encoder.temp_dir / 'vid_thumb_2.jpg']
+    for p in made:
+        p.write_bytes(b'jpg')
+    monkeypatch.setattr(encoder, '_encode_source', lambda ctx, request: {
+        'encode_path': 'encode', 'thumbnails': list(made), 'thumbnail_missing_times': times[2:]})
+    asked = []
+    monkeypatch.setattr(encoder, '_extract_video_thumbnails',
+                        lambda path, code, duration, vertical, count, start, mode=None, times=None:
+                        asked.append((count, start, times)) or [])
+    encoder._stage_encode(ctx)
+    assert asked == [(3, 3, times[2:])]
+    assert ctx.thumbnail_files == made
+    assert 'thumbnail_missing_times' not in ctx.result()
+
+
+@requires_ffmpeg
+def test_encode_writes_thumbnails_from_its_own_decode(encoder, tmp_path):
+    encoder.remux_enabled = False
+    clip = make_clip(tmp_path / 'src.mp4', seconds=3)
+    report = encoder.encode_video(clip, tmp_path / 'out.mp4', {'preset': 'ultrafast'},
+                                  thumbnail_request={'video_code': 'vid', 'count': 3, 'start_index': 1})
+    assert report['thumbnail_source'] == 'encode'
+    assert [p.name for p in report['thumbnails']] == ['vid_thumb_1.jpg', 'vid_thumb_2.jpg', 'vid_thumb_3.jpg']
+    assert report['thumbnail_missing_times'] == []
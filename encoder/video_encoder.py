@@ -4,17 +4,37 @@ import subprocess
 import time
 import os
 import logging
+import shutil
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Callable, Iterator, List, Set, Tuple
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
+from urllib.parse import unquote, urlparse
 import random
+import threading
 import urllib3
 
 # ---- Local config loader (your project provides this) ----
 #   - 'config' is an instance-like accessor
 #   - 'Config' class allows reloading from a specific .env
 from config import config
+from pipeline import Pipeline, Stage, CpuBudget
+from media_info import MediaInfo, MediaProbe, mp4_moov_end
+from abr import DEFAULT_LADDER, hls_args, parse_ladder, select_renditions
+from complexity import choose_parameters, sample_args, sample_size, sample_windows
+from downloader import ContentHasher, HashingWriter, RangedDownloader
+from encode_cache import ENCODE_CACHE_VERSION, S3CacheIndex, SqliteCacheIndex, cache_key
+from journal import JobJournal, stale_journals
+from lease import LeaseKeeper
+from prefetch import PrefetchBuffer
+from preset_policy import PresetPolicy, X264_PRESETS, parse_tiers
+from source_cache import SourceCache
+from ffmpeg_runner import (FfmpegProgress, FileInput, Mp4FileOutput, Mp4PipeOutput, PipeInput,
+                           ProgressAggregator, run_ffmpeg)
+from metrics import EncoderMetrics, MetricsServer, parse_samples
 
 # Disable SSL warnings for local development
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -40,13 +60,9 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 # --------------- Error classes ---------------
-class RetryableError(Exception):
-    """Exception that indicates an operation should be retried."""
-    pass
-
-class NonRetryableError(Exception):
-    """Exception that indicates an operation should not be retried."""
-    pass
+# Defined in errors.py so helper modules can raise them; re-exported here.
+from errors import (RetryableError, NonRetryableError, LeaseLostError,
+                    FfmpegAbortedError, FfmpegStallError, FfmpegTimeoutError)
 
 # --------------- Retry decorator ---------------
 def retry_on_exception(max_retries: int = 3, delay: float = 1.0, backoff: float = 2.0):
@@ -73,6 +89,89 @@ def retry_on_exception(max_retries: int = 3, delay: float = 1.0, backoff: float
         return wrapper
     return decorator
 
+# ======================= Thumbnail filters =======================
+THUMB_LETTERBOX_VF = (
+    "scale=640:360:force_original_aspect_ratio=decrease,"
+    "pad=640:360:(ow-iw)/2:(oh-ih)/2:black"
+)
+THUMB_VERTICAL_FC = (
+    "[0:v]scale=640:360:force_original_aspect_ratio=increase,"
+    "crop=640:360,boxblur=20:1[bg];"
+    "[0:v]scale=-2:360:force_original_aspect_ratio=decrease[fg];"
+    "[bg][fg]overlay=(W-w)/2:(H-h)/2[outv]"
+)
+
+# ======================= Job context =======================
+NUM_THUMBNAILS = 5
+SOURCE_HEAD_PROBE_BYTES = 256 * 1024  # first read when looking for a moov-first source
+SOURCE_HEAD_MEDIA_BYTES = 1024 * 1024  # media kept after the moov so ffprobe decodes a frame (pix_fmt, ...)
+JOB_STAGES = ('download', 'thumbnails', 'analyze', 'encode', 'metadata', 'upload', 'complete')
+
+class JobContext:
+    """Per-job state handed from stage to stage (serial or pipelined)."""
+
+    def __init__(self, job: Dict[str, Any], temp_dir: Path):
+        self.job = job
+        self.video_code: str = job['video_code']
+        self.retry_count: int = job.get('retry_count', 0)
+        self.stage: Optional[str] = None
+
+        self.encoding_options: Dict[str, Any] = job.get('encoding_options', {}) or {}
+        storage_config = self.encoding_options.get('storage_config', {}) or {}
+        self.videos_path = storage_config.get('videos', 'videos')
+        self.thumbnails_path = storage_config.get('thumbnails', 'thumbnails')
+        self.origin_path = storage_config.get('origin', 'origin')
+        self.first_char = storage_config.get('first_char', self.video_code[0].lower())
+
+        self.input_file = temp_dir / f"{self.video_code}.mp4"
+        self.output_file = temp_dir / f"{self.video_code}_encoded.mp4"
+        self.head_file = temp_dir / f"{self.video_code}.head.mp4"  # ftyp+moov of a streamed source
+        self.source_stream: Optional[Dict[str, Any]] = None  # set when ffmpeg reads the source as it downloads
+        self.lease_token: Optional[str] = None
+        self.content_sha256: Optional[str] = None  # of the downloaded source
+        self.source_validator: Optional[Dict[str, Any]] = None  # ETag/size the origin reported
+        self.cache_key: Optional[str] = None
+        self.cache_entry: Optional[Dict[str, Any]] = None  # set on an encode cache hit
+        self.media_metadata: Optional[Dict[str, Any]] = None
+        self.prefetched = False
+        self.prefetch_error: Optional[BaseException] = None
+        self.thumbnail_files: List[Path] = []
+        self.uploaded_thumb_paths: List[str] = []
+        self.encode_report: Dict[str, Any] = {}
+        self.completed = False
+        self.encoded_uploaded = False  # streamed to its S3 key while encoding
+        self.hls_files: List[Path] = []  # ABR ladder: playlists, init segments and media segments
+        self.complexity: Optional[Dict[str, Any]] = None  # per-title CRF/maxrate picked by the analyze stage
+        self.complexity_sample = temp_dir / f"{self.video_code}_complexity.h264"
+        self.preset: Optional[str] = None  # x264 preset picked by the preset policy
+        self.preset_decision: Optional[Dict[str, Any]] = None
+        self.stage_seconds: Dict[str, float] = {}  # wall time of the stages run by this worker
+        self.journal: Optional[JobJournal] = None
+        self.resumed_stages: Set[str] = set()  # done by an earlier (crashed) run, per the journal
+
+        self.encoded_s3_path = f"{self.videos_path}/{self.first_char}/{self.video_code}.mp4"
+        self.origin_s3_path = f"{self.origin_path}/{self.first_char}/{self.video_code}.mp4"
+        self.hls_base_name = f"{self.video_code}_hls"
+        self.hls_manifest_s3_path = self.hls_s3_path(temp_dir / f"{self.hls_base_name}.m3u8")
+
+    @property
+    def source_file(self) -> Path:
+        """Local file describing the source: the download, or only its header while it is streamed."""
+        if self.source_stream and not self.input_file.exists():
+            return self.head_file
+        return self.input_file
+
+    def hls_s3_path(self, local_path: Path) -> str:
+        """HLS files sit flat next to the MP4 (playlists reference them by name)."""
+        return f"{self.videos_path}/{self.first_char}/{local_path.name}"
+
+    def thumbnail_s3_path(self, index: int) -> str:
+        return f"{self.thumbnails_path}/{self.first_char}/{self.video_code}_thumb_{index}.jpg"
+
+    def result(self) -> Dict[str, Any]:
+        """JSON-safe summary stored with the completed job (encode path, geometry, ...)."""
+        return {k: v for k, v in self.encode_report.items() if k not in ('thumbnails', 'thumbnail_missing_times')}
+
 # ======================= VideoEncoder =======================
 class VideoEncoder:
     def __init__(self):
@@ -86,6 +185,40 @@ class VideoEncoder:
         self.poll_interval = config.get_int('POLL_INTERVAL', 30)
         self.max_consecutive_errors = config.get_int('MAX_CONSECUTIVE_ERRORS', 5)
         self.min_disk_space_gb = config.get_float('MIN_DISK_SPACE_GB', 2.0)
+        self.ffmpeg_threads = config.get_int('FFMPEG_THREADS', 0)  # 0 = let ffmpeg decide
+        self.thumbnail_mode = str(config.get('THUMBNAIL_MODE', 'single')).lower()  # single | per_frame
+        self.thumbnail_seek_min_duration = config.get_float('THUMBNAIL_SEEK_MIN_DURATION', 60.0)
+        self.thumbnails_from_encode = config.get_bool('THUMBNAILS_FROM_ENCODE', False)
+
+        # Remux fast path
+        self.remux_enabled = config.get_bool('REMUX_ENABLED', True)
+        self.remux_bitrate_tolerance = config.get_float('REMUX_BITRATE_TOLERANCE', 1.1)
+        self.remux_max_audio_bitrate = config.get_int('REMUX_MAX_AUDIO_BITRATE', 160000)
+
+        # Segment-parallel encoding of long sources
+        self.segment_enabled = config.get_bool('SEGMENT_ENCODE_ENABLED', True)
+        self.segment_min_duration = config.get_float('SEGMENT_ENCODE_MIN_DURATION', 1800.0)
+        self.segment_workers = config.get_int('SEGMENT_ENCODE_WORKERS', 0)  # 0 = cores / threads per worker
+        self.segment_threads_per_worker = config.get_int('SEGMENT_THREADS_PER_WORKER', 4)
+        self.segment_min_length = config.get_float('SEGMENT_MIN_LENGTH', 30.0)
+
+        # Prometheus metrics; served on /metrics when METRICS_PORT is set
+        self.metrics = EncoderMetrics()
+        self.metrics_port = config.get_int('METRICS_PORT', 0)
+        self.metrics_host = config.get('METRICS_HOST', '0.0.0.0')
+        self.metrics_server: Optional[MetricsServer] = None
+        self._running_jobs = 0
+
+        # Pipeline mode (--pipeline)
+        self.pipeline_cpu_budget = config.get_int('PIPELINE_CPU_BUDGET', os.cpu_count() or 1)
+        self.pipeline_download_workers = config.get_int('PIPELINE_DOWNLOAD_WORKERS', 2)
+        self.pipeline_upload_workers = config.get_int('PIPELINE_UPLOAD_WORKERS', 2)
+        self.pipeline_queue_size = config.get_int('PIPELINE_QUEUE_SIZE', 1)
+        self.pipeline_status_interval = config.get_int('PIPELINE_STATUS_INTERVAL', 60)
+        self.pipeline: Optional[Pipeline] = None
+        self.media_probe = MediaProbe(observe=self.metrics.probe_seconds.observe)
+        self._pipeline_lock = threading.Lock()
+        self._pipeline_errors = 0
 
         # SSL config
         self.verify_ssl = config.get_bool('VERIFY_SSL', True)
@@ -98,6 +231,7 @@ class VideoEncoder:
             'Accept': 'application/json',
             'User-Agent': 'VideoEncoder/1.0'
         })
+        self.session.hooks['response'].append(self._observe_api_response)
         if not self.verify_ssl:
             self.session.verify = False
             logger.warning("SSL certificate verification is DISABLED. Use only for local development!")
@@ -105,6 +239,96 @@ class VideoEncoder:
             self.session.verify = self.ca_bundle
             logger.info(f"Using custom CA bundle: {self.ca_bundle}")
 
+        # Source downloads (HTTP fallback path)
+        self.downloader = RangedDownloader(
+            self.session,
+            connections=config.get_int('DOWNLOAD_CONNECTIONS', 4),
+            part_size=config.get_int('DOWNLOAD_PART_SIZE_MB', 32) * 1024 * 1024,
+            buffer_size=config.get_int('DOWNLOAD_BUFFER_KB', 1024) * 1024,
+            min_ranged_size=config.get_int('DOWNLOAD_MIN_RANGED_MB', 64) * 1024 * 1024,
+            min_free_bytes=int(self.min_disk_space_gb * (1024 ** 3)),
+        )
+
+        # Job leases: renewed from a heartbeat thread while the job's stages run
+        self.lease_seconds = config.get_int('LEASE_SECONDS', 300)
+        self.leases = LeaseKeeper(
+            self.renew_lease,
+            interval=config.get_float('LEASE_HEARTBEAT_INTERVAL', self.lease_seconds / 3),
+        )
+
+        # Batch claiming + source prefetch (serial mode)
+        self.prefetch_jobs = config.get_int('PREFETCH_JOBS', 1)
+        self.prefetch_disk_budget_gb = config.get_float('PREFETCH_DISK_BUDGET_GB', 20.0)
+
+        # Per-job journal in TEMP_DIR: a worker that died mid-job resumes from the last verified stage
+        self.journal_enabled = config.get_bool('JOB_JOURNAL_ENABLED', False)
+        self.journal_max_age_hours = config.get_float('JOB_JOURNAL_MAX_AGE_HOURS', 24.0)
+
+        # Sources of unfinished jobs stay on disk for their retry (LRU, evicted to keep MIN_DISK_SPACE_GB free)
+        self.source_cache: Optional[SourceCache] = None
+        if config.get_bool('SOURCE_CACHE_ENABLED', False):
+            self.source_cache = SourceCache(
+                self.temp_dir / 'source-cache',
+                max_bytes=int(config.get_float('SOURCE_CACHE_GB', 20.0) * (1024 ** 3)),
+                reserve_bytes=int(self.min_disk_space_gb * (1024 ** 3)),
+            )
+        self._claim_endpoint: Optional[bool] = None  # unknown until the first claim
+
+        # Idle behaviour: long-poll the claim endpoint, else jittered POLL_INTERVAL sleeps
+        self.long_poll_seconds = config.get_int('LONG_POLL_SECONDS', 10)
+        self.poll_jitter = min(0.9, max(0.0, config.get_float('POLL_JITTER', 0.25)))
+        self._long_poll_supported = False
+
+        # Live encode progress (parsed from ffmpeg -progress), optionally pushed to the API
+        self.progress_push_interval = config.get_float('PROGRESS_PUSH_INTERVAL', 15.0)  # 0 = off
+        self.progress_log_interval = config.get_float('PROGRESS_LOG_INTERVAL', 60.0)
+        self.ffmpeg_stderr_lines = config.get_int('FFMPEG_STDERR_LINES', 200)
+
+        # ffmpeg watchdog: kill when output stops advancing, or after duration x factor
+        self.ffmpeg_stall_seconds = config.get_float('FFMPEG_STALL_SECONDS', 180.0)  # 0 = off
+        self.ffmpeg_timeout_factor = config.get_float('FFMPEG_TIMEOUT_FACTOR', 4.0)
+        self.ffmpeg_timeout_min = config.get_float('FFMPEG_TIMEOUT_MIN', 300.0)
+        self.ffmpeg_timeout_default = config.get_float('FFMPEG_TIMEOUT_DEFAULT', 7200.0)
+        self.job_progress: Dict[str, Dict[str, Any]] = {}
+        self._progress_lock = threading.Lock()
+
+        # Fragmented MP4 streamed to S3 as multipart parts while ffmpeg runs (no faststart rewrite)
+        self.streaming_upload = config.get_bool('STREAMING_UPLOAD_ENABLED', False)
+        self.streaming_part_size = config.get_int('STREAMING_UPLOAD_PART_MB', 16) * 1024 * 1024
+
+        # Feed ffmpeg straight from the source (moov-first MP4 only) instead of downloading it first
+        self.source_streaming = config.get_bool('SOURCE_STREAMING_ENABLED', False)
+        self.source_stream_max_head = config.get_int('SOURCE_STREAM_MAX_HEAD_MB', 32) * 1024 * 1024
+
+        # ABR: an HLS ladder (fMP4 segments + master playlist) next to the MP4; jobs can set encoding_options.abr
+        self.abr_enabled = config.get_bool('ABR_ENABLED', False)
+        self.abr_ladder = parse_ladder(config.get('ABR_LADDER', DEFAULT_LADDER))
+        self.hls_segment_seconds = config.get_float('HLS_SEGMENT_SECONDS', 4.0)
+
+        # Per-title: a fast low-res sample encode picks CRF/maxrate per job; jobs can set encoding_options.per_title
+        self.per_title_enabled = config.get_bool('PER_TITLE_ENABLED', False)
+        self.per_title_samples = config.get_int('PER_TITLE_SAMPLES', 3)
+        self.per_title_sample_seconds = config.get_float('PER_TITLE_SAMPLE_SECONDS', 4.0)
+        self.per_title_sample_lines = config.get_int('PER_TITLE_SAMPLE_LINES', 360)
+        self.per_title_crf_min = config.get_int('PER_TITLE_CRF_MIN', 20)
+        self.per_title_crf_max = config.get_int('PER_TITLE_CRF_MAX', 30)
+        self.per_title_maxrate_min_factor = config.get_float('PER_TITLE_MAXRATE_MIN_FACTOR', 0.5)
+        self.per_title_maxrate_max_factor = config.get_float('PER_TITLE_MAXRATE_MAX_FACTOR', 2.0)
+
+        # Backlog-aware preset: faster x264 presets while the queue is deep, slower ones when it is idle
+        self.preset_policy: Optional[PresetPolicy] = None
+        if config.get_bool('PRESET_POLICY_ENABLED', False):
+            self.preset_policy = PresetPolicy(
+                parse_tiers(config.get('PRESET_TIERS', 'slow,medium,fast,veryfast')),
+                str(config.get('PRESET_DEFAULT', 'medium')).lower(),
+                self.get_queue_stats,
+                target_drain_seconds=config.get_float('PRESET_TARGET_DRAIN_MINUTES', 60.0) * 60,
+                hysteresis=config.get_float('PRESET_HYSTERESIS', 0.25),
+                min_dwell_seconds=config.get_float('PRESET_MIN_DWELL_SECONDS', 300.0),
+                stats_interval=config.get_float('PRESET_STATS_INTERVAL', 30.0),
+                jobs_per_worker=1 + max(0, self.prefetch_jobs),
+            )
+
         # Optional S3 uploader (for uploads after encoding)
         self.s3_uploader: Optional[S3Uploader] = None
         if S3_AVAILABLE and create_s3_uploader:
@@ -116,6 +340,19 @@ class VideoEncoder:
         else:
             logger.info("S3 uploader not available (no boto3 or helper).")
 
+        # Content-addressed encode cache: identical source + settings -> copy the earlier output
+        self.encode_cache = None
+        if config.get_bool('ENCODE_CACHE_ENABLED', False) and self.s3_uploader:
+            backend = str(config.get('ENCODE_CACHE_INDEX', 's3')).lower()  # s3 | sqlite
+            if backend == 'sqlite':
+                self.encode_cache = SqliteCacheIndex(
+                    Path(config.get('ENCODE_CACHE_SQLITE_PATH', str(self.temp_dir / 'encode-cache.sqlite3'))))
+            else:
+                self.encode_cache = S3CacheIndex(self.s3_uploader.s3_client, self.s3_uploader.bucket_name,
+                                                 config.get('ENCODE_CACHE_PREFIX', 'encode-cache'))
+
+        self._register_metric_gauges()
+
         if not config.validate_required(['LARAVEL_API_URL']):
             raise ValueError("Missing required configuration (LARAVEL_API_URL). Check your .env.")
 
@@ -123,6 +360,66 @@ class VideoEncoder:
         logger.info(f" API URL: {self.api_base_url}")
         logger.info(f" Temp Dir: {self.temp_dir}")
 
+    # -------------------- Metrics --------------------
+    def start_metrics_server(self) -> None:
+        """Serve /metrics on METRICS_PORT (no-op when unset or already running)."""
+        if not self.metrics_port or self.metrics_server:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics.registry, self.metrics_host, self.metrics_port).start()
+            logger.info(f"Metrics on http://{self.metrics_host}:{self.metrics_server.port}/metrics")
+        except OSError as e:
+            logger.warning(f"Metrics server not started on port {self.metrics_port}: {e}")
+
+    def _register_metric_gauges(self) -> None:
+        """Gauges read from live worker state at scrape time."""
+        self.metrics.gauge('encoder_jobs_in_flight', 'Jobs claimed by this worker and not yet finished.',
+                           self.jobs_in_flight)
+        self.metrics.gauge('encoder_temp_dir_bytes', 'Bytes held in TEMP_DIR.', self._temp_dir_bytes)
+        self.metrics.gauge('encoder_source_cache_bytes', 'Bytes of sources kept for retries.',
+                           lambda: self.source_cache.total_bytes() if self.source_cache else None)
+        self.metrics.gauge('encoder_temp_free_bytes', 'Free bytes on the TEMP_DIR filesystem.',
+                           lambda: shutil.disk_usage(self.temp_dir).free)
+        self.metrics.gauge('encoder_pipeline_queued_jobs', 'Jobs waiting for each pipeline stage.',
+                           lambda: {(name, ): snap['queued'] for name, snap in self.pipeline.queue_depths().items()}
+                           if self.pipeline else None,
+                           labels=['stage'])
+        self.metrics.gauge('encoder_preset_current', 'x264 preset tier the preset policy currently picks (1).',
+                           lambda: {(p, ): float(p == self.preset_policy.current) for p in self.preset_policy.tiers}
+                           if self.preset_policy else None,
+                           labels=['preset'])
+        self.metrics.gauge('encoder_queue_pending_jobs', 'Pending jobs in the queue at the last preset decision.',
+                           lambda: self.preset_policy.last_decision.get('pending') if self.preset_policy else None)
+        self.metrics.gauge('encoder_projected_drain_seconds',
+                           'Projected time to drain the queue at the chosen preset (last decision).',
+                           lambda: self.preset_policy.last_decision.get('drain_seconds') if self.preset_policy else None)
+
+    def jobs_in_flight(self) -> int:
+        return self.pipeline.in_flight() if self.pipeline else self._running_jobs
+
+    def _temp_dir_bytes(self) -> int:
+        total = 0
+        for root, _dirs, files in os.walk(self.temp_dir):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass  # removed while walking
+        return total
+
+    @staticmethod
+    def _api_endpoint(url: str) -> str:
+        """'.../api/encoding-queue/abc123/completed' -> 'encoding-queue/completed' (no video codes in labels)."""
+        parts = urlparse(url).path.split('/api/', 1)[-1].strip('/').split('/')
+        return f"{parts[0]}/{parts[-1]}" if len(parts) >= 3 else '/'.join(parts)
+
+    def _observe_api_response(self, r: requests.Response, *args, **kwargs) -> None:
+        if not r.url.startswith(self.api_base_url):
+            return  # source downloads share the session
+        endpoint = self._api_endpoint(r.url)
+        self.metrics.api_seconds.observe(r.elapsed.total_seconds(), endpoint=endpoint)
+        self.metrics.api_requests.inc(endpoint=endpoint, status=str(r.status_code))
+
     # -------------------- API endpoints --------------------
     @retry_on_exception(max_retries=3, delay=2.0)
     def get_next_pending_job(self) -> Optional[Dict[str, Any]]:
@@ -133,27 +430,102 @@ class VideoEncoder:
         r.raise_for_status()
         return r.json()
 
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """GET /api/encoding-queue/stats (pending/processing counts, average processing time)."""
+        r = self.session.get(f"{self.api_base_url}/api/encoding-queue/stats", timeout=10)
+        r.raise_for_status()
+        return r.json()
+
+    @staticmethod
+    def _raise_for_lease(r: requests.Response, video_code: str) -> None:
+        """409 means another worker holds (or took over) the job's lease."""
+        if r.status_code == 409:
+            raise LeaseLostError(f"{video_code}: {r.text[:200]}")
+
+    @retry_on_exception(max_retries=3, delay=2.0)
+    def claim_jobs(self, limit: int, wait: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        POST /api/encoding-queue/claim?limit=N[&wait=S]
+        Atomically claims up to N jobs (each already processing, with a lease).
+        With wait, the API holds the request until a job arrives (long-poll).
+        Returns None when the API has no claim endpoint.
+        """
+        url = f"{self.api_base_url}/api/encoding-queue/claim"
+        params: Dict[str, Any] = {"limit": limit}
+        if wait > 0:
+            params["wait"] = wait
+        r = self.session.post(url, params=params, json={"lease_seconds": self.lease_seconds},
+                              timeout=30 + max(0, wait), allow_redirects=False)
+        if r.status_code in (404, 405):
+            return None
+        r.raise_for_status()
+        data = r.json()
+        if wait > 0:
+            # Servers without long-poll don't echo the wait they honoured
+            self._long_poll_supported = 'wait' in data
+        return data.get('jobs', [])
+
     @retry_on_exception(max_retries=3, delay=1.0)
-    def mark_as_processing(self, video_code: str) -> bool:
+    def mark_as_processing(self, video_code: str) -> Dict[str, Any]:
+        """Claim the job; returns the API response (lease_token/lease_expires_at when leases are supported)."""
         url = f"{self.api_base_url}/api/encoding-queue/{video_code}/processing"
-        r = self.session.post(url, json={}, timeout=30, allow_redirects=False)
+        r = self.session.post(url, json={"lease_seconds": self.lease_seconds}, timeout=30, allow_redirects=False)
+        self._raise_for_lease(r, video_code)
+        r.raise_for_status()
+        try:
+            return r.json() or {}
+        except ValueError:
+            return {}
+
+    def renew_lease(self, video_code: str, lease_token: str, lease_seconds: int) -> bool:
+        """Heartbeat; the lease keeper retries transient failures on its next tick."""
+        url = f"{self.api_base_url}/api/encoding-queue/{video_code}/heartbeat"
+        payload = {"lease_token": lease_token, "lease_seconds": lease_seconds}
+        r = self.session.post(url, json=payload, timeout=15, allow_redirects=False)
+        if r.status_code == 404:
+            raise LeaseLostError(f"{video_code}: job not found")
+        self._raise_for_lease(r, video_code)
         r.raise_for_status()
         return True
 
+    def report_progress(self, video_code: str, progress: Dict[str, Any],
+                        lease_token: Optional[str] = None) -> bool:
+        """Best-effort progress push; never retried (the next update supersedes it)."""
+        url = f"{self.api_base_url}/api/encoding-queue/{video_code}/progress"
+        payload: Dict[str, Any] = {"progress": progress}
+        if lease_token:
+            payload["lease_token"] = lease_token
+        r = self.session.post(url, json=payload, timeout=5, allow_redirects=False)
+        self._raise_for_lease(r, video_code)
+        return r.ok
+
     @retry_on_exception(max_retries=3, delay=1.0)
-    def mark_as_completed(self, video_code: str, output_path: str, thumbnail_paths: Optional[List[str]] = None) -> bool:
+    def mark_as_completed(self, video_code: str, output_path: str, thumbnail_paths: Optional[List[str]] = None,
+                          encoding_result: Optional[Dict[str, Any]] = None,
+                          lease_token: Optional[str] = None, manifest_path: Optional[str] = None) -> bool:
         url = f"{self.api_base_url}/api/encoding-queue/{video_code}/completed"
         payload: Dict[str, Any] = {"output_file_path": output_path}
         if thumbnail_paths:
             payload["thumbnail_paths"] = thumbnail_paths
+        if manifest_path:
+            payload["manifest_path"] = manifest_path
+        if encoding_result:
+            payload["encoding_result"] = encoding_result
+        if lease_token:
+            payload["lease_token"] = lease_token
         r = self.session.post(url, json=payload, timeout=30, allow_redirects=False)
+        self._raise_for_lease(r, video_code)
         r.raise_for_status()
         return True
 
     @retry_on_exception(max_retries=3, delay=1.0)
-    def mark_as_failed(self, video_code: str, error_message: str) -> bool:
+    def mark_as_failed(self, video_code: str, error_message: str, lease_token: Optional[str] = None) -> bool:
         url = f"{self.api_base_url}/api/encoding-queue/{video_code}/failed"
-        r = self.session.post(url, json={"error_message": error_message}, timeout=30, allow_redirects=False)
+        payload: Dict[str, Any] = {"error_message": error_message}
+        if lease_token:
+            payload["lease_token"] = lease_token
+        r = self.session.post(url, json=payload, timeout=30, allow_redirects=False)
+        self._raise_for_lease(r, video_code)
         r.raise_for_status()
         return True
 
@@ -206,8 +578,10 @@ class VideoEncoder:
                 if p.startswith('https://s3.'):
                     return {'bucket': m.group(2), 'key': m.group(3), 'region': m.group(1), 'endpoint_url': None}
                 return {'bucket': m.group(1), 'key': m.group(3), 'region': m.group(2), 'endpoint_url': None}
-            # custom endpoint
+            # custom endpoint (path-style URLs carry the bucket as the first segment)
             key = m.group(1)
+            if configured_bucket and key.startswith(configured_bucket + '/'):
+                key = key[len(configured_bucket) + 1:]
             return {
                 'bucket': configured_bucket,
                 'key': key,
@@ -216,64 +590,94 @@ class VideoEncoder:
             }
         return None
 
-    def _download_via_s3(self, s3_info: Dict[str, str], local_path: Path) -> bool:
-        """Download via boto3 S3 client."""
-        try:
-            import boto3
-            from botocore.exceptions import ClientError, NoCredentialsError
-            from botocore.config import Config as BotoConfig
+    def _s3_source_client(self, s3_info: Dict[str, str]) -> Optional[Any]:
+        """The shared boto3 client for a source's endpoint; None without credentials."""
+        from s3_uploader import get_s3_client
 
-            access_key = config.get('AWS_ACCESS_KEY_ID')
-            secret_key = config.get('AWS_SECRET_ACCESS_KEY')
-            region = s3_info.get('region') or config.get('AWS_DEFAULT_REGION') or 'us-east-1'
-            endpoint_url = s3_info.get('endpoint_url') or config.get('AWS_ENDPOINT') or config.get('AWS_URL')
-            use_path_style = config.get_bool('AWS_USE_PATH_STYLE_ENDPOINT', False)
+        access_key = config.get('AWS_ACCESS_KEY_ID')
+        secret_key = config.get('AWS_SECRET_ACCESS_KEY')
+        region = s3_info.get('region') or config.get('AWS_DEFAULT_REGION') or 'us-east-1'
+        endpoint_url = s3_info.get('endpoint_url') or config.get('AWS_ENDPOINT') or config.get('AWS_URL')
 
-            if not access_key or not secret_key:
-                logger.warning("Missing S3 credentials; cannot use S3 client.")
-                return False
-
-            client_kwargs: Dict[str, Any] = {
-                'aws_access_key_id': access_key,
-                'aws_secret_access_key': secret_key,
-                'region_name': region,
-                'config': BotoConfig(
-                    s3={'addressing_style': 'path' if use_path_style else 'virtual'},
-                    signature_version='s3v4',
-                )
-            }
-            if endpoint_url:
-                client_kwargs['endpoint_url'] = endpoint_url
-
-            s3 = boto3.client('s3', **client_kwargs)
-            logger.info(f"S3 head_object: s3://{s3_info['bucket']}/{s3_info['key']}")
-            s3.head_object(Bucket=s3_info['bucket'], Key=s3_info['key'])
+        if not access_key or not secret_key:
+            logger.warning("Missing S3 credentials; cannot use S3 client.")
+            return None
+        return get_s3_client(region, endpoint_url, access_key, secret_key)
 
-            logger.info(f"Downloading S3 -> {local_path}")
-            s3.download_file(s3_info['bucket'], s3_info['key'], str(local_path))
-            if not local_path.exists() or local_path.stat().st_size == 0:
+    def _download_via_s3(self, s3_info: Dict[str, str], local_path: Path) -> Optional[str]:
+        """Download via the shared boto3 S3 client; returns the content SHA-256, None to fall back to HTTP."""
+        try:
+            from botocore.exceptions import NoCredentialsError
+            from s3_uploader import get_transfer_config
+
+            s3 = self._s3_source_client(s3_info)
+            if s3 is None:
+                return None
+
+            # download_fileobj HEADs the object itself; a missing key surfaces as ClientError below
+            logger.info(f"Downloading s3://{s3_info['bucket']}/{s3_info['key']} -> {local_path}")
+            # Ranged parts land out of order; the hasher follows them as they are written
+            hasher = ContentHasher(local_path)
+            with open(local_path, 'wb', buffering=0) as raw:
+                s3.download_fileobj(s3_info['bucket'], s3_info['key'], HashingWriter(raw, hasher),
+                                    Config=get_transfer_config())
+            size = local_path.stat().st_size
+            if size == 0:
                 raise RetryableError("Downloaded file is empty.")
-            return True
+            return hasher.finish(size)
 
         except NoCredentialsError:
             logger.warning("No S3 credentials, fallback to HTTP.")
-            return False
+            return None
         except Exception as e:
             logger.warning(f"S3 download failed ({e}); fallback to HTTP.")
-            return False
+            return None
 
     @retry_on_exception(max_retries=2, delay=5.0)
-    def download_file(self, url: str, local_path: Path) -> bool:
-        """Download file via S3 when possible; fallback to HTTP."""
+    def download_file(self, url: str, local_path: Path) -> str:
+        """Download file via S3 when possible; fallback to HTTP. Returns the content SHA-256."""
         logger.info(f"Downloading: {url}")
+        started = time.monotonic()
 
         # Try S3 if applicable
         s3_info = self._parse_s3_url(url)
         if s3_info:
-            if self._download_via_s3(s3_info, local_path):
-                return True
+            digest = self._download_via_s3(s3_info, local_path)
+            if digest:
+                self._observe_download(local_path, started, 's3')
+                return digest
 
         # HTTP fallback
+        headers = self._source_headers(url)
+
+        # Ensure space
+        if not self._check_disk_space(local_path.parent):
+            raise RetryableError("Insufficient disk space.")
+
+        # Parallel byte ranges when the server allows it; resumes missing parts on retry
+        hasher = ContentHasher(local_path)
+        size = self.downloader.download(url, local_path, headers, hasher=hasher)
+
+        if not local_path.exists() or size == 0:
+            raise RetryableError("Downloaded file is empty.")
+        digest = hasher.finish(size)
+        self._observe_download(local_path, started, 'http')
+        return digest
+
+    def fetch_file(self, url: str, local_path: Path, timeout: int = 60) -> bool:
+        """Plain GET of a small auxiliary file (e.g. an uploaded thumbnail): no hashing, no download metrics."""
+        r = self.session.get(url, stream=True, timeout=timeout, headers=self._source_headers(url))
+        if r.status_code in (401, 403, 404):
+            raise NonRetryableError(f"HTTP {r.status_code} for {url}")
+        r.raise_for_status()
+        with open(local_path, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=65536):
+                if chunk:
+                    f.write(chunk)
+        return local_path.stat().st_size > 0
+
+    @staticmethod
+    def _source_headers(url: str) -> Dict[str, str]:
         headers: Dict[str, str] = {}
         if 'mojocloud.com' in url.lower():
             token = config.get('MOJOCLOUD_AUTH_TOKEN')
@@ -282,24 +686,46 @@ class VideoEncoder:
                 headers['Authorization'] = f"Bearer {token}"
             elif access_key:
                 headers['Authorization'] = f"AccessKey {access_key}"
+        return headers
 
-        r = self.session.get(url, stream=True, timeout=300, headers=headers)
-        if r.status_code in (401, 403, 404):
-            raise NonRetryableError(f"HTTP {r.status_code} for {url}")
-        r.raise_for_status()
-
-        # Ensure space
-        if not self._check_disk_space(local_path.parent):
-            raise RetryableError("Insufficient disk space.")
+    def _source_validator(self, url: str) -> Optional[Dict[str, Any]]:
+        """ETag/size the origin reports for url right now; None when it can't tell (no caching then)."""
+        try:
+            s3_info = self._parse_s3_url(url)
+            client = self._s3_source_client(s3_info) if s3_info else None
+            if client is not None:
+                head = client.head_object(Bucket=s3_info['bucket'], Key=unquote(s3_info['key'].split('?', 1)[0]))
+                etag, size = head.get('ETag'), head.get('ContentLength')
+            else:
+                headers = {**self._source_headers(url), 'Accept-Encoding': 'identity'}
+                size, _, etag = self.downloader.probe(url, headers)
+        except Exception as e:
+            logger.debug(f"Could not validate source {url.split('?', 1)[0]}: {e}")
+            return None
+        if etag is None and size is None:
+            return None
+        return {'etag': etag, 'size': size}
 
-        with open(local_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    @contextmanager
+    def _open_source(self, url: str, length: Optional[int] = None) -> Iterator[Any]:
+        """Readable stream of the source (its first `length` bytes when given), from S3 or over HTTP."""
+        s3_info = self._parse_s3_url(url)
+        client = self._s3_source_client(s3_info) if s3_info else None
+        if client is not None:
+            extra = {'Range': f"bytes=0-{length - 1}"} if length else {}
+            body = client.get_object(Bucket=s3_info['bucket'], Key=unquote(s3_info['key'].split('?', 1)[0]),
+                                     **extra)['Body']
+        else:
+            body = self.downloader.open(url, self._source_headers(url), length).raw
+        try:
+            yield body
+        finally:
+            body.close()
 
-        if not local_path.exists() or local_path.stat().st_size == 0:
-            raise RetryableError("Downloaded file is empty.")
-        return True
+    def _observe_download(self, local_path: Path, started: float, source: str) -> None:
+        # Prefetched downloads run outside the download stage, so they are timed here
+        self.metrics.download_seconds.observe(time.monotonic() - started, source=source)
+        self.metrics.transfer_bytes.inc(local_path.stat().st_size, direction='download')
 
     # -------------------- System helpers --------------------
     def _check_disk_space(self, path: Path, min_gb: Optional[float] = None) -> bool:
@@ -311,202 +737,522 @@ class VideoEncoder:
         except Exception:
             return True  # Best effort
 
+    def _media_info(self, path: Path) -> Optional[MediaInfo]:
+        """Probe once per file version; later calls hit the cache."""
+        return self.media_probe.probe(path)
+
     def _validate_video_file(self, video_path: Path) -> bool:
-        try:
-            cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', str(video_path)]
-            res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if res.returncode != 0:
-                return False
-            data = json.loads(res.stdout)
-            return any(s.get('codec_type') == 'video' for s in data.get('streams', []))
-        except Exception:
-            return False
+        info = self._media_info(video_path)
+        return bool(info and info.has_video)
 
     def _get_video_dimensions(self, video_path: Path) -> Tuple[Optional[int], Optional[int]]:
-        try:
-            cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', str(video_path)]
-            res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if res.returncode != 0:
-                return None, None
-            data = json.loads(res.stdout)
-            for s in data.get('streams', []):
-                if s.get('codec_type') == 'video':
-                    return s.get('width'), s.get('height')
-            return None, None
-        except Exception:
+        info = self._media_info(video_path)
+        if not info:
             return None, None
+        return info.width, info.height
 
     def _probe_media_info(self, path: Path) -> Tuple[Optional[int], Optional[int], Optional[int]]:
         """
-        Return (duration_seconds, width, height) using ffprobe, or (None, None, None) on failure.
+        Return (duration_seconds, width, height), or (None, None, None) on failure.
         """
-        try:
-            cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', str(path)]
-            res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if res.returncode != 0:
-                return None, None, None
-            data = json.loads(res.stdout)
-            duration = data.get('format', {}).get('duration')
-            duration_i = int(float(duration)) if duration else None
-
-            width = height = None
-            for s in data.get('streams', []):
-                if s.get('codec_type') == 'video':
-                    width = s.get('width') or width
-                    height = s.get('height') or height
-                    if width and height:
-                        break
-            return duration_i, width, height
-        except Exception:
+        info = self._media_info(path)
+        if not info:
             return None, None, None
+        return info.duration_seconds, info.width, info.height
 
     # -------------------- Thumbnails --------------------
+    @staticmethod
+    def _thumbnail_times(duration: float, count: int) -> List[float]:
+        """Even positions across 10%..90% of the video (middle for a single frame)."""
+        if count <= 0:
+            return []
+        if count == 1:
+            return [duration * 0.5]
+        return [duration * (0.1 + 0.8 * (i / (count - 1))) for i in range(count)]
+
+    @staticmethod
+    def _thumbnail_select_expr(times: List[float]) -> str:
+        """
+        select= expression keeping the first frame at/after each timestamp.
+        prev_selected_t is NaN until the first frame is picked.
+        """
+        terms = []
+        for i, t in enumerate(times):
+            if i == 0:
+                terms.append(f"gte(t\\,{t:.3f})*isnan(prev_selected_t)")
+            else:
+                terms.append(f"gte(t\\,{t:.3f})*lt(prev_selected_t\\,{t:.3f})")
+        return "select='" + "+".join(terms) + "'"
+
+    def _process_uploaded_thumbnail(self, job_data: Dict[str, Any], video_code: str,
+                                    is_vertical: bool) -> Optional[Path]:
+        """Download the uploader-provided thumbnail and restyle it as thumb #1."""
+        uploaded_url = job_data.get('uploaded_thumbnail_url')
+        if not uploaded_url:
+            return None
+        first_thumb = None
+        try:
+            dl_src = self.temp_dir / f"{video_code}_uploaded_src.jpg"
+            if self.fetch_file(uploaded_url, dl_src):
+                out_path = self.temp_dir / f"{video_code}_thumb_1.jpg"
+                if is_vertical:
+                    cmd = [
+                        "ffmpeg", "-v", "error",
+                        "-i", str(dl_src),
+                        "-filter_complex", THUMB_VERTICAL_FC,
+                        "-map", "[outv]",
+                        "-frames:v", "1",
+                        "-q:v", "2",
+                        "-y", str(out_path),
+                    ]
+                else:
+                    cmd = [
+                        "ffmpeg", "-v", "error",
+                        "-i", str(dl_src),
+                        "-vf", THUMB_LETTERBOX_VF,
+                        "-frames:v", "1",
+                        "-q:v", "2",
+                        "-y", str(out_path),
+                    ]
+                res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+                if res.returncode == 0 and out_path.exists() and out_path.stat().st_size > 0:
+                    first_thumb = out_path
+                    logger.info("Uploaded thumbnail processed as #1.")
+                else:
+                    logger.warning(f"Failed to process uploaded thumbnail: {res.stderr}")
+            # cleanup
+            try:
+                dl_src.unlink(missing_ok=True)
+            except Exception:
+                pass
+        except Exception as e:
+            logger.warning(f"Could not use uploaded thumbnail: {e}")
+        return first_thumb
+
+    def _extract_thumbnail_at(self, input_path: Path, t: float, out_path: Path, is_vertical: bool) -> bool:
+        """Legacy path: one ffmpeg process (input seek + single frame) per thumbnail."""
+        if is_vertical:
+            cmd = [
+                "ffmpeg", "-v", "error",
+                "-ss", f"{t:.3f}", "-i", str(input_path),
+                "-frames:v", "1",
+                "-filter_complex", THUMB_VERTICAL_FC,
+                "-map", "[outv]",
+                "-q:v", "2",
+                "-y", str(out_path),
+            ]
+        else:
+            cmd = [
+                "ffmpeg", "-v", "error",
+                "-ss", f"{t:.3f}", "-i", str(input_path),
+                "-vframes", "1",
+                "-vf", THUMB_LETTERBOX_VF,
+                "-q:v", "2",
+                "-y", str(out_path),
+            ]
+
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if res.returncode == 0 and out_path.exists() and out_path.stat().st_size > 0:
+            return True
+        logger.warning(f"Failed to generate thumbnail {out_path.name}: {res.stderr}")
+        return False
+
+    def _extract_thumbnails_single_pass(self, input_path: Path, video_code: str, times: List[float],
+                                        start_index: int, is_vertical: bool, duration: float) -> List[Path]:
+        """
+        Pull all frames in one ffmpeg run.
+          * Short sources: decode once, a select-by-timestamp filter keeps one
+            frame per position and the image2 muxer numbers them.
+          * Long sources: one input per position, each opened with -ss so only the
+            GOP around the timestamp is read (a linear pass would demux the whole file).
+        """
+        cmd = ["ffmpeg", "-v", "error"]
+        seek_inputs = duration >= self.thumbnail_seek_min_duration
+
+        if seek_inputs:
+            for t in times:
+                cmd += ["-ss", f"{t:.3f}", "-i", str(input_path)]
+            graph = []
+            for i in range(len(times)):
+                if is_vertical:
+                    graph.append(
+                        THUMB_VERTICAL_FC.replace("[0:v]", f"[{i}:v]").replace("[bg]", f"[bg{i}]")
+                        .replace("[fg]", f"[fg{i}]").replace("[outv]", f"[out{i}]")
+                    )
+                else:
+                    graph.append(f"[{i}:v]{THUMB_LETTERBOX_VF}[out{i}]")
+            cmd += ["-filter_complex", ";".join(graph)]
+            for i in range(len(times)):
+                out_path = self.temp_dir / f"{video_code}_thumb_{start_index + i}.jpg"
+                cmd += ["-map", f"[out{i}]", "-frames:v", "1", "-q:v", "2", "-y", str(out_path)]
+        else:
+            select = self._thumbnail_select_expr(times)
+            cmd += ["-i", str(input_path), "-an", "-sn", "-dn"]
+            if is_vertical:
+                cmd += [
+                    "-filter_complex", f"[0:v]{select},split[src1][src2];"
+                    + THUMB_VERTICAL_FC.replace("[0:v]", "[src1]", 1).replace("[0:v]", "[src2]", 1),
+                    "-map", "[outv]",
+                ]
+            else:
+                cmd += ["-vf", f"{select},{THUMB_LETTERBOX_VF}"]
+            cmd += [
+                "-vsync", "vfr",
+                "-frames:v", str(len(times)),
+                "-start_number", str(start_index),
+                "-q:v", "2",
+                "-y", str(self.temp_dir / f"{video_code}_thumb_%d.jpg"),
+            ]
+
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=max(120, int(duration)))
+        if res.returncode != 0:
+            logger.warning(f"Single-pass thumbnail extraction failed: {res.stderr.strip()[-500:]}")
+
+        produced: List[Path] = []
+        for i, t in enumerate(times):
+            index = start_index + i
+            out_path = self.temp_dir / f"{video_code}_thumb_{index}.jpg"
+            if out_path.exists() and out_path.stat().st_size > 0:
+                produced.append(out_path)
+                logger.info(f"Generated thumbnail #{index} near {t:.1f}s "
+                            f"({'vertical blur' if is_vertical else 'letterbox'})")
+            else:
+                break  # keep numbering contiguous; the caller fills the rest
+        return produced
+
     def generate_thumbnails(
         self,
         input_path: Path,
         video_code: str,
         job_data: Dict[str, Any],
         num_thumbnails: int = 5,
+        mode: Optional[str] = None,
     ) -> List[Path]:
         """
         Generate N thumbnails:
           * If 'uploaded_thumbnail_url' is given, make it thumb #1 (processed to match style)
           * Extract remaining from video at even intervals (10%..90%)
           * For vertical content, use blurred background composition
+          * mode 'single' (default) pulls every frame in one ffmpeg run;
+            'per_frame' spawns one ffmpeg per thumbnail
         """
+        mode = mode or self.thumbnail_mode
         thumbnails: List[Path] = []
         try:
             # Probe video
-            probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', str(input_path)]
-            probe = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=30)
-            if probe.returncode != 0:
+            info = self._media_info(input_path)
+            if not info:
                 logger.warning("ffprobe failed; cannot generate thumbnails.")
                 return thumbnails
-            meta = json.loads(probe.stdout)
-            duration = float(meta.get('format', {}).get('duration', 0) or 0)
-            v_stream = next((s for s in meta.get('streams', []) if s.get('codec_type') == 'video'), None)
-            if not duration or not v_stream:
+            duration = info.duration or 0
+            if not duration or not info.has_video:
                 logger.warning("Missing duration or video stream; cannot generate thumbnails.")
                 return thumbnails
-            vw = v_stream.get('width')
-            vh = v_stream.get('height')
+            vw = info.width
+            vh = info.height
             if not vw or not vh:
                 logger.warning("Missing video dimensions; cannot generate thumbnails.")
                 return thumbnails
 
             is_vertical = vh > vw
 
-            # Filters
-            fit_640x360_vf = (
-                "scale=640:360:force_original_aspect_ratio=decrease,"
-                "pad=640:360:(ow-iw)/2:(oh-ih)/2:black"
-            )
-            vertical_fc = (
-                "[0:v]scale=640:360:force_original_aspect_ratio=increase,"
-                "crop=640:360,boxblur=20:1[bg];"
-                "[0:v]scale=-2:360:force_original_aspect_ratio=decrease[fg];"
-                "[bg][fg]overlay=(W-w)/2:(H-h)/2[outv]"
-            )
-
             # Uploaded thumbnail as #1 (processed to match style)
-            uploaded_url = job_data.get('uploaded_thumbnail_url')
-            if uploaded_url:
-                try:
-                    dl_src = self.temp_dir / f"{video_code}_uploaded_src.jpg"
-                    if self.download_file(uploaded_url, dl_src):
-                        first_thumb = self.temp_dir / f"{video_code}_thumb_1.jpg"
-                        if is_vertical:
-                            cmd = [
-                                "ffmpeg", "-v", "error",
-                                "-i", str(dl_src),
-                                "-filter_complex", vertical_fc,
-                                "-map", "[outv]",
-                                "-frames:v", "1",
-                                "-q:v", "2",
-                                "-y", str(first_thumb),
-                            ]
-                        else:
-                            cmd = [
-                                "ffmpeg", "-v", "error",
-                                "-i", str(dl_src),
-                                "-vf", fit_640x360_vf,
-                                "-frames:v", "1",
-                                "-q:v", "2",
-                                "-y", str(first_thumb),
-                            ]
-                        res = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                        if res.returncode == 0 and first_thumb.exists() and first_thumb.stat().st_size > 0:
-                            thumbnails.append(first_thumb)
-                            logger.info("Uploaded thumbnail processed as #1.")
-                        else:
-                            logger.warning(f"Failed to process uploaded thumbnail: {res.stderr}")
-                    # cleanup
-                    try:
-                        dl_src.unlink(missing_ok=True)
-                    except Exception:
-                        pass
-                except Exception as e:
-                    logger.warning(f"Could not use uploaded thumbnail: {e}")
+            first_thumb = self._process_uploaded_thumbnail(job_data, video_code, is_vertical)
+            if first_thumb:
+                thumbnails.append(first_thumb)
 
             # Remaining from video
             remaining = max(0, num_thumbnails - len(thumbnails))
             if remaining == 0:
                 return thumbnails
 
-            def time_at(idx: int, count: int) -> float:
-                return duration * 0.5 if count == 1 else duration * (0.1 + 0.8 * (idx / (count - 1)))
-
-            for i in range(remaining):
-                t = time_at(i, remaining)
-                index = len(thumbnails) + 1
-                out_path = self.temp_dir / f"{video_code}_thumb_{index}.jpg"
-
-                if is_vertical:
-                    cmd = [
-                        "ffmpeg", "-v", "error",
-                        "-ss", f"{t:.3f}", "-i", str(input_path),
-                        "-frames:v", "1",
-                        "-filter_complex", vertical_fc,
-                        "-map", "[outv]",
-                        "-q:v", "2",
-                        "-y", str(out_path),
-                    ]
-                else:
-                    cmd = [
-                        "ffmpeg", "-v", "error",
-                        "-ss", f"{t:.3f}", "-i", str(input_path),
-                        "-vframes", "1",
-                        "-vf", fit_640x360_vf,
-                        "-q:v", "2",
-                        "-y", str(out_path),
-                    ]
-
-                res = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                if res.returncode == 0 and out_path.exists() and out_path.stat().st_size > 0:
-                    thumbnails.append(out_path)
-                    logger.info(f"Generated thumbnail #{index} at {t:.1f}s "
-                                f"({'vertical blur' if is_vertical else 'letterbox'})")
-                else:
-                    logger.warning(f"Failed to generate thumbnail #{index}: {res.stderr}")
-
+            thumbnails += self._extract_video_thumbnails(
+                input_path, video_code, duration, is_vertical, remaining, len(thumbnails) + 1, mode
+            )
             return thumbnails
 
         except Exception as e:
             logger.error(f"Thumbnail generation failed: {e}")
             return thumbnails
 
+    def _extract_video_thumbnails(self, input_path: Path, video_code: str, duration: float, is_vertical: bool,
+                                  count: int, start_index: int, mode: Optional[str] = None,
+                                  times: Optional[List[float]] = None) -> List[Path]:
+        """Extract `count` frames across 10%..90% (or at `times`), numbered from start_index."""
+        mode = mode or self.thumbnail_mode
+        thumbnails: List[Path] = []
+        times = self._thumbnail_times(duration, count) if times is None else times
+        started = time.monotonic()
+        if mode == 'single':
+            thumbnails += self._extract_thumbnails_single_pass(
+                input_path, video_code, times, start_index, is_vertical, duration
+            )
+            # Whatever the single run missed falls back to one process per frame
+            missing = times[len(thumbnails):]
+        else:
+            missing = times
+
+        for t in missing:
+            index = start_index + len(thumbnails)
+            out_path = self.temp_dir / f"{video_code}_thumb_{index}.jpg"
+            if self._extract_thumbnail_at(input_path, t, out_path, is_vertical):
+                thumbnails.append(out_path)
+                logger.info(f"Generated thumbnail #{index} at {t:.1f}s "
+                            f"({'vertical blur' if is_vertical else 'letterbox'})")
+
+        logger.info(f"Thumbnails for {video_code}: {len(thumbnails)} in "
+                    f"{time.monotonic() - started:.2f}s (mode={mode})")
+        return thumbnails
+
+    def compare_thumbnail_modes(self, input_path: Path, num_thumbnails: int = 5) -> Dict[str, Any]:
+        """Time 'per_frame' against 'single' extraction on one source (for --bench-thumbnails)."""
+        info = self._media_info(input_path)
+        report: Dict[str, Any] = {
+            'file': str(input_path),
+            'duration': info.duration if info else None,
+            'resolution': f"{info.width}x{info.height}" if info else None,
+            'modes': {},
+        }
+        for mode in ('per_frame', 'single'):
+            code = f"bench_{mode}"
+            started = time.monotonic()
+            thumbs = self.generate_thumbnails(input_path, code, {}, num_thumbnails=num_thumbnails, mode=mode)
+            report['modes'][mode] = {
+                'seconds': round(time.monotonic() - started, 3),
+                'thumbnails': len(thumbs),
+                'ffmpeg_processes': 1 + (num_thumbnails - len(thumbs)) if mode == 'single' else num_thumbnails,
+            }
+            self.cleanup_files(*thumbs)
+        per_frame = report['modes']['per_frame']['seconds']
+        single = report['modes']['single']['seconds']
+        report['speedup'] = round(per_frame / single, 2) if single else None
+        return report
+
     # -------------------- Encoding --------------------
-    def encode_video(self, input_path: Path, output_path: Path, encoding_options: Dict[str, Any]) -> bool:
-        """Encode video using ffmpeg (CRF, streaming-friendly)."""
-        if not self._validate_video_file(input_path):
+    def _side_thumbnail_args(self, request: Dict[str, Any], duration: float,
+                             is_vertical: bool) -> Tuple[str, List[str], List[Path], List[float]]:
+        """
+        Filter-graph branch + output args that sample thumbnails from the encode's own
+        decode. Returns (graph fragment reading [th], output args, expected paths, their times).
+        """
+        video_code = request['video_code']
+        start_index = request.get('start_index', 1)
+        times = self._thumbnail_times(duration, request['count'])
+        select = self._thumbnail_select_expr(times)
+        if is_vertical:
+            branch = (f"[th]{select},split[src1][src2];"
+                      + THUMB_VERTICAL_FC.replace("[0:v]", "[src1]", 1).replace("[0:v]", "[src2]", 1)
+                      .replace("[outv]", "[thout]"))
+        else:
+            branch = f"[th]{select},{THUMB_LETTERBOX_VF}[thout]"
+        args = [
+            '-map', '[thout]',
+            '-vsync', 'vfr',
+            '-frames:v', str(len(times)),
+            '-start_number', str(start_index),
+            '-q:v', '2',
+            str(self.temp_dir / f"{video_code}_thumb_%d.jpg"),
+        ]
+        paths = [self.temp_dir / f"{video_code}_thumb_{start_index + i}.jpg" for i in range(len(times))]
+        return branch, args, paths, times
+
+    def encode_video(self, input_path: Path, output_path: Path, encoding_options: Dict[str, Any],
+                     thumbnail_request: Optional[Dict[str, Any]] = None,
+                     progress_key: Optional[str] = None,
+                     stream_key: Optional[str] = None,
+                     open_input: Optional[Callable[[], FileInput]] = None) -> Dict[str, Any]:
+        """
+        Encode video using ffmpeg (CRF, streaming-friendly).
+        With thumbnail_request ({'video_code', 'count', 'start_index'}) the same decode
+        also writes thumbnails through a split filter graph; they are returned in
+        report['thumbnails'] (possibly fewer than requested).
+        With progress_key (the video code) live progress is kept in self.job_progress
+        and pushed to the API while ffmpeg runs.
+        With stream_key (an S3 key) single-process encodes write fragmented MP4 that is
+        uploaded there as it is produced; report['streamed_upload'] says whether it was.
+        With open_input, every ffmpeg attempt reads from a fresh open_input() (e.g. a
+        PipeInput fed by the downloader) and input_path is only probed; segmented
+        encoding, which seeks, is skipped then.
+        Returns a report describing the encode.
+        """
+        info = self._media_info(input_path)
+        if not info or not info.has_video:
             raise NonRetryableError("Invalid or corrupt video file.")
 
-        orig_w, orig_h = self._get_video_dimensions(input_path)
-        if not orig_w or not orig_h:
+        on_progress = self._progress_reporter(progress_key, info.duration) if progress_key else None
+        started = time.monotonic()
+        try:
+            report = self._execute_encode(input_path, output_path, encoding_options, info,
+                                          thumbnail_request, on_progress, stream_key, open_input)
+        finally:
+            if progress_key:
+                with self._progress_lock:
+                    self.job_progress.pop(progress_key, None)
+        elapsed = time.monotonic() - started
+        report['encode_seconds'] = round(elapsed, 2)
+        if info.duration and elapsed > 0:
+            # Realtime factor: seconds of video per wall-clock second
+            report['realtime_factor'] = round(info.duration / elapsed, 3)
+            self.metrics.realtime_factor.observe(info.duration / elapsed, encode_path=report['encode_path'])
+            self.metrics.media_seconds.inc(info.duration, encode_path=report['encode_path'])
+        logger.info(f"Encode of {input_path.name} took {elapsed:.1f}s "
+                    f"({report.get('realtime_factor', '?')}x realtime, path={report['encode_path']})")
+        return report
+
+    def _progress_reporter(self, video_code: str, duration: Optional[float]):
+        """
+        Build the on_progress callback for one job's encode: records the latest
+        snapshot, logs every PROGRESS_LOG_INTERVAL seconds and pushes to the API
+        every PROGRESS_PUSH_INTERVAL seconds (push failures are only logged).
+        """
+        last = {'log': time.monotonic(), 'push': 0.0}
+
+        def on_progress(p: FfmpegProgress) -> None:
+            snapshot = p.to_dict()
+            snapshot['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            with self._progress_lock:
+                self.job_progress[video_code] = snapshot
+            now = time.monotonic()
+            if self.progress_log_interval and now - last['log'] >= self.progress_log_interval:
+                last['log'] = now
+                pct = f"{snapshot['percent']:.1f}%" if snapshot['percent'] is not None else f"{p.out_time:.0f}s"
+                eta = f", ETA {snapshot['eta_seconds']}s" if snapshot['eta_seconds'] is not None else ""
+                logger.info(f"[{video_code}] encode {pct} at {p.fps:.1f} fps ({p.speed:.2f}x){eta}")
+            if self.progress_push_interval > 0 and (p.finished or now - last['push'] >= self.progress_push_interval):
+                last['push'] = now
+                try:
+                    self.report_progress(video_code, snapshot, self.leases.token(video_code))
+                except LeaseLostError as e:
+                    logger.warning(f"[{video_code}] progress rejected: {e}")
+                except Exception as e:
+                    logger.debug(f"[{video_code}] progress push failed: {e}")
+
+        return on_progress
+
+    def _execute_encode(self, input_path: Path, output_path: Path, encoding_options: Dict[str, Any],
+                        info: MediaInfo, thumbnail_request: Optional[Dict[str, Any]],
+                        on_progress=None, stream_key: Optional[str] = None,
+                        open_input: Optional[Callable[[], FileInput]] = None) -> Dict[str, Any]:
+        plan = self._plan_encode(info, encoding_options)
+        new_w, new_h = plan['width'], plan['height']
+        report: Dict[str, Any] = {
+            'encode_path': plan['path'],
+            'audio': plan['audio'],
+            'width': new_w,
+            'height': new_h,
+            'thumbnails': [],
+        }
+        if plan['reasons']:
+            report['encode_reasons'] = plan['reasons']
+
+        # Fast path: source already matches the target profile
+        if plan['path'] != 'encode':
+            try:
+                report['streamed_upload'] = self._run_remux(input_path, output_path, plan, info.duration,
+                                                            on_progress, stream_key, open_input)
+                logger.info(f"Remuxed {input_path.name} ({plan['path']}) instead of re-encoding.")
+                return report
+            except FfmpegAbortedError:
+                raise  # hung or too slow: another path over the same source won't fare better
+            except Exception as e:
+                logger.warning(f"Remux ({plan['path']}) failed, falling back to full encode: {str(e).strip()[-300:]}")
+                report['encode_path'] = 'encode'
+                report['remux_failed'] = True
+                # Either stream may have broken the copy: transcode the audio too
+                if plan['audio'] == 'copy':
+                    plan['audio'] = report['audio'] = 'aac'
+
+        # Long sources: split at keyframes and encode the pieces on all cores
+        workers = self._segment_workers()
+        long_source = info.duration and info.duration >= self.segment_min_duration and workers >= 2
+        side_thumbnails = bool(thumbnail_request and thumbnail_request.get('count', 0) > 0)
+        if long_source and (side_thumbnails or stream_key):
+            # Side thumbnails and streamed uploads hang off a single ffmpeg process
+            logger.info(f"Not segmenting {input_path.name}: "
+                        f"{'thumbnails from the encode' if side_thumbnails else 'streaming upload'} requested.")
+        elif long_source and not open_input:
+            try:
+                report.update(self._encode_segmented(input_path, output_path, plan, info, workers, on_progress))
+                return report
+            except FfmpegAbortedError:
+                raise
+            except Exception as e:
+                logger.warning(f"Segmented encode failed, falling back to single process: {str(e).strip()[-300:]}")
+                report['segment_failed'] = True
+
+        side = None
+        if side_thumbnails and info.duration:
+            side = self._side_thumbnail_args(thumbnail_request, info.duration, plan['is_vertical'])
+
+        video_args = [
+            '-c:v', plan['codec'], '-preset', plan['preset'], '-crf', plan['crf'],
+            *self._audio_args(plan),
+            '-maxrate', plan['bitrate'], '-bufsize', plan['bufsize'],
+        ]
+        if self.ffmpeg_threads:
+            video_args += ['-threads', str(self.ffmpeg_threads)]
+
+        if side:
+            branch, thumb_args, thumb_paths, thumb_times = side
+            try:
+                with self._mp4_output(output_path, stream_key) as out, self._ffmpeg_input(input_path, open_input) as src:
+                    cmd = [
+                        'ffmpeg', '-i', src.arg, '-y',
+                        '-filter_complex', f"[0:v]split=2[enc][th];[enc]scale={new_w}:{new_h}[vout];{branch}",
+                        '-map', '[vout]', '-map', '0:a:0?',
+                    ] + video_args + out.args + thumb_args
+                    self._run_encode(cmd, output_path, info.duration, on_progress, out, src)
+                # The image2 muxer numbers frames in order: what exists is a prefix of the request
+                produced = next((i for i, p in enumerate(thumb_paths)
+                                 if not (p.exists() and p.stat().st_size > 0)), len(thumb_paths))
+                report['thumbnails'] = thumb_paths[:produced]
+                report['thumbnail_missing_times'] = thumb_times[produced:]
+                report['thumbnail_source'] = 'encode'
+                report['streamed_upload'] = out.streamed
+                return report
+            except FfmpegAbortedError:
+                raise
+            except Exception as e:
+                # A genuinely broken source fails again below and is classified there
+                logger.warning(f"Encode with thumbnail side output failed ({str(e).strip()[-300:]}); "
+                               f"retrying without it.")
+                self.cleanup_files(*thumb_paths)
+
+        with self._mp4_output(output_path, stream_key) as out, self._ffmpeg_input(input_path, open_input) as src:
+            cmd = ['ffmpeg', '-i', src.arg, '-y', '-vf', f'scale={new_w}:{new_h}'] + video_args + out.args
+            self._run_encode(cmd, output_path, info.duration, on_progress, out, src)
+        report['streamed_upload'] = out.streamed
+        return report
+
+    @staticmethod
+    def _parse_bitrate(value: Any) -> Optional[int]:
+        """'2000k' -> 2000000, '2M' -> 2000000, 1500000 -> 1500000"""
+        if value is None:
+            return None
+        s = str(value).strip().lower()
+        try:
+            if s.endswith('k'):
+                return int(float(s[:-1]) * 1000)
+            if s.endswith('m'):
+                return int(float(s[:-1]) * 1000 * 1000)
+            return int(float(s))
+        except ValueError:
+            return None
+
+    def _plan_encode(self, info: MediaInfo, encoding_options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Decide output geometry/rate control and, per stream, whether the source can be
+        copied instead of re-encoded:
+          * 'copy'       - video and audio already fit the profile: -c copy + faststart
+          * 'copy_video' - video fits, audio needs AAC transcode
+          * 'encode'     - full libx264 encode
+        """
+        orig_w, orig_h = info.width, info.height
+        dims_known = bool(orig_w and orig_h)
+        if not dims_known:
             orig_w, orig_h = 1920, 1080
             logger.warning("Could not detect dimensions; defaulting to 1920x1080.")
 
-        # Build command
         codec = encoding_options.get('codec', 'libx264')
         resolution = encoding_options.get('resolution', '1080p')
         max_w = 1920 if resolution == '1080p' else 1280 if resolution == '720p' else 854
@@ -532,21 +1278,299 @@ class VideoEncoder:
         new_h = new_h - (new_h % 2)
 
         crf = str(encoding_options.get('crf', 25))
+        preset = encoding_options.get('preset')
+        preset = preset if preset in X264_PRESETS else 'medium'
         bitrate = encoding_options.get('bitrate', '2000k')
         bufsize_k = str(int(bitrate[:-1]) * 2) + 'k' if bitrate.endswith('k') else '4000k'
 
-        cmd = [
-            'ffmpeg', '-i', str(input_path), '-y',
-            '-c:v', codec, '-preset', 'medium', '-crf', crf,
-            '-vf', f'scale={new_w}:{new_h}',
-            '-c:a', 'aac', '-b:a', '128k',
-            '-maxrate', bitrate, '-bufsize', bufsize_k,
-            '-movflags', '+faststart',
-            str(output_path)
-        ]
+        plan: Dict[str, Any] = {
+            'path': 'encode', 'audio': 'aac' if info.has_audio else 'none',
+            'width': new_w, 'height': new_h, 'is_vertical': is_vertical,
+            'codec': codec, 'preset': preset, 'crf': crf, 'bitrate': bitrate, 'bufsize': bufsize_k,
+            'reasons': [],
+        }
+        if not self.remux_enabled:
+            return plan
+
+        # Video: H.264 8-bit 4:2:0, no scaling needed, within the bitrate cap
+        reasons = plan['reasons']
+        if info.video_codec != 'h264':
+            reasons.append(f"video codec {info.video_codec}")
+        if info.pix_fmt not in ('yuv420p', 'yuvj420p'):
+            reasons.append(f"pixel format {info.pix_fmt}")
+        if not dims_known or (new_w, new_h) != (orig_w, orig_h):
+            reasons.append(f"scale {orig_w}x{orig_h} -> {new_w}x{new_h}")
+        cap = self._parse_bitrate(encoding_options.get('remux_max_bitrate', bitrate))
+        src_rate = info.estimated_video_bitrate
+        if not cap or not src_rate:
+            reasons.append("unknown bitrate")
+        elif src_rate > cap * self.remux_bitrate_tolerance:
+            reasons.append(f"bitrate {src_rate // 1000}k > {cap // 1000}k")
+        if reasons:
+            return plan
+
+        # Audio: stereo-or-less AAC at a sane rate can be copied as well
+        audio_copy = (not info.has_audio) or (
+            info.audio_codec == 'aac'
+            and (info.audio_channels or 2) <= 2
+            and info.audio_bitrate is not None  # unknown rate: transcode, as for video
+            and info.audio_bitrate <= self.remux_max_audio_bitrate
+        )
+        if not info.has_audio:
+            plan['audio'] = 'none'
+        elif audio_copy:
+            plan['audio'] = 'copy'
+        plan['path'] = 'copy' if audio_copy else 'copy_video'
+        return plan
+
+    def _segment_workers(self) -> int:
+        """How many parallel segment encodes this box (or CPU budget) affords; <2 disables."""
+        if not self.segment_enabled:
+            return 0
+        if self.segment_workers:
+            return self.segment_workers
+        total = self.ffmpeg_threads or os.cpu_count() or 1
+        return max(1, total // max(1, self.segment_threads_per_worker))
+
+    def _encode_segmented(self, input_path: Path, output_path: Path, plan: Dict[str, Any],
+                          info: MediaInfo, workers: int, on_progress=None) -> Dict[str, Any]:
+        """
+        1) stream-copy the video into keyframe-aligned chunks,
+        2) encode the chunks in parallel ffmpeg processes (same settings as the
+           single-process encode), plus the audio track in its own process,
+        3) losslessly concat into the final faststart MP4.
+        The chunks restart at 0, so the concat puts back the source's offset
+        between video and audio start.
+        """
+        work_dir = self.temp_dir / f"{output_path.stem}_segments"
+        shutil.rmtree(work_dir, ignore_errors=True)
+        work_dir.mkdir(parents=True)
+        try:
+            # ~2 chunks per worker keeps the pool busy when chunk costs differ
+            segment_time = max(self.segment_min_length, info.duration / (workers * 2))
+            split_cmd = [
+                'ffmpeg', '-v', 'error', '-i', str(input_path), '-y',
+                '-map', '0:v:0', '-c', 'copy',
+                '-f', 'segment', '-segment_time', f"{segment_time:.3f}",
+                '-reset_timestamps', '1',
+                str(work_dir / 'src_%04d.mkv'),
+            ]
+            res = run_ffmpeg(split_cmd, duration=info.duration, timeout=self._ffmpeg_timeout(info.duration),
+                             stall_timeout=self.ffmpeg_stall_seconds)
+            if res.returncode != 0:
+                raise RetryableError(f"Segment split failed: {res.stderr}")
+            sources = sorted(work_dir.glob('src_*.mkv'))
+            if len(sources) < 2:
+                raise RetryableError(f"Split produced {len(sources)} segment(s); nothing to parallelize.")
+
+            threads = max(1, (self.ffmpeg_threads or os.cpu_count() or 1) // workers)
+            # Segment out_times add up to the source position; the audio track is not counted
+            aggregate = ProgressAggregator(info.duration, on_progress) if on_progress else None
+
+            def encode_segment(src: Path) -> Path:
+                dst = work_dir / src.name.replace('src_', 'enc_').replace('.mkv', '.mp4')
+                cmd = [
+                    'ffmpeg', '-i', str(src), '-y', '-an',
+                    '-vf', f"scale={plan['width']}:{plan['height']}",
+                    '-c:v', plan['codec'], '-preset', plan['preset'], '-crf', plan['crf'],
+                    '-maxrate', plan['bitrate'], '-bufsize', plan['bufsize'],
+                    '-threads', str(threads),
+                    str(dst),
+                ]
+                # Chunks end on keyframes, so their length can exceed segment_time
+                src_info = self._media_info(src)
+                self.media_probe.forget(src)
+                self._run_encode(cmd, dst, src_info.duration if src_info else segment_time,
+                                 aggregate.part(src.name) if aggregate else None)
+                return dst
+
+            def encode_audio() -> Path:
+                dst = work_dir / 'audio.m4a'
+                cmd = ['ffmpeg', '-i', str(input_path), '-y', '-vn', '-map', '0:a:0',
+                       *self._audio_args(plan), str(dst)]
+                self._run_encode(cmd, dst, info.duration)
+                return dst
+
+            logger.info(f"Segmented encode: {len(sources)} segments of ~{segment_time:.0f}s, "
+                        f"{workers} workers x {threads} threads")
+            with ThreadPoolExecutor(max_workers=workers + (1 if info.has_audio else 0)) as pool:
+                audio_future = pool.submit(encode_audio) if info.has_audio else None
+                encoded = list(pool.map(encode_segment, sources))
+                audio_path = audio_future.result() if audio_future else None
+
+            list_file = work_dir / 'concat.txt'
+            list_file.write_text(''.join(f"file '{p.name}'\n" for p in encoded))
+            # Each input is read from its own start; delay whichever stream started later in the source
+            offset = info.av_offset if audio_path else 0.0
+            concat_cmd = ['ffmpeg']
+            if offset > 0.001:
+                concat_cmd += ['-itsoffset', f"{offset:.6f}"]
+            concat_cmd += ['-f', 'concat', '-safe', '0', '-i', str(list_file)]
+            if audio_path:
+                if offset < -0.001:
+                    concat_cmd += ['-itsoffset', f"{-offset:.6f}"]
+                concat_cmd += ['-i', str(audio_path), '-map', '0:v:0', '-map', '1:a:0']
+            concat_cmd += ['-c', 'copy', '-movflags', '+faststart', '-y', str(output_path)]
+            self._run_encode(concat_cmd, output_path, info.duration)
+
+            return {'segments': len(sources), 'segment_workers': workers, 'segment_threads': threads}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def compare_encode_modes(self, input_path: Path, encoding_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Encode input once single-process and once segment-parallel (for --bench-encode)."""
+        encoding_options = encoding_options or {}
+        saved = (self.remux_enabled, self.segment_enabled, self.segment_min_duration)
+        report: Dict[str, Any] = {'file': str(input_path), 'modes': {}}
+        workers = max(2, self.segment_workers or (os.cpu_count() or 1) // max(1, self.segment_threads_per_worker))
+        try:
+            self.remux_enabled = False
+            for mode in ('single', 'segmented'):
+                self.segment_enabled = mode == 'segmented'
+                self.segment_min_duration = 0.0
+                saved_workers, self.segment_workers = self.segment_workers, workers
+                out = self.temp_dir / f"bench_encode_{mode}.mp4"
+                try:
+                    result = self.encode_video(input_path, out, encoding_options)
+                    result['output_bytes'] = out.stat().st_size
+                    report['modes'][mode] = result
+                finally:
+                    self.segment_workers = saved_workers
+                    self.media_probe.forget(out)
+                    self.cleanup_files(out)
+        finally:
+            self.remux_enabled, self.segment_enabled, self.segment_min_duration = saved
+        single = report['modes']['single'].get('encode_seconds')
+        segmented = report['modes']['segmented'].get('encode_seconds')
+        report['speedup'] = round(single / segmented, 2) if single and segmented else None
+        return report
+
+    def _run_remux(self, input_path: Path, output_path: Path, plan: Dict[str, Any],
+                   duration: Optional[float] = None, on_progress=None,
+                   stream_key: Optional[str] = None,
+                   open_input: Optional[Callable[[], FileInput]] = None) -> bool:
+        """Stream-copy into the target container; returns whether the output was streamed to S3."""
+        with self._mp4_output(output_path, stream_key) as out, self._ffmpeg_input(input_path, open_input) as src:
+            cmd = [
+                'ffmpeg', '-i', src.arg, '-y',
+                '-map', '0:v:0', '-map', '0:a:0?',
+                '-c:v', 'copy',
+            ]
+            cmd += self._audio_args(plan)
+            self._run_encode(cmd + out.args, output_path, duration, on_progress, out, src)
+        return out.streamed
+
+    @staticmethod
+    def _audio_args(plan: Dict[str, Any]) -> List[str]:
+        """Audio codec args for the plan: stream copy, or AAC 128k."""
+        return ['-c:a', 'copy'] if plan['audio'] in ('copy', 'none') else ['-c:a', 'aac', '-b:a', '128k']
+
+    @staticmethod
+    def _ffmpeg_input(input_path: Path, open_input: Optional[Callable[[], FileInput]]) -> FileInput:
+        return open_input() if open_input else FileInput(input_path)
+
+    def encode_hls(self, input_path: Path, base_name: str, encoding_options: Dict[str, Any],
+                   progress_key: Optional[str] = None,
+                   open_input: Optional[Callable[[], FileInput]] = None) -> Dict[str, Any]:
+        """
+        Encode the ABR ladder from one decode of the source into TEMP_DIR/<base_name>*
+        (see abr.py). open_input works as in encode_video. Returns {'manifest': master
+        playlist, 'files': every file to upload, 'renditions': [{name, width, height, bitrate}]}.
+        """
+        info = self._media_info(input_path)
+        if not info or not info.has_video:
+            raise NonRetryableError("Invalid or corrupt video file.")
+        renditions = select_renditions(self.abr_ladder, info.width, info.height)
+        self.cleanup_files(*self.temp_dir.glob(f"{base_name}*"))  # leftovers of an earlier attempt
+        args, manifest = hls_args(renditions, info.has_audio, self.temp_dir, base_name, self.hls_segment_seconds,
+                                  str(encoding_options.get('crf', 25)), threads=self.ffmpeg_threads,
+                                  preset=encoding_options.get('preset') if encoding_options.get('preset') in X264_PRESETS
+                                  else 'medium')
+
+        on_progress = self._progress_reporter(progress_key, info.duration) if progress_key else None
+        started = time.monotonic()
+        try:
+            with self._ffmpeg_input(input_path, open_input) as src:
+                self._run_encode(['ffmpeg', '-i', src.arg, '-y'] + args, manifest, info.duration, on_progress,
+                                 source=src)
+        finally:
+            if progress_key:
+                with self._progress_lock:
+                    self.job_progress.pop(progress_key, None)
+        files = sorted(self.temp_dir.glob(f"{base_name}*"))
+        logger.info(f"ABR ladder for {input_path.name}: {', '.join(r['name'] for r in renditions)} "
+                    f"in {time.monotonic() - started:.1f}s ({len(files)} files)")
+        return {'manifest': manifest, 'files': files, 'renditions': renditions}
+
+    def analyze_complexity(self, input_path: Path, sample_path: Path,
+                           encoding_options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Per-title parameters (see complexity.py): encode a few short low-res windows of
+        the source with a fast preset into sample_path (removed afterwards) and derive
+        CRF/maxrate from their bits per pixel. encoding_options' crf/bitrate are the
+        baseline. None when the source would be remuxed rather than encoded.
+        """
+        info = self._media_info(input_path)
+        if not info or not info.has_video:
+            raise NonRetryableError("Invalid or corrupt video file.")
+        plan = self._plan_encode(info, encoding_options)
+        if plan['path'] != 'encode':
+            return None
 
+        windows = sample_windows(info.duration, self.per_title_samples, self.per_title_sample_seconds)
+        width, height = sample_size(info.width, info.height, self.per_title_sample_lines)
+        sampled = sum(length for _, length in windows)
+        cmd = sample_args(str(input_path), windows, width, height, str(sample_path), self.ffmpeg_threads)
+        started = time.monotonic()
+        try:
+            res = run_ffmpeg(cmd, duration=sampled, timeout=self._ffmpeg_timeout(sampled),
+                             stall_timeout=self.ffmpeg_stall_seconds, stderr_lines=self.ffmpeg_stderr_lines)
+            if res.returncode != 0:
+                raise RetryableError(res.stderr)
+            frames = res.progress.frame
+            bits = sample_path.stat().st_size * 8 if sample_path.exists() else 0
+        finally:
+            self.cleanup_files(sample_path)
+        if not frames or not bits:
+            raise RetryableError("Complexity sample came out empty.")
+
+        result = choose_parameters(
+            bits / (frames * width * height), plan['width'], plan['height'], info.fps,
+            int(plan['crf']), (self._parse_bitrate(plan['bitrate']) or 2000 * 1000) // 1000,
+            self.per_title_crf_min, self.per_title_crf_max,
+            self.per_title_maxrate_min_factor, self.per_title_maxrate_max_factor)
+        result['analysis_seconds'] = round(time.monotonic() - started, 2)
+        return result
+
+    def _mp4_output(self, output_path: Path, stream_key: Optional[str]) -> Mp4FileOutput:
+        """faststart file, or fragmented MP4 streamed to stream_key while it is written."""
+        if not stream_key or not self.s3_uploader:
+            return Mp4FileOutput(output_path)
+        return Mp4PipeOutput(output_path, self.s3_uploader.open_stream(output_path, stream_key,
+                                                                       self.streaming_part_size))
+
+    def _ffmpeg_timeout(self, duration: Optional[float]) -> float:
+        """Wall-clock limit for one ffmpeg run over `duration` seconds of media."""
+        if not duration or self.ffmpeg_timeout_factor <= 0:
+            return self.ffmpeg_timeout_default
+        return max(self.ffmpeg_timeout_min, duration * self.ffmpeg_timeout_factor)
+
+    def _run_encode(self, cmd: List[str], output_path: Path, duration: Optional[float] = None,
+                    progress=None, output: Optional[Mp4FileOutput] = None,
+                    source: Optional[FileInput] = None) -> None:
+        """
+        Run ffmpeg with streamed progress; only the last FFMPEG_STDERR_LINES lines
+        of stderr are kept, for error classification. The watchdog raises
+        FfmpegStallError/FfmpegTimeoutError (retryable) for hung or overlong runs.
+        output (an entered Mp4FileOutput/Mp4PipeOutput) and source (an entered
+        FileInput/PipeInput) are finished once ffmpeg succeeds, the source first.
+        """
         logger.info(f"Encoding with: {' '.join(cmd)}")
-        res = subprocess.run(cmd, capture_output=True, text=True, timeout=7200)
+        res = run_ffmpeg(cmd, duration=duration, on_progress=progress,
+                         timeout=self._ffmpeg_timeout(duration),
+                         stall_timeout=self.ffmpeg_stall_seconds,
+                         stderr_lines=self.ffmpeg_stderr_lines,
+                         pass_fds=(output.pass_fds if output else ()) + (source.pass_fds if source else ()))
         if res.returncode != 0:
             err = res.stderr.lower()
             if 'no space left' in err or 'disk full' in err:
@@ -554,10 +1578,13 @@ class VideoEncoder:
             if any(k in err for k in ['invalid data', 'corrupt', 'unsupported']):
                 raise NonRetryableError(res.stderr)
             raise RetryableError(res.stderr)
+        if source:
+            source.finish()
+        if output:
+            output.finish()
 
         if not output_path.exists() or output_path.stat().st_size == 0:
             raise RetryableError("Output file missing or empty.")
-        return True
 
     # -------------------- Misc helpers --------------------
     def cleanup_files(self, *file_paths: Path) -> None:
@@ -573,6 +1600,10 @@ class VideoEncoder:
         s = str(error).lower()
         if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
             return 'network_error'
+        if isinstance(error, FfmpegStallError):
+            return 'ffmpeg_stalled'
+        if isinstance(error, FfmpegTimeoutError):
+            return 'ffmpeg_timeout'
         if 'no space left' in s or 'disk full' in s:
             return 'temporary_disk_full'
         if 'timeout' in s:
@@ -589,121 +1620,724 @@ class VideoEncoder:
             return 'upload_failed'
         return 'unknown_error'
 
+    # -------------------- Encode cache --------------------
+    def _encode_fingerprint(self, ctx: 'JobContext') -> Dict[str, Any]:
+        """
+        Everything besides the source bytes that shapes the encoded output: the
+        job's requested options and the settings the per-title analysis derives
+        its CRF/maxrate from. A preset the job sets is part of the key; one the
+        backlog policy picks is not, so a duplicate upload hits whatever the
+        queue depth was when either was encoded.
+        """
+        options = {k: v for k, v in ctx.encoding_options.items() if k != 'storage_config'}
+        per_title = [
+            self.per_title_samples, self.per_title_sample_seconds, self.per_title_sample_lines,
+            self.per_title_crf_min, self.per_title_crf_max,
+            self.per_title_maxrate_min_factor, self.per_title_maxrate_max_factor,
+        ] if self._per_title(ctx) else None
+        return {
+            'version': ENCODE_CACHE_VERSION,
+            'options': options,
+            'per_title': per_title,
+            'remux': [self.remux_enabled, self.remux_bitrate_tolerance, self.remux_max_audio_bitrate],
+        }
+
+    def _cached_encode(self, ctx: 'JobContext') -> Optional[Dict[str, Any]]:
+        """
+        Look the job up in the encode cache. On a hit the encode is skipped: the
+        report recorded with the entry is returned and the upload stage copies
+        the cached object server-side. None means encode as usual.
+        """
+        entry = self._lookup_cache(ctx)
+        if not entry:
+            return None
+        # The original encode's timings don't describe this job
+        report = {k: v for k, v in (entry.get('report') or {}).items()
+                  if k not in ('encode_seconds', 'realtime_factor', 'streamed_upload', 'hls')}
+        report.update(encode_cache='hit', cached_from=entry['key'])
+        return report
+
+    def _lookup_cache(self, ctx: 'JobContext') -> Optional[Dict[str, Any]]:
+        """The job's cache entry (ctx.cache_entry), looked up once per job."""
+        if not self.encode_cache or not ctx.content_sha256 or ctx.cache_key:
+            return ctx.cache_entry
+        ctx.cache_key = cache_key(ctx.content_sha256, self._encode_fingerprint(ctx))
+        try:
+            entry = self.encode_cache.get(ctx.cache_key)
+        except Exception as e:
+            logger.warning(f"[{ctx.video_code}] encode cache lookup failed: {e}")
+            self.metrics.encode_cache.inc(result='error')
+            return None
+        if entry and not self.s3_uploader.file_exists(entry.get('key', '')):
+            logger.info(f"[{ctx.video_code}] cached output {entry.get('key')} is gone; encoding.")
+            self._drop_cache_entry(ctx)
+            entry = None
+        if not entry:
+            self.metrics.encode_cache.inc(result='miss')
+            return None
+
+        self.metrics.encode_cache.inc(result='hit')
+        ctx.cache_entry = entry
+        logger.info(f"[{ctx.video_code}] encode cache hit: reusing {entry['key']} "
+                    f"(source sha256 {ctx.content_sha256[:12]}...)")
+        return entry
+
+    def _store_cache_entry(self, ctx: 'JobContext') -> None:
+        """Record a fresh upload in the index (best effort)."""
+        if not self.encode_cache or not ctx.cache_key:
+            return
+        entry = {
+            'key': ctx.encoded_s3_path,
+            'video_code': ctx.video_code,
+            'source_sha256': ctx.content_sha256,
+            'size': ctx.output_file.stat().st_size,
+            'report': {k: v for k, v in ctx.result().items() if k != 'source_sha256'},
+            'metadata': ctx.media_metadata,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        try:
+            self.encode_cache.put(ctx.cache_key, entry)
+        except Exception as e:
+            logger.warning(f"[{ctx.video_code}] could not record encode cache entry: {e}")
+
+    def _drop_cache_entry(self, ctx: 'JobContext') -> None:
+        try:
+            self.encode_cache.delete(ctx.cache_key)
+        except Exception as e:
+            logger.warning(f"[{ctx.video_code}] could not drop encode cache entry: {e}")
+
+    # -------------------- Job journal --------------------
+    def _open_journal(self, ctx: 'JobContext') -> None:
+        """Attach the job's journal; if a crashed run left one, restore its state and mark its stages done."""
+        if ctx.journal is not None or not self.journal_enabled:
+            return
+        fingerprint = hashlib.sha256(json.dumps(
+            [(ctx.job.get('input_file_url') or '').split('?', 1)[0], ctx.encoding_options],
+            sort_keys=True, default=str).encode()).hexdigest()
+        ctx.journal = JobJournal(self.temp_dir, ctx.video_code, fingerprint)
+        resumed = ctx.journal.resume()
+        if not resumed:
+            return
+        stages, state = resumed
+        ctx.content_sha256 = state.get('content_sha256')
+        ctx.source_validator = state.get('source_validator')
+        ctx.thumbnail_files = [self.temp_dir / name for name in state.get('thumbnail_files', [])]
+        ctx.encode_report = dict(state.get('encode_report') or {})
+        ctx.cache_key = state.get('cache_key')
+        ctx.cache_entry = state.get('cache_entry')
+        ctx.media_metadata = state.get('media_metadata')
+        ctx.uploaded_thumb_paths = list(state.get('uploaded_thumb_paths', []))
+        ctx.encoded_uploaded = bool(state.get('encoded_uploaded'))
+        ctx.source_stream = state.get('source_stream')
+        ctx.hls_files = [self.temp_dir / name for name in state.get('hls_files', [])]
+        ctx.complexity = state.get('complexity')
+        ctx.resumed_stages = set(stages)
+        logger.info(f"[{ctx.video_code}] resuming from journal: {', '.join(stages)} already done")
+
+    def _journal_stage(self, ctx: 'JobContext', name: str) -> None:
+        """Record a finished stage with the state and artifacts the remaining stages need (best effort)."""
+        if not ctx.journal or name == 'complete':
+            return
+        state = {
+            'content_sha256': ctx.content_sha256,
+            'source_validator': ctx.source_validator,
+            'thumbnail_files': [p.name for p in ctx.thumbnail_files],
+            'encode_report': ctx.result(),
+            'cache_key': ctx.cache_key,
+            'cache_entry': ctx.cache_entry,
+            'media_metadata': ctx.media_metadata,
+            'uploaded_thumb_paths': ctx.uploaded_thumb_paths,
+            'encoded_uploaded': ctx.encoded_uploaded,
+            'source_stream': ctx.source_stream,
+            'hls_files': [p.name for p in ctx.hls_files],
+            'complexity': ctx.complexity,
+        }
+        artifacts: Dict[Path, Optional[str]] = {ctx.input_file: ctx.content_sha256}
+        if ctx.source_stream:
+            artifacts[ctx.head_file] = None
+        artifacts.update((p, None) for p in ctx.thumbnail_files)
+        if name not in ('download', 'thumbnails', 'analyze'):
+            artifacts[ctx.output_file] = None
+            artifacts.update((p, None) for p in ctx.hls_files)
+        try:
+            ctx.journal.record(name, state, artifacts)
+        except Exception as e:
+            logger.warning(f"[{ctx.video_code}] could not write journal after {name}: {e}")
+
+    def sweep_journals(self) -> None:
+        """Remove journals (and their artifacts) of jobs nobody resumed within JOB_JOURNAL_MAX_AGE_HOURS."""
+        if not self.journal_enabled:
+            return
+        for journal_path, artifacts in stale_journals(self.temp_dir, self.journal_max_age_hours * 3600):
+            logger.info(f"Removing stale journal {journal_path.name} and {len(artifacts)} artifact(s)")
+            self.cleanup_files(journal_path, *artifacts)
+
     # -------------------- Job processing --------------------
-    def process_job(self, job: Dict[str, Any]) -> bool:
-        """Download -> thumbnails -> encode -> metadata -> upload -> mark status -> activate."""
-        video_code = job['video_code']
-        retry_count = job.get('retry_count', 0)
-        logger.info(f"Processing job {video_code} (attempt {retry_count + 1})")
-
-        encoding_options = job.get('encoding_options', {}) or {}
-        storage_config = encoding_options.get('storage_config', {}) or {}
-        videos_path = storage_config.get('videos', 'videos')
-        thumbnails_path = storage_config.get('thumbnails', 'thumbnails')
-        origin_path = storage_config.get('origin', 'origin')
-        first_char = storage_config.get('first_char', video_code[0].lower())
-
-        input_file = self.temp_dir / f"{video_code}.mp4"
-        output_file = self.temp_dir / f"{video_code}_encoded.mp4"
-        thumbnail_files: List[Path] = []
-
-        try:
-            self.mark_as_processing(video_code)
-
-            # 1) Download input
-            input_url = job.get('input_file_url')
-            if not input_url:
-                raise NonRetryableError("Job missing input_file_url.")
-            self.download_file(input_url, input_file)
-
-            # 2) Thumbnails
-            thumbnail_files = self.generate_thumbnails(input_file, video_code, job, num_thumbnails=5)
-
-            # Enforce thumbnails presence
-            if not thumbnail_files or len(thumbnail_files) < getattr(self, 'min_thumbnails_required', 1):
-                need = getattr(self, 'min_thumbnails_required', 1)
-                have = len(thumbnail_files)
-                raise RetryableError(
-                    f"Thumbnail generation failed or incomplete: required {need}, generated {have}."
-                )
-
-            # 3) Encode
-            self.encode_video(input_file, output_file, encoding_options)
-
-            # 4) Update metadata (duration/width/height from encoded file)
+    def _new_job_context(self, job: Dict[str, Any]) -> 'JobContext':
+        return JobContext(job, self.temp_dir)
+
+    def _stage_download(self, ctx: 'JobContext') -> None:
+        if ctx.prefetched and (ctx.input_file.exists() or ctx.source_stream):
+            logger.info(f"Using prefetched source for {ctx.video_code}")
+            return
+        if isinstance(ctx.prefetch_error, NonRetryableError):
+            raise ctx.prefetch_error
+        self._download_source(ctx)
+
+    def _download_source(self, ctx: 'JobContext') -> None:
+        """Fetch the job's source, from the local source cache when an earlier attempt left it there."""
+        input_url = ctx.job.get('input_file_url')
+        if not input_url:
+            raise NonRetryableError("Job missing input_file_url.")
+        if self.source_cache:
+            ctx.source_validator = self._source_validator(input_url)
+            if ctx.source_validator:
+                entry = self.source_cache.take(input_url, ctx.source_validator, ctx.input_file)
+                if entry:
+                    logger.info(f"[{ctx.video_code}] source from local cache ({entry['size'] / (1024 * 1024):.1f} MB)")
+                    self.metrics.source_cache.inc(result='hit')
+                    ctx.content_sha256 = entry.get('sha256')
+                    return
+                self.metrics.source_cache.inc(result='miss')
+                self.source_cache.make_room(ctx.source_validator.get('size') or 0)
+        if self.source_streaming and self._plan_source_stream(ctx, input_url):
+            return
+        ctx.content_sha256 = self.download_file(input_url, ctx.input_file)
+
+    def _plan_source_stream(self, ctx: 'JobContext', url: str) -> bool:
+        """
+        Decide whether the encode can read the source as it downloads. Only the
+        head (ftyp+moov and the first media bytes) is fetched now and kept as
+        ctx.head_file for probing. False means download as usual: moov at the
+        end, unknown size, thumbnails that need their own pass, per-title
+        analysis, or a source long enough for segmented encoding.
+        """
+        if not self.thumbnails_from_encode:
+            return False  # the thumbnail stage seeks in the source before the encode
+        if self._per_title(ctx):
+            return False  # so does the complexity analysis
+        validator = ctx.source_validator or self._source_validator(url)
+        size = (validator or {}).get('size')
+        if not size:
+            return False  # nothing to check the streamed bytes against
+        try:
+            with self._open_source(url, min(size, SOURCE_HEAD_PROBE_BYTES)) as body:
+                head = body.read(SOURCE_HEAD_PROBE_BYTES)
+            moov_end = mp4_moov_end(head)
+            if moov_end is None or moov_end > min(size, self.source_stream_max_head):
+                logger.info(f"[{ctx.video_code}] source is not moov-first MP4 (or its moov is too large); "
+                            f"downloading it")
+                return False
+            head_len = min(size, moov_end + SOURCE_HEAD_MEDIA_BYTES)
+            if head_len > len(head):
+                with self._open_source(url, head_len) as body:
+                    head = body.read(head_len)
+            ctx.head_file.write_bytes(head[:head_len])
+        except (NonRetryableError, LeaseLostError):
+            raise
+        except Exception as e:
+            logger.info(f"[{ctx.video_code}] could not read source header ({e}); downloading it")
+            return False
+
+        info = self._media_info(ctx.head_file)
+        if not info or not info.has_video or (
+                info.duration and info.duration >= self.segment_min_duration and self._segment_workers() >= 2):
+            self.cleanup_files(ctx.head_file)  # the regular path probes (and classifies) the full file
+            return False
+        # origin/ needs the bytes on disk unless the source can be copied server-side
+        keep_local = bool(self.s3_uploader) and self._origin_source(ctx) == ctx.input_file
+        ctx.source_validator = validator
+        ctx.source_stream = {'size': size, 'keep_local': keep_local}
+        logger.info(f"[{ctx.video_code}] encoding straight from the source "
+                    f"({size / (1024 * 1024):.1f} MB{', kept for origin' if keep_local else ''})")
+        return True
+
+    def _source_producer(self, ctx: 'JobContext') -> Callable[[Callable[[bytes], None]], None]:
+        """PipeInput producer: stream the source, hashing it and keeping a copy when origin/ needs one."""
+        url = ctx.job['input_file_url']
+        expected = ctx.source_stream['size']
+        keep_path = ctx.input_file if ctx.source_stream['keep_local'] else None
+
+        def produce(write: Callable[[bytes], None]) -> None:
+            started = time.monotonic()
+            sha = hashlib.sha256()
+            total = 0
+            keep = open(keep_path, 'wb') if keep_path else None
             try:
-                meta_duration, meta_w, meta_h = self._probe_media_info(output_file)
-                self.update_metadata(video_code, meta_duration, meta_w, meta_h)
-            except Exception as e:
-                # Non-blocking; log only. Make it blocking by raising RetryableError if desired.
-                logger.warning(f"Failed to update metadata for {video_code}: {e}")
+                with self._open_source(url) as body:
+                    while True:
+                        chunk = body.read(self.downloader.buffer_size)
+                        if not chunk:
+                            break
+                        sha.update(chunk)
+                        if keep:
+                            keep.write(chunk)
+                        write(chunk)
+                        total += len(chunk)
+            finally:
+                if keep:
+                    keep.close()
+            if total != expected:
+                raise RetryableError(f"Streamed source size mismatch: expected {expected}, got {total}")
+            ctx.content_sha256 = sha.hexdigest()
+            self.metrics.download_seconds.observe(time.monotonic() - started, source='stream')
+            self.metrics.transfer_bytes.inc(total, direction='download')
+
+        return produce
+
+    def _stash_source(self, ctx: 'JobContext') -> None:
+        """Keep an unfinished job's fully downloaded source for its retry."""
+        if not self.source_cache or not ctx.source_validator or not ctx.content_sha256:
+            return
+        if not ctx.input_file.exists():
+            return
+        expected = ctx.source_validator.get('size')
+        if expected is not None and ctx.input_file.stat().st_size != expected:
+            return
+        try:
+            if self.source_cache.put(ctx.input_file, ctx.job['input_file_url'], ctx.source_validator,
+                                     ctx.content_sha256):
+                logger.info(f"[{ctx.video_code}] source kept in local cache for a retry")
+        except OSError as e:
+            logger.warning(f"[{ctx.video_code}] could not cache source: {e}")
+
+    def _enforce_min_thumbnails(self, ctx: 'JobContext') -> None:
+        if not ctx.thumbnail_files or len(ctx.thumbnail_files) < getattr(self, 'min_thumbnails_required', 1):
+            need = getattr(self, 'min_thumbnails_required', 1)
+            have = len(ctx.thumbnail_files)
+            raise RetryableError(
+                f"Thumbnail generation failed or incomplete: required {need}, generated {have}."
+            )
 
-            # 5) Upload results (if S3 uploader available)
-            encoded_s3_path = f"{videos_path}/{first_char}/{video_code}.mp4"
-            origin_s3_path = f"{origin_path}/{first_char}/{video_code}.mp4"
-            uploaded_thumb_paths: List[str] = []
+    def _stage_thumbnails(self, ctx: 'JobContext') -> None:
+        if self.thumbnails_from_encode:
+            # Only the uploaded thumbnail here; the rest come out of the encode's decode
+            info = self._media_info(ctx.source_file)
+            first_thumb = self._process_uploaded_thumbnail(ctx.job, ctx.video_code, bool(info and info.is_vertical))
+            ctx.thumbnail_files = [first_thumb] if first_thumb else []
+            return
 
-            if self.s3_uploader:
-                # Upload original (best-effort)
-                self.s3_uploader.upload_with_retry(input_file, origin_s3_path, max_retries=2)
-
-                # Upload encoded (required)
-                if not self.s3_uploader.upload_with_retry(output_file, encoded_s3_path, max_retries=2):
-                    raise RetryableError("Failed to upload encoded video.")
-
-                # Upload thumbs
-                for idx, thumb in enumerate(thumbnail_files):
-                    dest = f"{thumbnails_path}/{first_char}/{video_code}_thumb_{idx + 1}.jpg"
-                    if self.s3_uploader.upload_with_retry(thumb, dest, max_retries=2):
-                        uploaded_thumb_paths.append(dest)
-                    else:
-                        logger.warning(f"Failed to upload thumbnail {thumb}")
-            else:
-                logger.warning("S3 uploader not configured; skipping uploads.")
+        ctx.thumbnail_files = self.generate_thumbnails(ctx.input_file, ctx.video_code, ctx.job, num_thumbnails=NUM_THUMBNAILS)
+
+        # Enforce thumbnails presence
+        self._enforce_min_thumbnails(ctx)
 
-            # 6) Mark completed
-            self.mark_as_completed(video_code, encoded_s3_path, uploaded_thumb_paths)
+    def _per_title(self, ctx: 'JobContext') -> bool:
+        return bool(ctx.encoding_options.get('per_title', self.per_title_enabled))
 
-            # 7) Activate the video
+    def _stage_analyze(self, ctx: 'JobContext') -> None:
+        """Per-title CRF/maxrate for the encode (best effort: the job's fixed settings otherwise)."""
+        if not self._per_title(ctx) or not ctx.input_file.exists():
+            return
+        if self._lookup_cache(ctx):
+            return  # the encode is skipped, so are its sample encodes
+        try:
+            ctx.complexity = self.analyze_complexity(ctx.input_file, ctx.complexity_sample, ctx.encoding_options)
+        except Exception as e:
+            logger.warning(f"[{ctx.video_code}] complexity analysis failed ({str(e).strip()[-300:]}); "
+                           f"using the job's CRF/maxrate")
+            return
+        if ctx.complexity:
+            c = ctx.complexity
+            logger.info(f"[{ctx.video_code}] complexity {c['class']} ({c['sample_bpp']} bpp): crf {c['crf']}, "
+                        f"maxrate {c['maxrate']}, est. {c['estimated_kbps']}k vs {c['baseline_kbps']}k "
+                        f"({c['estimated_savings_pct']}% saved) in {c['analysis_seconds']}s")
+
+    def _encoding_options(self, ctx: 'JobContext') -> Dict[str, Any]:
+        """The job's encoding options with the per-title CRF/maxrate and the policy's preset applied."""
+        overrides: Dict[str, Any] = {}
+        if ctx.complexity:
+            # The remux check keeps the job's cap: the analysis only ran because the source exceeds it
+            overrides.update(crf=ctx.complexity['crf'], bitrate=ctx.complexity['maxrate'],
+                             remux_max_bitrate=ctx.complexity['baseline']['maxrate'])
+        if ctx.preset:
+            overrides['preset'] = ctx.preset
+        return dict(ctx.encoding_options, **overrides) if overrides else ctx.encoding_options
+
+    def _choose_preset(self, ctx: 'JobContext') -> None:
+        """Ask the preset policy for this job's preset (jobs that set encoding_options.preset keep theirs)."""
+        if not self.preset_policy or ctx.encoding_options.get('preset') in X264_PRESETS:
+            return
+        d = ctx.preset_decision = self.preset_policy.decide()
+        ctx.preset = d['preset']
+        backlog = f", {d['pending']} pending, drain ~{d['drain_seconds'] / 60:.1f} min" if 'pending' in d else ''
+        logger.info(f"[{ctx.video_code}] preset {ctx.preset} ({d['reason']}{backlog})")
+
+    def _stage_encode(self, ctx: 'JobContext') -> None:
+        self._choose_preset(ctx)
+        thumbnail_request = None
+        if self.thumbnails_from_encode:
+            thumbnail_request = {
+                'video_code': ctx.video_code,
+                'count': max(0, NUM_THUMBNAILS - len(ctx.thumbnail_files)),
+                'start_index': len(ctx.thumbnail_files) + 1,
+            }
+
+        ctx.encode_report = self._cached_encode(ctx) or self._encode_source(ctx, thumbnail_request)
+        if not ctx.cache_entry and ctx.encode_report.get('streamed_upload'):
+            ctx.encoded_uploaded = True
+            self.metrics.transfer_bytes.inc(ctx.output_file.stat().st_size, direction='upload')
+        if ctx.content_sha256:
+            ctx.encode_report['source_sha256'] = ctx.content_sha256
+        if ctx.complexity and not ctx.cache_entry:
+            ctx.encode_report['complexity'] = ctx.complexity
+        if ctx.preset_decision and not ctx.cache_entry:
+            ctx.encode_report['preset_policy'] = ctx.preset_decision
+            self.metrics.preset_jobs.inc(preset=ctx.preset)
+        if ctx.cache_key and not ctx.cache_entry:
+            ctx.encode_report['encode_cache'] = 'miss'
+        elif self.encode_cache and ctx.content_sha256 and not ctx.cache_key:
+            # Streamed source: its digest is only known now, after the encode; record the output anyway
+            ctx.cache_key = cache_key(ctx.content_sha256, self._encode_fingerprint(ctx))
+
+        if thumbnail_request:
+            ctx.thumbnail_files += ctx.encode_report.get('thumbnails', [])
+            missing = NUM_THUMBNAILS - len(ctx.thumbnail_files)
+            if missing > 0:
+                # Side output came up short: fall back to a separate extraction
+                logger.warning(f"Encode produced {len(ctx.encode_report.get('thumbnails', []))} of "
+                               f"{thumbnail_request['count']} thumbnails; extracting {missing} separately.")
+                # A streamed source may not be on disk; the encode shows the same frames
+                frames = ctx.input_file if ctx.input_file.exists() else ctx.output_file
+                info = self._media_info(frames)
+                if info and info.duration and info.has_video:
+                    # Only the positions the side output did not produce (all of them if it never ran)
+                    ctx.thumbnail_files += self._extract_video_thumbnails(
+                        frames, ctx.video_code, info.duration, info.is_vertical,
+                        missing, len(ctx.thumbnail_files) + 1,
+                        times=ctx.encode_report.get('thumbnail_missing_times'),
+                    )
+            self._enforce_min_thumbnails(ctx)
+
+        if ctx.encoding_options.get('abr', self.abr_enabled):
+            self._encode_ladder(ctx)
+
+    def _encode_ladder(self, ctx: 'JobContext') -> None:
+        """HLS renditions next to the MP4 (the encode cache covers the MP4 only, so this runs on hits too)."""
+        open_input = None
+        if ctx.source_stream and not ctx.input_file.exists():
+            open_input = lambda: PipeInput(ctx.input_file, self._source_producer(ctx))
+        hls = self.encode_hls(ctx.source_file, ctx.hls_base_name, self._encoding_options(ctx),
+                              progress_key=ctx.video_code, open_input=open_input)
+        ctx.hls_files = hls['files']
+        ctx.encode_report['hls'] = {'manifest': ctx.hls_manifest_s3_path, 'renditions': hls['renditions']}
+
+    def _encode_source(self, ctx: 'JobContext', thumbnail_request: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Encode from the local source, or from the source as it streams in; a failed stream falls back to a download."""
+        stream_key = ctx.encoded_s3_path if self.streaming_upload and self.s3_uploader else None
+        if ctx.source_stream and not ctx.input_file.exists():
             try:
-                self.activate_video(video_code)
+                return self.encode_video(
+                    ctx.head_file, ctx.output_file, self._encoding_options(ctx),
+                    thumbnail_request=thumbnail_request, progress_key=ctx.video_code, stream_key=stream_key,
+                    open_input=lambda: PipeInput(ctx.input_file, self._source_producer(ctx)))
+            except (FfmpegAbortedError, NonRetryableError, LeaseLostError):
+                raise
             except Exception as e:
-                # Optional: not fatal
-                logger.warning(f"Activation failed for {video_code}: {e}")
+                # e.g. a badly interleaved file the demuxer can't read without seeking
+                logger.warning(f"[{ctx.video_code}] encode from the streamed source failed "
+                               f"({str(e).strip()[-300:]}); downloading it")
+                ctx.source_stream = None
+                if not (ctx.content_sha256 and ctx.input_file.exists()):
+                    ctx.content_sha256 = self.download_file(ctx.job['input_file_url'], ctx.input_file)
+        return self.encode_video(
+            ctx.input_file, ctx.output_file, self._encoding_options(ctx),
+            thumbnail_request=thumbnail_request, progress_key=ctx.video_code, stream_key=stream_key)
+
+    def _stage_metadata(self, ctx: 'JobContext') -> None:
+        # Duration/width/height from encoded file (recorded with the cache entry on a hit)
+        try:
+            if ctx.cache_entry:
+                meta = ctx.cache_entry.get('metadata') or {}
+                meta_duration, meta_w, meta_h = meta.get('duration'), meta.get('width'), meta.get('height')
+            else:
+                meta_duration, meta_w, meta_h = self._probe_media_info(ctx.output_file)
+            ctx.media_metadata = {'duration': meta_duration, 'width': meta_w, 'height': meta_h}
+            self.update_metadata(ctx.video_code, meta_duration, meta_w, meta_h)
+        except Exception as e:
+            # Non-blocking; log only. Make it blocking by raising RetryableError if desired.
+            logger.warning(f"Failed to update metadata for {ctx.video_code}: {e}")
 
-            logger.info(f"Job {video_code} completed.")
-            return True
+    def _stage_upload(self, ctx: 'JobContext') -> None:
+        if not self.s3_uploader:
+            logger.warning("S3 uploader not configured; skipping uploads.")
+            return
 
-        except NonRetryableError as e:
-            logger.error(f"Job {video_code} failed (non-retryable): {e}")
-            self.mark_as_failed(video_code, f"Non-retryable error: {e}")
-            return False
+        # All artifacts go through one transfer manager concurrently
+        origin_source = self._origin_source(ctx)
+        items: List[Tuple[Any, str]] = []
+        if origin_source is not None:
+            items.append((origin_source, ctx.origin_s3_path))
+        encoded_source = self._encoded_source(ctx)
+        if encoded_source is not None:
+            items.append((encoded_source, ctx.encoded_s3_path))
+        items.extend((p, ctx.hls_s3_path(p)) for p in ctx.hls_files)
+        thumb_dests = [ctx.thumbnail_s3_path(idx + 1) for idx in range(len(ctx.thumbnail_files))]
+        items.extend(zip(ctx.thumbnail_files, thumb_dests))
+
+        results = self.s3_uploader.upload_many(items, max_retries=2)
+        uploaded = sum(src.stat().st_size for src, dest in items if isinstance(src, Path) and results[dest])
+
+        # Original is best-effort; a failed server-side copy falls back to uploading the local file
+        if origin_source is not None and not results[ctx.origin_s3_path] and isinstance(origin_source, dict):
+            if self.s3_uploader.upload_with_retry(ctx.input_file, ctx.origin_s3_path, max_retries=2):
+                uploaded += ctx.input_file.stat().st_size
+        self.metrics.transfer_bytes.inc(uploaded, direction='upload')
+
+        # Encoded is required
+        if encoded_source is not None and not results[ctx.encoded_s3_path]:
+            if ctx.cache_entry:
+                # The cached object may be gone; the retry encodes from scratch
+                self._drop_cache_entry(ctx)
+                raise RetryableError("Failed to copy cached encoded video.")
+            raise RetryableError("Failed to upload encoded video.")
+        failed_hls = [p.name for p in ctx.hls_files if not results[ctx.hls_s3_path(p)]]
+        if failed_hls:
+            raise RetryableError(f"Failed to upload {len(failed_hls)} HLS file(s), e.g. {failed_hls[0]}.")
+        if not ctx.cache_entry:
+            self._store_cache_entry(ctx)
+
+        # Thumbs are best-effort
+        for thumb, dest in zip(ctx.thumbnail_files, thumb_dests):
+            if results[dest]:
+                ctx.uploaded_thumb_paths.append(dest)
+            else:
+                logger.warning(f"Failed to upload thumbnail {thumb}")
+
+    def _origin_source(self, ctx: 'JobContext') -> Optional[Any]:
+        """
+        What to store at origin/: a server-side copy source when the input already
+        lives in the configured bucket, otherwise the local input file.
+        None when the input is the origin object itself.
+        """
+        url = ctx.job.get('input_file_url') or ''
+        s3_info = self._parse_s3_url(url)
+        if not s3_info or s3_info.get('bucket') != self.s3_uploader.bucket_name:
+            return ctx.input_file
+        if s3_info.get('endpoint_url') and s3_info['endpoint_url'] != self.s3_uploader.endpoint_url:
+            return ctx.input_file
+        if 'amazonaws.com' not in url.lower():
+            # _parse_s3_url maps any other https URL onto the bucket; only trust our endpoint's host
+            hosts = {urlparse(u).netloc for u in (config.get('AWS_ENDPOINT'), config.get('AWS_URL')) if u}
+            if urlparse(url).netloc not in hosts:
+                return ctx.input_file
+        source_key = unquote(s3_info['key'].split('?', 1)[0])
+        if source_key == ctx.origin_s3_path:
+            return None  # already in place
+        return {'Bucket': s3_info['bucket'], 'Key': source_key}
+
+    def _encoded_source(self, ctx: 'JobContext') -> Optional[Any]:
+        """The local encode, or on a cache hit a copy source for the cached object (None if already in place)."""
+        if ctx.encoded_uploaded:
+            return None  # streamed while encoding
+        if not ctx.cache_entry:
+            return ctx.output_file
+        if ctx.cache_entry['key'] == ctx.encoded_s3_path:
+            return None
+        return {'Bucket': self.s3_uploader.bucket_name, 'Key': ctx.cache_entry['key']}
+
+    def _stage_complete(self, ctx: 'JobContext') -> None:
+        self.mark_as_completed(ctx.video_code, ctx.encoded_s3_path, ctx.uploaded_thumb_paths,
+                               encoding_result=ctx.result(), lease_token=ctx.lease_token,
+                               manifest_path=ctx.hls_manifest_s3_path if ctx.hls_files else None)
+        self.leases.release(ctx.video_code)
+        ctx.completed = True
+        self.metrics.jobs.inc(outcome='completed', category='none')
+        if self.preset_policy and 'encode' in ctx.stage_seconds and not ctx.cache_entry:
+            encoded = ctx.encode_report.get('encode_path') == 'encode'
+            self.preset_policy.observe_job(
+                (ctx.preset or ctx.encoding_options.get('preset', 'medium')) if encoded else None,
+                ctx.stage_seconds['encode'] if encoded else 0.0,
+                sum(t for name, t in ctx.stage_seconds.items() if name != 'encode' or not encoded))
+
+        # Activate the video
+        try:
+            self.activate_video(ctx.video_code)
+        except Exception as e:
+            # Optional: not fatal
+            logger.warning(f"Activation failed for {ctx.video_code}: {e}")
+
+        logger.info(f"Job {ctx.video_code} completed.")
+
+    def _claim_job(self, ctx: 'JobContext') -> None:
+        """Mark processing and start heartbeating the lease (if the API issued one)."""
+        claim = self.mark_as_processing(ctx.video_code)
+        ctx.lease_token = claim.get('lease_token') if isinstance(claim, dict) else None
+        if ctx.lease_token:
+            self.leases.track(ctx.video_code, ctx.lease_token, int(claim.get('lease_seconds') or self.lease_seconds))
+
+    def _claim_batch(self, limit: int, wait: int = 0) -> List['JobContext']:
+        """
+        Claim up to `limit` jobs in one atomic call (optionally long-polling
+        `wait` seconds); falls back to next-pending + processing (one job)
+        when the API lacks /claim.
+        """
+        if limit <= 0:
+            return []
+        if self._claim_endpoint is not False:
+            jobs = self.claim_jobs(limit, wait)
+            if jobs is not None:
+                self._claim_endpoint = True
+                contexts = []
+                for job in jobs:
+                    ctx = self._new_job_context(job)
+                    ctx.lease_token = job.get('lease_token')
+                    if ctx.lease_token:
+                        self.leases.track(ctx.video_code, ctx.lease_token,
+                                          int(job.get('lease_seconds') or self.lease_seconds))
+                    contexts.append(ctx)
+                return contexts
+            logger.info("API has no claim endpoint; using next-pending polling.")
+            self._claim_endpoint = False
+
+        job = self.get_next_pending_job()
+        if not job:
+            return []
+        ctx = self._new_job_context(job)
+        try:
+            self._claim_job(ctx)
+        except LeaseLostError as e:
+            logger.info(f"Job {ctx.video_code} already claimed elsewhere: {e}")
+            return []
+        return [ctx]
+
+    def _idle_sleep(self, poll_interval: int) -> None:
+        """Queue was empty. A long-poll claim already waited server-side; otherwise poll with jitter."""
+        if self._claim_endpoint and self._long_poll_supported:
+            logger.debug("No pending jobs (long-poll timed out).")
+            time.sleep(random.uniform(0, 1))  # de-synchronise idle workers
+            return
+        delay = poll_interval * random.uniform(1 - self.poll_jitter, 1 + self.poll_jitter)
+        logger.info(f"No pending jobs. Sleeping {delay:.0f}s...")
+        time.sleep(delay)
+
+    def _prefetch_source(self, ctx: 'JobContext') -> None:
+        self._open_journal(ctx)
+        if 'download' not in ctx.resumed_stages:
+            self._download_source(ctx)
+
+    def _new_prefetch_buffer(self) -> PrefetchBuffer:
+        return PrefetchBuffer(
+            self._prefetch_source,
+            lambda ctx: ctx.input_file,
+            max_items=1 + max(0, self.prefetch_jobs),
+            disk_budget_bytes=int(self.prefetch_disk_budget_gb * (1024 ** 3)),
+            reserve_bytes=int(self.min_disk_space_gb * (1024 ** 3)),
+        )
+
+    def _release_unstarted(self, ctx: 'JobContext') -> None:
+        """Hand a claimed-but-never-started job back to the queue (worker shutdown)."""
+        self.leases.release(ctx.video_code)
+        try:
+            self.mark_as_failed(ctx.video_code, "Retryable error: released unstarted at worker shutdown",
+                                lease_token=ctx.lease_token)
         except Exception as e:
-            logger.error(f"Job {video_code} failed: {e}")
-            err_type = self._categorize_error(e)
-            if retry_count < job.get('max_retries', self.max_job_retries) and err_type not in ['invalid_video_format', 'unsupported_codec']:
-                self.mark_as_failed(video_code, f"Retryable error: {e}")
+            logger.warning(f"Could not release {ctx.video_code}: {e}")
+        self._cleanup_job(ctx)
+
+    def _run_stage(self, name: str, ctx: 'JobContext') -> None:
+        if self.leases.is_lost(ctx.video_code):
+            raise LeaseLostError(f"{ctx.video_code}: lease lost before {name}")
+        self._open_journal(ctx)
+        if name in ctx.resumed_stages:
+            logger.info(f"[{ctx.video_code}] {name} already done (journal); skipping")
+            return
+        ctx.stage = name
+        started = time.monotonic()
+        self.metrics.stage_active.inc(stage=name)
+        try:
+            getattr(self, f"_stage_{name}")(ctx)
+        finally:
+            ctx.stage_seconds[name] = time.monotonic() - started
+            self.metrics.stage_active.dec(stage=name)
+            self.metrics.stage_seconds.observe(ctx.stage_seconds[name], stage=name)
+        self._journal_stage(ctx, name)
+
+    def _handle_job_failure(self, ctx: 'JobContext', error: Exception) -> None:
+        video_code = ctx.video_code
+        self.leases.release(video_code)
+        if isinstance(error, LeaseLostError):
+            # Another worker owns the job now; reporting would clobber its state
+            logger.warning(f"Job {video_code} abandoned during {ctx.stage}: {error}")
+            self.metrics.jobs.inc(outcome='abandoned', category='lease_lost')
+            return
+        err_type = self._categorize_error(error)
+        try:
+            if isinstance(error, NonRetryableError):
+                logger.error(f"Job {video_code} failed (non-retryable): {error}")
+                self.metrics.jobs.inc(outcome='failed', category=err_type)
+                self.mark_as_failed(video_code, f"Non-retryable error: {error}", lease_token=ctx.lease_token)
+                return
+            logger.error(f"Job {video_code} failed during {ctx.stage}: {error}")
+            if ctx.retry_count < ctx.job.get('max_retries', self.max_job_retries) and err_type not in ['invalid_video_format', 'unsupported_codec']:
+                self.metrics.jobs.inc(outcome='retry', category=err_type)
+                self.mark_as_failed(video_code, f"Retryable error: {error}", lease_token=ctx.lease_token)
             else:
-                self.mark_as_failed(video_code, f"Final failure: {e}")
+                self.metrics.jobs.inc(outcome='failed', category=err_type)
+                self.mark_as_failed(video_code, f"Final failure: {error}", lease_token=ctx.lease_token)
+        except LeaseLostError as e:
+            logger.warning(f"Job {video_code}: failure not recorded, lease lost ({e})")
+
+    def _cleanup_job(self, ctx: 'JobContext') -> None:
+        self.leases.release(ctx.video_code)
+        self.media_probe.forget(ctx.input_file, ctx.output_file, ctx.head_file)
+        if ctx.journal:
+            ctx.journal.discard()
+        if not ctx.completed:
+            self._stash_source(ctx)
+        partial_state = ctx.input_file.with_name(ctx.input_file.name + '.parts')
+        self.cleanup_files(*([ctx.input_file, partial_state, ctx.output_file, ctx.head_file, ctx.complexity_sample]
+                             + ctx.thumbnail_files
+                             + list(self.temp_dir.glob(f"{ctx.hls_base_name}*"))))
+
+    def process_job(self, job: Dict[str, Any]) -> bool:
+        """Download -> thumbnails -> analyze -> encode -> metadata -> upload -> mark status -> activate."""
+        return self._run_job(self._new_job_context(job), claim=True)
+
+    def _run_job(self, ctx: 'JobContext', claim: bool) -> bool:
+        logger.info(f"Processing job {ctx.video_code} (attempt {ctx.retry_count + 1})")
+
+        self._running_jobs += 1
+        try:
+            if claim:
+                self._claim_job(ctx)
+            for name in JOB_STAGES:
+                self._run_stage(name, ctx)
+            return True
+        except Exception as e:
+            self._handle_job_failure(ctx, e)
             return False
         finally:
-            self.cleanup_files(*([input_file, output_file] + thumbnail_files))
+            self._cleanup_job(ctx)
+            self._running_jobs -= 1
 
     # -------------------- Runner & health --------------------
     def run_continuously(self, poll_interval: Optional[int] = None):
         poll_interval = poll_interval or self.poll_interval
+        self.start_metrics_server()
+        self.sweep_journals()
         logger.info("Encoder started.")
+        # Claimed jobs wait here; the next one's source downloads while the current one encodes
+        prefetch = self._new_prefetch_buffer()
         consecutive_errors = 0
         while True:
             try:
-                job = self.get_next_pending_job()
-                if job:
-                    ok = self.process_job(job)
+                if prefetch.free_slots():
+                    # Long-poll only when there is nothing local to run
+                    wait = 0 if len(prefetch) else self.long_poll_seconds
+                    for ctx in self._claim_batch(prefetch.free_slots(), wait):
+                        prefetch.put(ctx)
+
+                entry = prefetch.get()
+                if entry:
+                    ctx = entry.item
+                    ctx.prefetched = entry.ready
+                    ctx.prefetch_error = entry.error
+                    ok = self._run_job(ctx, claim=False)
                     consecutive_errors = 0 if ok else (consecutive_errors + 1)
                 else:
-                    logger.info("No pending jobs. Sleeping...")
                     consecutive_errors = 0
-                    time.sleep(poll_interval)
+                    self._idle_sleep(poll_interval)
 
                 if consecutive_errors >= self.max_consecutive_errors:
                     backoff = min(300, poll_interval * (2 ** min(consecutive_errors, 5)))
@@ -711,6 +2345,8 @@ class VideoEncoder:
                     time.sleep(backoff)
                     consecutive_errors = 0
             except KeyboardInterrupt:
+                for ctx in prefetch.drain():
+                    self._release_unstarted(ctx)
                 logger.info("Encoder stopped by user.")
                 break
             except Exception as e:
@@ -718,6 +2354,102 @@ class VideoEncoder:
                 consecutive_errors += 1
                 time.sleep(min(60, poll_interval * consecutive_errors))
 
+    def build_pipeline(self) -> Pipeline:
+        """
+        Wire the job stages into a Pipeline:
+          * download/upload/metadata/complete are I/O bound -> thread pools
+          * thumbnails/analyze/encode run ffmpeg -> capped by the CPU budget
+        """
+        cpu_budget = CpuBudget(self.pipeline_cpu_budget)
+        encode_cost = self.ffmpeg_threads or min(cpu_budget.slots, 8)
+        if not self.ffmpeg_threads:
+            # Keep each ffmpeg inside the slots it reserved
+            self.ffmpeg_threads = encode_cost
+        encode_workers = max(1, cpu_budget.slots // encode_cost)
+        qsize = self.pipeline_queue_size
+
+        def run(name: str):
+            return lambda ctx: self._run_stage(name, ctx)
+
+        stages = [
+            Stage('download', run('download'), workers=self.pipeline_download_workers, queue_size=qsize),
+            Stage('thumbnails', run('thumbnails'), workers=encode_workers, queue_size=qsize, cpu_cost=1),
+            Stage('analyze', run('analyze'), workers=encode_workers, queue_size=qsize, cpu_cost=encode_cost),
+            Stage('encode', run('encode'), workers=encode_workers, queue_size=qsize, cpu_cost=encode_cost),
+            Stage('metadata', run('metadata'), workers=1, queue_size=qsize),
+            Stage('upload', run('upload'), workers=self.pipeline_upload_workers, queue_size=qsize),
+            Stage('complete', run('complete'), workers=1, queue_size=qsize),
+        ]
+        return Pipeline(
+            stages,
+            on_success=self._on_pipeline_success,
+            on_failure=self._on_pipeline_failure,
+            on_finish=self._cleanup_job,
+            cpu_budget=cpu_budget,
+        )
+
+    def _on_pipeline_success(self, ctx: 'JobContext') -> None:
+        with self._pipeline_lock:
+            self._pipeline_errors = 0
+
+    def _on_pipeline_failure(self, ctx: 'JobContext', error: Exception, stage: str) -> None:
+        with self._pipeline_lock:
+            self._pipeline_errors += 1
+        self._handle_job_failure(ctx, error)
+
+    def run_pipeline(self, poll_interval: Optional[int] = None):
+        """Pipelined worker loop: several jobs in flight, one per stage slot."""
+        poll_interval = poll_interval or self.poll_interval
+        self.pipeline = self.build_pipeline()
+        self.pipeline.start()
+        self.start_metrics_server()
+        self.sweep_journals()
+        logger.info("Encoder started (pipeline mode).")
+        last_status = 0.0
+        try:
+            while True:
+                try:
+                    now = time.monotonic()
+                    if now - last_status >= self.pipeline_status_interval:
+                        logger.info(f"Pipeline: {self.pipeline.format_depths()}")
+                        last_status = now
+
+                    with self._pipeline_lock:
+                        errors = self._pipeline_errors
+                    if errors >= self.max_consecutive_errors:
+                        backoff = min(300, poll_interval * (2 ** min(errors, 5)))
+                        logger.warning(f"Too many consecutive errors ({errors}). Pausing intake {backoff}s.")
+                        time.sleep(backoff)
+                        with self._pipeline_lock:
+                            self._pipeline_errors = 0
+                        continue
+
+                    # Only claim work when the first stage can take it
+                    if not self.pipeline.has_capacity():
+                        time.sleep(1)
+                        continue
+
+                    contexts = self._claim_batch(self.pipeline.free_slots(), self.long_poll_seconds)
+                    if not contexts:
+                        self._idle_sleep(poll_interval)
+                        continue
+
+                    for ctx in contexts:
+                        logger.info(f"Queued job {ctx.video_code} (attempt {ctx.retry_count + 1})")
+                        self.pipeline.submit(ctx)
+                except KeyboardInterrupt:
+                    raise
+                except Exception as e:
+                    logger.error(f"Pipeline intake error: {e}")
+                    time.sleep(min(60, poll_interval))
+        except KeyboardInterrupt:
+            logger.info(f"Stopping intake; draining {self.pipeline.in_flight()} in-flight job(s). Ctrl+C again to abort.")
+            try:
+                self.pipeline.stop(wait=True)
+            except KeyboardInterrupt:
+                logger.warning("Aborted with jobs in flight.")
+            logger.info("Encoder stopped by user.")
+
     def health_check(self) -> Dict[str, Any]:
         status = {'status': 'healthy', 'issues': [], 'checks': {}}
         try:
@@ -742,8 +2474,40 @@ class VideoEncoder:
             status['checks']['api_connectivity'] = 'error'
             status['issues'].append(f"API unreachable: {e}")
             status['status'] = 'unhealthy'
+        with self._progress_lock:
+            if self.job_progress:
+                status['encodes'] = dict(self.job_progress)
+        if self.preset_policy:
+            status['preset_policy'] = self.preset_policy.snapshot()
+        if self.pipeline:
+            status['pipeline'] = {
+                'in_flight': self.pipeline.in_flight(),
+                'stages': self.pipeline.queue_depths(),
+            }
+        elif self.metrics_port:
+            # --health-check runs in its own process; ask the running worker's /metrics
+            try:
+                status['worker'] = self._scrape_worker_status()
+                status['checks']['worker_metrics'] = 'ok'
+            except Exception as e:
+                status['checks']['worker_metrics'] = 'unreachable'
+                status['issues'].append(f"Worker metrics unreachable: {e}")
         return status
 
+    def _scrape_worker_status(self) -> Dict[str, Any]:
+        """Jobs in flight and per-stage queued/active counts from the worker's metrics endpoint."""
+        host = '127.0.0.1' if self.metrics_host in ('', '0.0.0.0', '::') else self.metrics_host
+        r = requests.get(f"http://{host}:{self.metrics_port}/metrics", timeout=5)
+        r.raise_for_status()
+        samples = parse_samples(r.text)
+        stages: Dict[str, Dict[str, int]] = {}
+        for (name, labels), value in samples.items():
+            field = {'encoder_pipeline_queued_jobs': 'queued', 'encoder_stage_active_jobs': 'active'}.get(name)
+            if field:
+                stages.setdefault(dict(labels)['stage'], {})[field] = int(value)
+        in_flight = samples.get(('encoder_jobs_in_flight', ()))
+        return {'jobs_in_flight': int(in_flight) if in_flight is not None else None, 'stages': stages}
+
 # ======================= CLI entrypoint =======================
 def main():
     import argparse
@@ -757,6 +2521,9 @@ def main():
     parser.add_argument('--poll-interval', type=int, help='Override POLL_INTERVAL')
     parser.add_argument('--max-retries', type=int, help='Override MAX_RETRIES')
     parser.add_argument('--log-level', choices=['DEBUG','INFO','WARNING','ERROR'], help='Override LOG_LEVEL')
+    parser.add_argument('--pipeline', action='store_true', help='Run stages as a pipeline with several jobs in flight')
+    parser.add_argument('--bench-thumbnails', metavar='FILE', help='Time per-frame vs single-pass thumbnail extraction on FILE and exit')
+    parser.add_argument('--bench-encode', metavar='FILE', help='Time single-process vs segment-parallel encoding of FILE and exit')
     args = parser.parse_args()
 
     # Reload config from given env file
@@ -793,13 +2560,24 @@ def main():
                 print("❌ Configuration validation failed")
                 raise SystemExit(1)
 
+        if args.bench_thumbnails:
+            print(json.dumps(encoder.compare_thumbnail_modes(Path(args.bench_thumbnails)), indent=2))
+            return
+
+        if args.bench_encode:
+            print(json.dumps(encoder.compare_encode_modes(Path(args.bench_encode)), indent=2, default=str))
+            return
+
         if args.health_check:
             health = encoder.health_check()
             print(json.dumps(health, indent=2))
             raise SystemExit(0 if health['status'] == 'healthy' else 1)
 
         # Run worker loop
-        encoder.run_continuously()
+        if args.pipeline or config.get_bool('PIPELINE_MODE', False):
+            encoder.run_pipeline()
+        else:
+            encoder.run_continuously()
 
     except KeyboardInterrupt:
         logger.info("Encoder stopped gracefully")
@@ -10,7 +10,10 @@
 
 Route::prefix('encoding-queue')->group(function () {
     Route::get('next-pending', [EncodingQueueController::class, 'getNextPending']);
+    Route::post('claim', [EncodingQueueController::class, 'claim']);
     Route::post('{videoCode}/processing', [EncodingQueueController::class, 'markAsProcessing']);
+    Route::post('{videoCode}/heartbeat', [EncodingQueueController::class, 'heartbeat']);
+    Route::post('{videoCode}/progress', [EncodingQueueController::class, 'progress']);
     Route::post('{videoCode}/completed', [EncodingQueueController::class, 'markAsCompleted']);
     Route::post('{videoCode}/failed', [EncodingQueueController::class, 'markAsFailed']);
     Route::post('{videoCode}/retry', [EncodingQueueController::class, 'retryJob']);
@@ -0,0 +1,102 @@
+<?php
+
+use App\Models\EncodingQueue;
+use Carbon\Carbon;
+use Illuminate\Foundation\Testing\RefreshDatabase;
+use Illuminate\Support\Facades\Storage;
+
+uses(RefreshDatabase::class);
+
+beforeEach(function () {
+    Storage::fake('s3');
+});
+
+function queuedJob(string $videoCode, array $attributes = []): EncodingQueue
+{
+    return EncodingQueue::create($attributes + [
+        'video_code' => $videoCode,
+        'input_file_path' => "uploads/{$videoCode}.mp4",
+        'encoding_options' => [],
+    ]);
+}
+
+it('claims a batch of jobs each with its own lease', function () {
+    queuedJob('a1');
+    Carbon::setTestNow(Carbon::now()->addSecond());
+    queuedJob('b2');
+    Carbon::setTestNow(Carbon::now()->addSecond());
+    queuedJob('c3');
+    Carbon::setTestNow();
+
+    $response = $this->postJson('/api/encoding-queue/claim', ['limit' => 2, 'lease_seconds' => 120])->assertOk();
+
+    $jobs = $response->json('jobs');
+    expect(array_column($jobs, 'video_code'))->toBe(['a1', 'b2'])
+        ->and(array_column($jobs, 'lease_seconds'))->toBe([120, 120]);
+    expect($jobs[0]['lease_token'])->toHaveLength(40)
+        ->and($jobs[0]['lease_token'])->not->toBe($jobs[1]['lease_token']);
+
+    $claimed = EncodingQueue::where('video_code', 'a1')->first();
+    expect($claimed->status)->toBe(EncodingQueue::STATUS_PROCESSING)
+        ->and($claimed->holdsLease($jobs[0]['lease_token']))->toBeTrue();
+});
+
+it('hands out retryable jobs before pending ones', function () {
+    queuedJob('new1');
+    queuedJob('retry1', ['status' => EncodingQueue::STATUS_FAILED, 'retry_count' => 1, 'max_retries' => 3,
+        'last_retry_at' => Carbon::now()]);
+    queuedJob('dead1', ['status' => EncodingQueue::STATUS_FAILED, 'retry_count' => 3, 'max_retries' => 3]);
+
+    $this->postJson('/api/encoding-queue/claim', ['limit' => 5])
+        ->assertOk()
+        ->assertJsonPath('jobs.0.video_code', 'retry1')
+        ->assertJsonPath('jobs.1.video_code', 'new1')
+        ->assertJsonCount(2, 'jobs');
+});
+
+it('never claims the same job twice', function () {
+    queuedJob('a1');
+
+    $this->postJson('/api/encoding-queue/claim')->assertOk()->assertJsonCount(1, 'jobs');
+    $this->postJson('/api/encoding-queue/claim')->assertOk()->assertJsonCount(0, 'jobs');
+});
+
+it('validates the claim size', function () {
+    $this->postJson('/api/encoding-queue/claim', ['limit' => 0])->assertUnprocessable();
+    $this->postJson('/api/encoding-queue/claim', ['limit' => EncodingQueue::MAX_CLAIM_BATCH + 1])->assertUnprocessable();
+    $this->postJson('/api/encoding-queue/claim', ['lease_seconds' => 5])->assertUnprocessable();
+});
+
+it('ignores wait and does not advertise long-poll unless enabled', function () {
+    config(['services.encoding_queue.long_poll' => false]);
+
+    $started = microtime(true);
+    $response = $this->postJson('/api/encoding-queue/claim?wait=5')->assertOk()->assertJsonCount(0, 'jobs');
+
+    expect($response->json())->not->toHaveKey('wait')
+        ->and(microtime(true) - $started)->toBeLessThan(2);
+});
+
+it('long-polls an empty queue when enabled and echoes the capped wait', function () {
+    config(['services.encoding_queue.long_poll' => true, 'services.encoding_queue.max_wait' => 1]);
+
+    $started = microtime(true);
+    $this->postJson('/api/encoding-queue/claim?wait=60')
+        ->assertOk()
+        ->assertJsonCount(0, 'jobs')
+        ->assertJsonPath('wait', 1);
+    expect(microtime(true) - $started)->toBeGreaterThanOrEqual(1);
+
+    // A queued job is handed out at once, whatever the wait
+    queuedJob('a1');
+    $this->postJson('/api/encoding-queue/claim?wait=60')
+        ->assertOk()
+        ->assertJsonPath('jobs.0.video_code', 'a1');
+});
+
+it('never waits past the hard cap even if configured higher', function () {
+    config(['services.encoding_queue.long_poll' => true, 'services.encoding_queue.max_wait' => 600]);
+    queuedJob('a1');
+
+    $this->postJson('/api/encoding-queue/claim?wait=600')->assertOk()->assertJsonPath('wait', 15);
+});
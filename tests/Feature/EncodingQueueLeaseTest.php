@@ -0,0 +1,108 @@
+<?php
+
+use App\Models\EncodingQueue;
+use Carbon\Carbon;
+use Illuminate\Foundation\Testing\RefreshDatabase;
+use Illuminate\Support\Facades\Storage;
+
+uses(RefreshDatabase::class);
+
+beforeEach(function () {
+    Storage::fake('s3');
+});
+
+function leasedJob(string $videoCode = 'abc123', int $leaseSeconds = 300): array
+{
+    $job = EncodingQueue::create([
+        'video_code' => $videoCode,
+        'input_file_path' => "uploads/{$videoCode}.mp4",
+        'encoding_options' => [],
+    ]);
+
+    return [$job, $job->claim($leaseSeconds)];
+}
+
+it('claims a job for one worker at a time', function () {
+    $this->postJson('/api/encoding-queue/abc/processing')->assertNotFound();
+    EncodingQueue::create(['video_code' => 'abc', 'input_file_path' => 'uploads/abc.mp4']);
+
+    $first = $this->postJson('/api/encoding-queue/abc/processing', ['lease_seconds' => 120])
+        ->assertOk()
+        ->assertJsonPath('lease_seconds', 120);
+    expect($first->json('lease_token'))->toHaveLength(40);
+
+    $this->postJson('/api/encoding-queue/abc/processing', ['lease_seconds' => 120])->assertStatus(409);
+
+    // Once the lease expires another worker may take the job over
+    Carbon::setTestNow(Carbon::now()->addSeconds(121));
+    $this->postJson('/api/encoding-queue/abc/processing', ['lease_seconds' => 120])->assertOk();
+    Carbon::setTestNow();
+});
+
+it('renews the lease only for its holder', function () {
+    [$job, $token] = leasedJob();
+    $expires = $job->lease_expires_at;
+
+    Carbon::setTestNow(Carbon::now()->addSeconds(60));
+    $this->postJson('/api/encoding-queue/abc123/heartbeat', ['lease_token' => $token, 'lease_seconds' => 300])
+        ->assertOk()
+        ->assertJsonPath('message', 'Lease renewed');
+    expect($job->fresh()->lease_expires_at->gt($expires))->toBeTrue();
+    Carbon::setTestNow();
+
+    $this->postJson('/api/encoding-queue/abc123/heartbeat', ['lease_token' => 'not-the-token'])
+        ->assertStatus(409);
+    $this->postJson('/api/encoding-queue/missing/heartbeat', ['lease_token' => $token])
+        ->assertNotFound();
+    $this->postJson('/api/encoding-queue/abc123/heartbeat', [])->assertUnprocessable();
+});
+
+it('refuses a heartbeat once the job has finished', function () {
+    [$job, $token] = leasedJob();
+    $job->markAsFailed('boom');
+
+    $this->postJson('/api/encoding-queue/abc123/heartbeat', ['lease_token' => $token])->assertStatus(409);
+});
+
+it('completes a job only for the lease holder', function () {
+    [$job, $token] = leasedJob();
+    $payload = ['output_file_path' => 'videos/a/abc123.mp4', 'thumbnail_paths' => ['thumbnails/a/abc123_thumb_1.jpg']];
+
+    $this->postJson('/api/encoding-queue/abc123/completed', $payload + ['lease_token' => 'stale'])
+        ->assertStatus(409);
+    expect($job->fresh()->status)->toBe(EncodingQueue::STATUS_PROCESSING);
+
+    $this->postJson('/api/encoding-queue/abc123/completed', $payload + ['lease_token' => $token])->assertOk();
+    $job->refresh();
+    expect($job->status)->toBe(EncodingQueue::STATUS_COMPLETED)
+        ->and($job->output_file_path)->toBe('videos/a/abc123.mp4')
+        ->and($job->lease_token)->toBeNull();
+});
+
+it('fails a job only for the lease holder', function () {
+    [$job, $token] = leasedJob();
+
+    $this->postJson('/api/encoding-queue/abc123/failed', ['error_message' => 'x', 'lease_token' => 'stale'])
+        ->assertStatus(409);
+    $this->postJson('/api/encoding-queue/abc123/failed', ['error_message' => 'ffmpeg died', 'lease_token' => $token])
+        ->assertOk();
+    expect($job->fresh()->status)->toBe(EncodingQueue::STATUS_FAILED)
+        ->and($job->fresh()->error_message)->toBe('ffmpeg died');
+});
+
+it('lets workers without leases finish jobs claimed without one', function () {
+    $job = EncodingQueue::create(['video_code' => 'old1', 'input_file_path' => 'uploads/old1.mp4']);
+    $job->markAsProcessing();
+
+    $this->postJson('/api/encoding-queue/old1/completed', ['output_file_path' => 'videos/o/old1.mp4'])->assertOk();
+    expect($job->fresh()->status)->toBe(EncodingQueue::STATUS_COMPLETED);
+});
+
+it('treats an expired lease as stuck', function () {
+    leasedJob('abc', 60);
+    expect(EncodingQueue::stuck()->count())->toBe(0);
+
+    Carbon::setTestNow(Carbon::now()->addSeconds(61));
+    expect(EncodingQueue::stuck()->pluck('video_code')->all())->toBe(['abc']);
+    Carbon::setTestNow();
+});
@@ -0,0 +1,49 @@
+<?php
+
+use App\Models\EncodingQueue;
+use Illuminate\Foundation\Testing\RefreshDatabase;
+use Illuminate\Support\Facades\Storage;
+
+uses(RefreshDatabase::class);
+
+beforeEach(function () {
+    Storage::fake('s3');
+});
+
+it('stores the HLS manifest reported on completion and returns it in status', function () {
+    $job = EncodingQueue::create(['video_code' => 'abc123', 'input_file_path' => 'uploads/abc123.mp4']);
+    $token = $job->claim(300);
+
+    $this->postJson('/api/encoding-queue/abc123/completed', [
+        'output_file_path' => 'videos/a/abc123.mp4',
+        'manifest_path' => 'videos/a/abc123_hls.m3u8',
+        'lease_token' => $token,
+    ])->assertOk();
+
+    expect($job->fresh()->manifest_path)->toBe('videos/a/abc123_hls.m3u8');
+    $this->getJson('/api/encoding-queue/abc123/status')
+        ->assertOk()
+        ->assertJsonPath('manifest_path', 'videos/a/abc123_hls.m3u8');
+});
+
+it('completes without a manifest when no ladder was encoded', function () {
+    $job = EncodingQueue::create(['video_code' => 'abc123', 'input_file_path' => 'uploads/abc123.mp4']);
+    $token = $job->claim(300);
+
+    $this->postJson('/api/encoding-queue/abc123/completed', [
+        'output_file_path' => 'videos/a/abc123.mp4',
+        'lease_token' => $token,
+    ])->assertOk();
+
+    expect($job->fresh()->manifest_path)->toBeNull();
+});
+
+it('rejects a manifest path that is not a string', function () {
+    $job = EncodingQueue::create(['video_code' => 'abc123', 'input_file_path' => 'uploads/abc123.mp4']);
+
+    $this->postJson('/api/encoding-queue/abc123/completed', [
+        'output_file_path' => 'videos/a/abc123.mp4',
+        'manifest_path' => ['videos/a/abc123_hls.m3u8'],
+        'lease_token' => $job->claim(300),
+    ])->assertUnprocessable();
+});
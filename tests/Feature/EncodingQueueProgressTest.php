@@ -0,0 +1,59 @@
+<?php
+
+use App\Models\EncodingQueue;
+use Illuminate\Foundation\Testing\RefreshDatabase;
+use Illuminate\Support\Facades\Storage;
+
+uses(RefreshDatabase::class);
+
+beforeEach(function () {
+    Storage::fake('s3');
+});
+
+function encodingJob(string $videoCode = 'abc123'): array
+{
+    $job = EncodingQueue::create([
+        'video_code' => $videoCode,
+        'input_file_path' => "uploads/{$videoCode}.mp4",
+        'encoding_options' => [],
+    ]);
+
+    return [$job, $job->claim(300)];
+}
+
+it('records progress from the lease holder and shows it in status and stats', function () {
+    [, $token] = encodingJob();
+    $snapshot = ['percent' => 42.5, 'fps' => 60, 'speed' => 2.1, 'eta_seconds' => 30];
+
+    $this->postJson('/api/encoding-queue/abc123/progress', ['progress' => $snapshot, 'lease_token' => $token])
+        ->assertOk()
+        ->assertJsonPath('message', 'Progress recorded');
+
+    $this->getJson('/api/encoding-queue/abc123/status')->assertOk()->assertJsonPath('progress.percent', 42.5);
+    $this->getJson('/api/encoding-queue/stats')
+        ->assertOk()
+        ->assertJsonPath('active_jobs.0.video_code', 'abc123')
+        ->assertJsonPath('active_jobs.0.progress.eta_seconds', 30);
+});
+
+it('rejects progress without the lease', function () {
+    [$job] = encodingJob();
+
+    $this->postJson('/api/encoding-queue/abc123/progress', ['progress' => ['percent' => 1], 'lease_token' => 'stale'])
+        ->assertStatus(409);
+    $this->postJson('/api/encoding-queue/missing/progress', ['progress' => ['percent' => 1]])->assertNotFound();
+    $this->postJson('/api/encoding-queue/abc123/progress', [])->assertUnprocessable();
+
+    $job->markAsFailed('boom');
+    $this->postJson('/api/encoding-queue/abc123/progress', ['progress' => ['percent' => 1]])->assertStatus(409);
+});
+
+it('stops reporting progress once the job finishes', function () {
+    [$job, $token] = encodingJob();
+    $this->postJson('/api/encoding-queue/abc123/progress', ['progress' => ['percent' => 99], 'lease_token' => $token])
+        ->assertOk();
+
+    $job->markAsCompleted('videos/a/abc123.mp4', []);
+
+    $this->getJson('/api/encoding-queue/abc123/status')->assertOk()->assertJsonPath('progress', null);
+});